@@ -0,0 +1,7 @@
+import os
+import sys
+
+# load path to get python files
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "cloud_function")
+)
@@ -0,0 +1,94 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from benchmarks import portfolio
+import cache
+import model
+
+
+def drop_last_periods(cashflows: model.CashflowFrame) -> model.CashflowFrame:
+    """
+    Remove the latest cashflow of every entity, giving the portfolio as it was one period earlier.
+
+    Args:
+        cashflows (model.CashflowFrame): The cashflows.
+    Returns:
+        model.CashflowFrame: The cashflows without the latest period of each entity.
+    """
+    cashflows = model.sort_cashflows(cashflows)[0]
+    last = np.append(cashflows.entity_code[1:] != cashflows.entity_code[:-1], True)
+    return cashflows.take(np.flatnonzero(~last))
+
+
+def timed_run(cashflows: model.CashflowFrame, irr_cache: cache.IrrCache = None):
+    """
+    Calculate the IRRs of a portfolio with the scalar engine, optionally through a cache.
+
+    Args:
+        cashflows (model.CashflowFrame): The cashflows.
+        irr_cache (cache.IrrCache, optional): The cache to consult.
+    Returns:
+        tuple[float, dict[str, model.Entity]]: The seconds spent and the entities with their IRRs.
+    """
+    entities = model.create_entities(model.sort_cashflows(cashflows)[0])
+    start = time.perf_counter()
+    model.calculate_irrs(entities, cache=irr_cache)
+    return time.perf_counter() - start, entities
+
+
+def main():
+    """
+    Compare the calculation time of the scalar engine without cache with the one of successive runs through a
+    persistent IRR cache: a cold run on the portfolio as it was one period earlier, a daily run once every entity
+    received a new period, and a second run over the same data. Each run reopens the cache file, as a new process
+    would.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--entities", type=int, default=10_000)
+    parser.add_argument("--min-periods", type=int, default=2)
+    parser.add_argument("--max-periods", type=int, default=60)
+    parser.add_argument(
+        "--sign-pattern", choices=portfolio.SIGN_PATTERNS, default="calls"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    today = portfolio.generate_portfolio(
+        args.entities,
+        min_periods=args.min_periods,
+        max_periods=args.max_periods,
+        sign_pattern=args.sign_pattern,
+        seed=args.seed,
+    )
+    yesterday = drop_last_periods(today)
+    seconds, expected = timed_run(today)
+    print(f"{'run':>14} {'time':>10} {'hits':>10} {'misses':>10}")
+    print(f"{'no cache':>14} {seconds:>9.3f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "irrs.sqlite")
+        for run, cashflows in (
+            ("cold", yesterday),
+            ("daily", today),
+            ("second", today),
+        ):
+            with cache.IrrCache(path) as irr_cache:
+                seconds, entities = timed_run(cashflows, irr_cache)
+            print(
+                f"{run:>14} {seconds:>9.3f}s {irr_cache.hits:>10} {irr_cache.misses:>10}"
+            )
+
+    assert all(
+        np.allclose(
+            [irr.value for irr in entities[name].irrs],
+            [irr.value for irr in expected[name].irrs],
+            equal_nan=True,
+        )
+        for name in expected
+    ), "The cached IRRs differ from the solved ones"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import datetime as dt
+import time
+import numpy as np
+import benchmarks  # noqa: F401
+import model
+
+
+def generate_cashflows(
+    entities: int, periods: int, seed: int = 0
+) -> list[model.Cashflow]:
+    """
+    Generate shuffled monthly cashflows for a number of entities.
+
+    Args:
+        entities (int): The number of entities.
+        periods (int): The number of cashflows of each entity.
+        seed (int, optional): The seed of the random generator.
+    Returns:
+        list[model.Cashflow]: The cashflows, in random order.
+    """
+    rng = np.random.default_rng(seed)
+    start = dt.date(2000, 1, 1)
+    cashflows = [
+        model.Cashflow(
+            start + dt.timedelta(days=31 * period),
+            float(rng.uniform(0, 100)),
+            float(rng.uniform(0, 100)),
+            float(rng.uniform(900, 1100)),
+            f"entity {entity}",
+        )
+        for entity in range(entities)
+        for period in range(periods)
+    ]
+    return [cashflows[index] for index in rng.permutation(len(cashflows))]
+
+
+def allocation_path(cashflows: list[model.Cashflow]) -> dict:
+    entities = {}
+    for cashflow in cashflows:
+        entity = entities.setdefault(
+            cashflow.entity_name, model.Entity(cashflow.entity_name)
+        )
+        entity.add_cashflow(cashflow)
+    return entities
+
+
+def ingestion_path(cashflows: list[model.Cashflow]) -> dict:
+    entities, _ = model.ingest_cashflows(model.CashflowFrame.from_cashflows(cashflows))
+    return entities
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    """
+    Compare how entity creation and allocation scale when cashflows are added one by one to their entity
+    (Entity.add_cashflow) and for the single pass ingestion (ingest_cashflows), starting from Cashflow objects and
+    from an already columnar CashflowFrame.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--entities", type=int, default=100)
+    parser.add_argument("--periods", type=int, nargs="+", default=[12, 60, 180, 360])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'periods':>8} {'allocate':>10} {'ingest':>10} {'frame':>10}")
+    for periods in args.periods:
+        cashflows = generate_cashflows(args.entities, periods)
+        frame = model.CashflowFrame.from_cashflows(cashflows)
+        print(
+            f"{len(cashflows):>10} {periods:>8} "
+            f"{timed(allocation_path, cashflows):>9.3f}s "
+            f"{timed(ingestion_path, cashflows):>9.3f}s "
+            f"{timed(model.ingest_cashflows, frame):>9.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
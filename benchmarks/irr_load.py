@@ -0,0 +1,86 @@
+import argparse
+import datetime as dt
+import io
+import json
+import time
+import numpy as np
+import pyarrow.parquet
+import benchmarks  # noqa: F401
+import model
+
+
+def generate_entities(entities: int, periods: int, seed: int = 0) -> dict:
+    """
+    Generate entities holding calculated monthly IRRs.
+
+    Args:
+        entities (int): The number of entities.
+        periods (int): The number of IRRs of each entity.
+        seed (int, optional): The seed of the random generator.
+    Returns:
+        dict[str, model.Entity]: The entities, keyed by entity name.
+    """
+    rng = np.random.default_rng(seed)
+    start = dt.date(2000, 1, 1)
+    collection = {}
+    for number in range(entities):
+        entity = model.Entity(f"entity {number}")
+        entity.irrs = [
+            model.Irr(
+                start + dt.timedelta(days=31 * period),
+                round(float(rate), 4),
+                entity.entity_name,
+            )
+            for period, rate in enumerate(rng.normal(0.005, 0.01, size=periods))
+        ]
+        collection[entity.entity_name] = entity
+
+    return collection
+
+
+def json_path(entities: dict) -> bytes:
+    # the serialisation done by bigquery.Client.load_table_from_json
+    irrs = [irr.to_dict() for entity in entities.values() for irr in entity.irrs]
+    return "\n".join(json.dumps(irr) for irr in irrs).encode()
+
+
+def parquet_path(entities: dict) -> bytes:
+    buffer = io.BytesIO()
+    pyarrow.parquet.write_table(
+        model.IrrFrame.from_entities(entities).to_arrow(), buffer
+    )
+    return buffer.getvalue()
+
+
+def timed(function, *args) -> tuple[float, int]:
+    start = time.perf_counter()
+    size = len(function(*args))
+    return time.perf_counter() - start, size
+
+
+def main():
+    """
+    Compare the serialisation time and the bytes uploaded when loading IRR data as newline delimited JSON, built
+    from Irr.to_dict(), and as Parquet, built from the columnar IrrFrame.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--entities", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--periods", type=int, default=120)
+    args = parser.parse_args()
+
+    print(
+        f"{'rows':>10} {'json time':>10} {'json bytes':>12} "
+        f"{'parquet time':>13} {'parquet bytes':>14}"
+    )
+    for entities in args.entities:
+        collection = generate_entities(entities, args.periods)
+        json_time, json_size = timed(json_path, collection)
+        parquet_time, parquet_size = timed(parquet_path, collection)
+        print(
+            f"{entities * args.periods:>10} {json_time:>9.3f}s {json_size:>12} "
+            f"{parquet_time:>12.3f}s {parquet_size:>14}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import time
+import numpy as np
+from benchmarks import portfolio
+import lookup
+import model
+
+
+def generate_irrs(entities: int, max_periods: int, seed: int = 0) -> model.IrrFrame:
+    """
+    Generate IRR data with the dates of a synthetic portfolio, one row per cashflow, and random rates, as read
+    back from the destination in no particular order.
+
+    Args:
+        entities (int): The number of entities.
+        max_periods (int): The largest number of periods of an entity.
+        seed (int, optional): The seed of the random generator.
+    Returns:
+        model.IrrFrame: The IRR data.
+    """
+    cashflows = portfolio.generate_portfolio(
+        entities, max_periods=max_periods, seed=seed
+    )
+    rng = np.random.default_rng(seed)
+    return model.IrrFrame(
+        cashflows.date,
+        np.round(rng.normal(0.01, 0.02, len(cashflows)), model.IRR_DIGITS),
+        cashflows.entity_code,
+        cashflows.entity_names,
+    )
+
+
+def main():
+    """
+    Measure the time spent building the point-in-time IRR index, and the lookups per second answered one at a time
+    and in bulk, on IRR data with the dates of a generated portfolio.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--entities", type=int, default=100_000)
+    parser.add_argument("--max-periods", type=int, default=120)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    irrs = generate_irrs(args.entities, args.max_periods)
+    start = time.perf_counter()
+    index = lookup.IrrIndex(irrs)
+    build = time.perf_counter() - start
+    print(f"index of {len(index)} IRRs built in {build:.3f}s")
+
+    rng = np.random.default_rng(1)
+    entity_names = [
+        index.entity_names[code]
+        for code in rng.integers(0, len(index.entity_names), args.lookups).tolist()
+    ]
+    first, last = irrs.date.min(), irrs.date.max()
+    dates = first + rng.integers(
+        0, int((last - first).astype(np.int64)) + 1, args.lookups
+    )
+
+    start = time.perf_counter()
+    for entity_name, date in zip(entity_names, dates):
+        index.lookup(entity_name, date)
+    single = time.perf_counter() - start
+    start = time.perf_counter()
+    index.lookup_many(entity_names, dates)
+    bulk = time.perf_counter() - start
+    start = time.perf_counter()
+    index.positions(entity_names, dates)
+    positions = time.perf_counter() - start
+
+    for name, seconds in (("single", single), ("bulk", bulk), ("positions", positions)):
+        print(
+            f"{name:>10}: {args.lookups} lookups in {seconds:.3f}s, "
+            f"{args.lookups / seconds:,.0f} lookups/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
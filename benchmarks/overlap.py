@@ -0,0 +1,140 @@
+import argparse
+import time
+from benchmarks import portfolio
+import cli
+import model
+import services
+from repository import InMemoryRepository
+
+
+class LatencyRepository(InMemoryRepository):
+    """
+    An in-memory repository adding a fixed latency to each page of cashflows read and to each batch of IRRs
+    staged, as BigQuery does on the network.
+
+    Args:
+        cashflows (list[model.Cashflow]): The cashflows held by the repository.
+        page_size (int): The number of cashflows of a page.
+        read_latency (float): The seconds spent reading each page.
+        load_latency (float): The seconds spent by each load job.
+    """
+
+    def __init__(
+        self,
+        cashflows: list[model.Cashflow],
+        page_size: int,
+        read_latency: float,
+        load_latency: float,
+    ):
+        super().__init__(cashflows)
+        self.page_size = page_size
+        self.read_latency = read_latency
+        self.load_latency = load_latency
+
+    def iter_cashflows(self):
+        for position, cashflow in enumerate(super().iter_cashflows()):
+            if position % self.page_size == 0:
+                time.sleep(self.read_latency)
+            yield cashflow
+
+    def load_shard_irrs(self, run_id: str, shard: int, entities: dict):
+        time.sleep(self.load_latency)
+        super().load_shard_irrs(run_id, shard, entities)
+
+
+def sequential_run(
+    repository: LatencyRepository, engine, batch_periods: int
+) -> dict[str:float]:
+    """
+    Read every cashflow, then calculate every batch of entities, then load every batch, timing each step.
+
+    Args:
+        repository (LatencyRepository): The repository.
+        engine (callable): The calculation strategy.
+        batch_periods (int): The number of cashflows of each batch.
+    Returns:
+        dict[str, float]: The seconds spent reading, calculating and loading.
+    """
+    timings = {}
+    start = time.perf_counter()
+    cashflows = list(repository.iter_cashflows())
+    timings["read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batches, entities, periods = [], {}, 0
+    for entity in model.iter_entities(cashflows):
+        entities[entity.entity_name] = entity
+        periods += entity.cashflow_count
+        if periods >= batch_periods:
+            batches.append(engine(entities))
+            entities, periods = {}, 0
+    if entities:
+        batches.append(engine(entities))
+    timings["compute"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for position, entities in enumerate(batches):
+        repository.load_shard_irrs("sequential", position, entities)
+    repository.merge_shards("sequential", len(batches))
+    timings["write"] = time.perf_counter() - start
+
+    return timings
+
+
+def main():
+    """
+    Compare the wall time of pipelined_irr_pipeline, whose reads, calculation and loads overlap, with the time
+    spent by each of them in sequence, on a generated portfolio held by a repository with artificial latency.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--entities", type=int, default=5_000)
+    parser.add_argument("--max-periods", type=int, default=60)
+    parser.add_argument("--engine", choices=sorted(cli.ENGINES), default="batch")
+    parser.add_argument("--page-size", type=int, default=10_000)
+    parser.add_argument(
+        "--read-latency",
+        type=float,
+        default=0.2,
+        help="The seconds spent reading each page of cashflows.",
+    )
+    parser.add_argument(
+        "--load-latency",
+        type=float,
+        default=1.0,
+        help="The seconds spent by each load job.",
+    )
+    parser.add_argument(
+        "--batch-periods", type=int, default=services.DEFAULT_PIPELINED_BATCH_PERIODS
+    )
+    parser.add_argument("--upload-workers", type=int, default=4)
+    args = parser.parse_args()
+
+    cashflows = portfolio.generate_portfolio(
+        args.entities, max_periods=args.max_periods
+    ).to_cashflows()
+    engine = cli.ENGINES[args.engine]
+
+    def repository():
+        return LatencyRepository(
+            cashflows, args.page_size, args.read_latency, args.load_latency
+        )
+
+    timings = sequential_run(repository(), engine, args.batch_periods)
+    start = time.perf_counter()
+    services.pipelined_irr_pipeline(
+        repository(),
+        engine,
+        batch_periods=args.batch_periods,
+        upload_workers=args.upload_workers,
+    )
+    pipelined = time.perf_counter() - start
+
+    for step, seconds in timings.items():
+        print(f"{step:>10} {seconds:>9.3f}s")
+    print(f"{'sum':>10} {sum(timings.values()):>9.3f}s")
+    print(f"{'max':>10} {max(timings.values()):>9.3f}s")
+    print(f"{'pipelined':>10} {pipelined:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
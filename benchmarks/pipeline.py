@@ -0,0 +1,239 @@
+import argparse
+import functools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+from benchmarks import portfolio
+import cli
+import model
+from repository import InMemoryRepository
+
+STAGES = ("fetch", "allocation", "entity creation", "calculation", "load")
+
+
+class FrameRepository(InMemoryRepository):
+    """
+    An in-memory repository holding its cashflows as a CashflowFrame, so that portfolios of millions of rows are
+    served without a Cashflow object per row.
+
+    Args:
+        cashflows (model.CashflowFrame): The cashflows held by the repository.
+    """
+
+    def __init__(self, cashflows: model.CashflowFrame):
+        super().__init__()
+        self.frame = cashflows
+
+    def get_cashflows(self, entity_names: list[str] = None) -> list[model.Cashflow]:
+        return self.get_cashflow_frame(entity_names).to_cashflows()
+
+    def get_cashflow_frame(self, entity_names: list[str] = None) -> model.CashflowFrame:
+        if entity_names is None:
+            return self.frame
+        entity_names = set(entity_names)
+        codes = [
+            code
+            for code, entity_name in enumerate(self.frame.entity_names)
+            if entity_name in entity_names
+        ]
+        return self.frame.take(np.isin(self.frame.entity_code, codes))
+
+
+def run_stages(repository: FrameRepository, engine, memory: bool = False) -> dict:
+    """
+    Run the stages of `services.irr_pipeline` one at a time, measuring each of them.
+
+    Args:
+        repository (FrameRepository): The repository holding the cashflows.
+        engine (callable): The calculation strategy.
+        memory (bool, optional): Whether to trace the peak memory allocated by each stage, which slows it down.
+    Returns:
+        dict[str, dict]: The seconds spent by each stage and, when traced, its peak memory in bytes.
+    """
+    steps = {
+        "fetch": lambda _: repository.get_cashflow_frame(),
+        "allocation": lambda cashflows: model.sort_cashflows(cashflows)[0],
+        "entity creation": model.create_entities,
+        "calculation": engine,
+        "load": repository.load_irrs,
+    }
+    if memory:
+        tracemalloc.start()
+    results, value = {}, None
+    try:
+        for stage in STAGES:
+            if memory:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            value = steps[stage](value)
+            results[stage] = {"seconds": time.perf_counter() - start}
+            if memory:
+                results[stage]["peak_bytes"] = (
+                    tracemalloc.get_traced_memory()[1] - baseline
+                )
+            if stage == "entity creation":
+                entities = value
+            if stage == "calculation":
+                value = entities
+    finally:
+        if memory:
+            tracemalloc.stop()
+
+    return results
+
+
+def benchmark(
+    entities: int, settings: dict, engine, repeat: int = 1, memory: bool = True
+) -> dict:
+    """
+    Benchmark the pipeline stages on a generated portfolio, keeping the fastest of several runs.
+
+    Args:
+        entities (int): The number of entities of the portfolio.
+        settings (dict): The other arguments of `portfolio.generate_portfolio()`.
+        engine (callable): The calculation strategy.
+        repeat (int, optional): The number of timed runs.
+        memory (bool, optional): Whether to make an extra run tracing the peak memory of each stage.
+    Returns:
+        dict[str, dict]: The measures of each stage.
+    """
+    cashflows = portfolio.generate_portfolio(entities, **settings)
+    runs = [run_stages(FrameRepository(cashflows), engine) for _ in range(repeat)]
+    results = {
+        stage: {"seconds": min(run[stage]["seconds"] for run in runs)}
+        for stage in STAGES
+    }
+    if memory:
+        traced = run_stages(FrameRepository(cashflows), engine, memory=True)
+        for stage in STAGES:
+            results[stage]["peak_bytes"] = traced[stage]["peak_bytes"]
+
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_seconds: float):
+    """
+    Print the time of each stage relative to a baseline and list the stages slower than the tolerance allows.
+
+    Args:
+        results (dict): The measures of this run, keyed by number of entities and stage.
+        baseline (dict): The measures of the baseline run, in the same layout.
+        tolerance (float): The largest accepted ratio between the time of this run and the baseline's.
+        min_seconds (float): Differences smaller than this are never regressions, to ignore noise.
+    Returns:
+        list[str]: The regressions found, as "entities/stage".
+    """
+    regressions = []
+    print(f"{'entities':>10} {'stage':>16} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for entities, stages in results.items():
+        for stage, measure in stages.items():
+            reference = baseline.get(entities, {}).get(stage)
+            if reference is None:
+                continue
+            ratio = measure["seconds"] / max(reference["seconds"], 1e-9)
+            regressed = (
+                ratio > tolerance
+                and measure["seconds"] - reference["seconds"] > min_seconds
+            )
+            if regressed:
+                regressions.append(f"{entities}/{stage}")
+            print(
+                f"{entities:>10} {stage:>16} {reference['seconds']:>9.3f}s "
+                f"{measure['seconds']:>9.3f}s {ratio:>6.2f}x{' !' if regressed else ''}"
+            )
+
+    return regressions
+
+
+def main():
+    """
+    Time each stage of the IRR pipeline (fetch, allocation, entity creation, calculation and load) and trace its
+    peak memory, on generated portfolios of increasing size held by an in-memory repository. Results can be saved
+    as a JSON baseline and compared with a previous baseline, exiting with an error when a stage regressed.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "--entities", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument(
+        "--period-distribution",
+        choices=portfolio.PERIOD_DISTRIBUTIONS,
+        default="uniform",
+    )
+    parser.add_argument("--min-periods", type=int, default=2)
+    parser.add_argument("--max-periods", type=int, default=60)
+    parser.add_argument(
+        "--sign-pattern", choices=portfolio.SIGN_PATTERNS, default="single"
+    )
+    parser.add_argument("--nan-share", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=sorted(cli.ENGINES), default="batch")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Skip the memory tracing run."
+    )
+    parser.add_argument("--save", help="Save the results as a JSON baseline.")
+    parser.add_argument("--compare", help="Compare the results with a JSON baseline.")
+    parser.add_argument("--tolerance", type=float, default=1.2)
+    parser.add_argument("--min-seconds", type=float, default=0.05)
+    args = parser.parse_args()
+
+    settings = {
+        "period_distribution": args.period_distribution,
+        "min_periods": args.min_periods,
+        "max_periods": args.max_periods,
+        "sign_pattern": args.sign_pattern,
+        "nan_share": args.nan_share,
+        "seed": args.seed,
+    }
+    engine = cli.ENGINES[args.engine]
+    if args.engine == "parallel":
+        engine = functools.partial(engine, workers=args.workers)
+
+    results = {}
+    print(f"{'entities':>10} {'stage':>16} {'time':>10} {'peak MiB':>10}")
+    for entities in args.entities:
+        key = str(entities)
+        results[key] = benchmark(
+            entities, settings, engine, args.repeat, not args.no_memory
+        )
+        for stage, measure in results[key].items():
+            peak = measure.get("peak_bytes")
+            print(
+                f"{entities:>10} {stage:>16} {measure['seconds']:>9.3f}s "
+                f"{'' if peak is None else f'{peak / 2**20:>10.1f}'}"
+            )
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(
+                {
+                    "settings": {**settings, "engine": args.engine},
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline["settings"] != {**settings, "engine": args.engine}:
+            print(f"Warning: the baseline was run with {baseline['settings']}")
+        regressions = compare(
+            results, baseline["results"], args.tolerance, args.min_seconds
+        )
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import numpy as np
+import benchmarks  # noqa: F401
+import model
+
+PERIOD_DISTRIBUTIONS = ("fixed", "uniform", "geometric")
+SIGN_PATTERNS = ("single", "calls", "alternating")
+
+
+def generate_period_counts(
+    rng: np.random.Generator,
+    entities: int,
+    distribution: str,
+    min_periods: int,
+    max_periods: int,
+) -> np.ndarray:
+    """
+    Draw the number of monthly cashflows of each entity.
+
+    Args:
+        rng (np.random.Generator): The random generator.
+        entities (int): The number of entities.
+        distribution (str): "fixed" (every entity has max_periods), "uniform" (between min_periods and max_periods)
+                            or "geometric" (mostly short entities with a long tail, capped at max_periods).
+        min_periods (int): The smallest number of cashflows of an entity.
+        max_periods (int): The largest number of cashflows of an entity.
+    Returns:
+        np.ndarray: The number of cashflows of each entity.
+    """
+    if distribution == "fixed":
+        return np.full(entities, max_periods)
+    if distribution == "uniform":
+        return rng.integers(min_periods, max_periods + 1, size=entities)
+    if distribution == "geometric":
+        mean = max((max_periods - min_periods) / 4, 1)
+        counts = min_periods - 1 + rng.geometric(1 / mean, size=entities)
+        return np.minimum(counts, max_periods)
+    raise ValueError(f"Unknown period distribution {distribution}")
+
+
+def generate_portfolio(
+    entities: int,
+    period_distribution: str = "uniform",
+    min_periods: int = 2,
+    max_periods: int = 60,
+    sign_pattern: str = "single",
+    nan_share: float = 0.0,
+    seed: int = 0,
+) -> model.CashflowFrame:
+    """
+    Generate the monthly cashflows of a synthetic portfolio directly into columns, so that millions of rows can be
+    created without a Cashflow object per row. The same arguments always produce the same cashflows.
+
+    Every entity starts with an investment (an inflow) at a random month and holds a value that drifts randomly.
+    Sign patterns set the flows that follow: "single" only has distributions (outflows), so every IRR is unique;
+    "calls" adds random capital calls (inflows), giving several sign changes; "alternating" alternates calls and
+    distributions every month, the worst case for the solvers.
+
+    Args:
+        entities (int): The number of entities.
+        period_distribution (str, optional): The distribution of the number of cashflows of each entity, see
+                                             `generate_period_counts()`.
+        min_periods (int, optional): The smallest number of cashflows of an entity.
+        max_periods (int, optional): The largest number of cashflows of an entity.
+        sign_pattern (str, optional): "single", "calls" or "alternating".
+        nan_share (float, optional): The share of entities with inflows only and no value, whose IRRs are all nan.
+        seed (int, optional): The seed of the random generator.
+    Returns:
+        model.CashflowFrame: The cashflows, rows in random order.
+    """
+    if sign_pattern not in SIGN_PATTERNS:
+        raise ValueError(f"Unknown sign pattern {sign_pattern}")
+    rng = np.random.default_rng(seed)
+    lengths = generate_period_counts(
+        rng, entities, period_distribution, min_periods, max_periods
+    )
+    rows = int(lengths.sum())
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    entity_code = np.repeat(np.arange(entities, dtype=np.int32), lengths)
+    period = np.arange(rows) - np.repeat(starts, lengths)
+    first = period == 0
+
+    amount = rng.uniform(500, 5000, size=entities)[entity_code]
+    inflow = np.where(first, amount, 0.0)
+    distributions = rng.random(rows) < 0.3
+    calls = np.zeros(rows, dtype=bool)
+    if sign_pattern == "calls":
+        calls = rng.random(rows) < 0.15
+    elif sign_pattern == "alternating":
+        distributions, calls = period % 2 == 0, period % 2 == 1
+    inflow += np.where(calls & ~first, rng.uniform(0, 0.2, size=rows) * amount, 0.0)
+    outflow = np.where(
+        distributions & ~first, rng.uniform(0, 0.05, size=rows) * amount, 0.0
+    )
+
+    growth = np.where(first, 0.0, rng.normal(0.005, 0.03, size=rows))
+    growth = np.cumsum(growth)
+    growth -= np.repeat(growth[starts], lengths)
+    value = amount * np.exp(growth)
+
+    nan_prone = (rng.random(entities) < nan_share)[entity_code]
+    outflow[nan_prone] = 0.0
+    value[nan_prone] = 0.0
+
+    start_month = rng.integers(0, 120, size=entities)[entity_code]
+    date = (np.datetime64("2000-01", "M") + start_month + period).astype(
+        "datetime64[D]"
+    )
+    width = len(str(max(entities - 1, 0)))
+    frame = model.CashflowFrame(
+        date,
+        inflow,
+        outflow,
+        value,
+        entity_code,
+        tuple(f"entity {number:0{width}d}" for number in range(entities)),
+    )
+
+    return frame.take(rng.permutation(rows))
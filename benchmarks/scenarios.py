@@ -0,0 +1,88 @@
+import argparse
+import time
+import numpy as np
+from benchmarks import portfolio
+import model
+import repository
+import scenarios
+import services
+
+
+def scalar_scenarios(entity: model.Entity, spec: scenarios.ScenarioSpec) -> np.ndarray:
+    """
+    Solve the scenarios of an entity one at a time with the scalar solver, as the reference of the vectorized
+    root-finder.
+
+    Args:
+        entity (model.Entity): The entity.
+        spec (scenarios.ScenarioSpec): The scenarios.
+    Returns:
+        np.ndarray: The monthly IRR of each scenario.
+    """
+    inflow, outflow, value = entity.cashflow_columns()
+    matrix = scenarios.shock_cashflows(
+        inflow, outflow, value, *spec.draw(entity.entity_name)
+    )
+    return np.array([model.solve_cashflows(row).rate for row in matrix])
+
+
+def main():
+    """
+    Measure the scenarios solved per second by the scenario pipeline on a generated portfolio held by an in-memory
+    repository, and compare the vectorized root-finder with the scalar solver on the scenarios of the first
+    entities.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--entities", type=int, default=100)
+    parser.add_argument("--max-periods", type=int, default=60)
+    parser.add_argument("--scenarios", type=int, default=10_000)
+    parser.add_argument("--max-exit-delay", type=int, default=24)
+    parser.add_argument(
+        "--chunk-cells", type=int, default=scenarios.DEFAULT_CHUNK_CELLS
+    )
+    parser.add_argument(
+        "--scalar-entities",
+        type=int,
+        default=2,
+        help="The number of entities also solved by the scalar solver.",
+    )
+    args = parser.parse_args()
+
+    cashflows = portfolio.generate_portfolio(
+        args.entities, min_periods=12, max_periods=args.max_periods
+    )
+    spec = scenarios.ScenarioSpec(
+        scenarios=args.scenarios,
+        distribution_scale=(0.5, 1.5),
+        max_exit_delay=args.max_exit_delay,
+        terminal_haircut=(0.0, 0.5),
+    )
+    in_memory = repository.InMemoryRepository(cashflows.to_cashflows())
+
+    start = time.perf_counter()
+    summaries = services.scenario_pipeline(
+        in_memory, spec, chunk_cells=args.chunk_cells
+    )
+    vectorized = time.perf_counter() - start
+    total = args.scenarios * len(summaries)
+    solved = sum(summary.solved for summary in summaries)
+    print(
+        f"vectorized: {total} scenarios in {vectorized:.3f}s, "
+        f"{total / vectorized:,.0f} scenarios/s, {solved} solved"
+    )
+
+    entities, _ = model.ingest_cashflows(cashflows)
+    sample = [entities[name] for name in sorted(entities)[: args.scalar_entities]]
+    start = time.perf_counter()
+    for entity in sample:
+        scalar_scenarios(entity, spec)
+    scalar = time.perf_counter() - start
+    count = args.scenarios * len(sample)
+    print(
+        f"    scalar: {count} scenarios in {scalar:.3f}s, "
+        f"{count / scalar:,.0f} scenarios/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+CLOUD_FUNCTION = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cloud_function"
+)
+
+
+def import_times(module: str) -> dict[str:float]:
+    """
+    Import a module in a new Python process with `-X importtime`, as a cold start of the Cloud Function does.
+
+    Args:
+        module (str): The module to import, from the cloud_function directory.
+    Returns:
+        dict[str, float]: The cumulative seconds spent importing each module, including the modules it imported
+                          first.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=CLOUD_FUNCTION,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def benchmark(module: str, repeat: int) -> dict[str:float]:
+    """
+    Measure the import time of a module and of each module it imports, keeping the fastest of several processes
+    to reduce the noise of a cold file system cache.
+
+    Args:
+        module (str): The module to import.
+        repeat (int): The number of processes.
+    Returns:
+        dict[str, float]: The cumulative seconds spent importing each module.
+    """
+    runs = [import_times(module) for _ in range(repeat)]
+    return {name: min(run.get(name, 0.0) for run in runs) for name in runs[0]}
+
+
+def main():
+    """
+    Measure the import time of the Cloud Function entry point, as paid by each cold start, with `python -X
+    importtime`, and list the most expensive modules it imports. Results can be saved as a JSON baseline and
+    compared with a previous baseline, exiting with an error when the import got slower than the tolerance, so
+    that the cost of new imports is tracked over time.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--modules", nargs="+", default=["main", "cli"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--save", help="Save the results as a JSON baseline.")
+    parser.add_argument("--compare", help="Compare the results with a JSON baseline.")
+    parser.add_argument("--tolerance", type=float, default=1.2)
+    parser.add_argument("--min-seconds", type=float, default=0.02)
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        times = benchmark(module, args.repeat)
+        results[module] = times[module]
+        print(f"{module}: {times[module]:.3f}s")
+        top = sorted(
+            (item for item in times.items() if item[0] != module),
+            key=lambda item: -item[1],
+        )
+        for name, seconds in top[: args.top]:
+            print(f"  {name:<50} {seconds:>7.3f}s")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(
+                {"python": platform.python_version(), "results": results},
+                file,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = []
+        print(f"{'module':>10} {'baseline':>10} {'now':>10} {'ratio':>7}")
+        for module, seconds in results.items():
+            reference = baseline["results"].get(module)
+            if reference is None:
+                continue
+            ratio = seconds / max(reference, 1e-9)
+            regressed = (
+                ratio > args.tolerance and seconds - reference > args.min_seconds
+            )
+            if regressed:
+                regressions.append(module)
+            print(
+                f"{module:>10} {reference:>9.3f}s {seconds:>9.3f}s "
+                f"{ratio:>6.2f}x{' !' if regressed else ''}"
+            )
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
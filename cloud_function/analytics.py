@@ -0,0 +1,183 @@
+import dataclasses
+import functools
+import numpy as np
+import model
+
+ANALYTICS = ("npv", "tvpi", "dpi", "moic")
+DEFAULT_HURDLE_RATE = 0.08
+DEFAULT_CHUNK_CELLS = 5_000_000
+
+
+def discount_factors(periods: int, hurdle_rate: float) -> np.ndarray:
+    """
+    Calculate the discount factor of each monthly period at an annual hurdle rate.
+
+    Args:
+        periods (int): The number of periods.
+        hurdle_rate (float): The annual hurdle rate.
+    Returns:
+        np.ndarray: The discount factor of periods 0 to periods - 1.
+    """
+    return (1 + hurdle_rate) ** (-np.arange(periods, dtype=float) / 12)
+
+
+def prefix_analytics(
+    inflow: np.ndarray,
+    outflow: np.ndarray,
+    value: np.ndarray,
+    discount: np.ndarray,
+    analytics: tuple[str, ...] = ANALYTICS,
+) -> dict[str : np.ndarray]:
+    """
+    Calculate the analytics of every prefix of cashflows, as IRRs are, from running totals shared by all of them.
+    Inflows are the capital paid in and outflows the distributions, as for IRRs.
+
+    - npv: the net present value at the hurdle rate of the distributions and of the value held at the end of the
+      prefix, minus the capital paid in.
+    - tvpi: the distributions plus the value held, over the capital paid in.
+    - dpi: the distributions over the capital paid in.
+    - moic: the distributions plus the value held, over the peak capital at risk, i.e. the largest capital paid in
+      net of the distributions received so far, which does not count capital recycled from distributions.
+
+    Args:
+        inflow (np.ndarray): The inflow of each period, either of one entity or packed entities x periods and padded
+                             with zeros, as by `batch.pack_cashflows()`.
+        outflow (np.ndarray): The outflow of each period, in the same layout.
+        value (np.ndarray): The value held at each period, in the same layout.
+        discount (np.ndarray): The discount factor of each period at the hurdle rate, at least as long as the
+                               cashflows.
+        analytics (tuple[str, ...], optional): The analytics to calculate, among ANALYTICS.
+    Returns:
+        dict[str, np.ndarray]: The rounded values of each analytic from the second period onwards, nan where the
+                               ratio is undefined.
+    Raises:
+        ValueError: If an analytic is unknown.
+    """
+    paid_in = np.cumsum(inflow, axis=-1)
+    distributed = np.cumsum(outflow, axis=-1)
+    total_value = distributed + value
+    columns = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for name in analytics:
+            if name == "npv":
+                factors = discount[: value.shape[-1]]
+                column = (
+                    np.cumsum((outflow - inflow) * factors, axis=-1) + value * factors
+                )
+            elif name == "tvpi":
+                column = total_value / paid_in
+            elif name == "dpi":
+                column = distributed / paid_in
+            elif name == "moic":
+                column = total_value / np.maximum.accumulate(
+                    paid_in - distributed, axis=-1
+                )
+            else:
+                raise ValueError(f"Unknown analytic {name}")
+            column = np.where(np.isfinite(column), column, np.nan)
+            columns[name] = np.round(column[..., 1:], model.IRR_DIGITS)
+
+    return columns
+
+
+def add_analytics(
+    entities: dict[str : model.Entity],
+    analytics: tuple[str, ...] = ANALYTICS,
+    hurdle_rate: float = DEFAULT_HURDLE_RATE,
+    chunk_cells: int = DEFAULT_CHUNK_CELLS,
+) -> dict[str : model.Entity]:
+    """
+    Add analytics as metrics of every IRR of the entities, which must be calculated already. Entities of similar
+    length are packed together, as by the batch engine, so that the analytics of a chunk of entities are calculated
+    at once, with discount factors calculated once per chunk.
+
+    Args:
+        entities (dict[str, model.Entity]): A dictionary of entities with calculated IRR data.
+        analytics (tuple[str, ...], optional): The analytics to add, among ANALYTICS, in the order of the columns.
+        hurdle_rate (float, optional): The annual hurdle rate of the NPV.
+        chunk_cells (int, optional): The largest number of entities x periods packed at a time.
+    Returns:
+        dict[str, model.Entity]: The entities, whose IRRs hold the analytics as metrics.
+    Raises:
+        ValueError: If an analytic is unknown, or if the IRRs of an entity are not the since-inception ones of each
+                    period, e.g. trailing window IRRs.
+    """
+    unknown = set(analytics) - set(ANALYTICS)
+    if unknown:
+        raise ValueError(f"Unknown analytics {sorted(unknown)}")
+    for entity in entities.values():
+        if entity.irrs and len(entity.irrs) != entity.cashflow_count - 1:
+            raise ValueError(
+                f"Analytics need one since-inception IRR per period, {entity.entity_name} has {len(entity.irrs)}"
+            )
+    solved = sorted(
+        (entity for entity in entities.values() if entity.irrs),
+        key=lambda entity: entity.cashflow_count,
+    )
+    start = 0
+    while start < len(solved):
+        periods = solved[start].cashflow_count
+        stop = start + 1
+        while stop < len(solved):
+            periods = solved[stop].cashflow_count
+            if (stop - start + 1) * periods > chunk_cells:
+                periods = solved[stop - 1].cashflow_count
+                break
+            stop += 1
+        _add_chunk_analytics(solved[start:stop], periods, analytics, hurdle_rate)
+        start = stop
+
+    return entities
+
+
+def _add_chunk_analytics(
+    entities: list[model.Entity],
+    periods: int,
+    analytics: tuple[str, ...],
+    hurdle_rate: float,
+):
+    packed = np.zeros((3, len(entities), periods))
+    for row, entity in enumerate(entities):
+        packed[:, row, : entity.cashflow_count] = entity.cashflow_columns()
+    columns = prefix_analytics(
+        *packed, discount_factors(periods, hurdle_rate), analytics
+    )
+    names = list(columns)
+    rows = zip(*(column.tolist() for column in columns.values()))
+    for row, entity in zip(rows, entities):
+        entity.irrs = [
+            (
+                model.Irr(
+                    irr.date, irr.value, irr.entity_name, dict(zip(names, metrics))
+                )
+                if type(irr) is model.Irr
+                else dataclasses.replace(irr, metrics=dict(zip(names, metrics)))
+            )
+            for irr, *metrics in zip(entity.irrs, *row)
+        ]
+
+
+def with_analytics(
+    engine,
+    analytics: tuple[str, ...] = ANALYTICS,
+    hurdle_rate: float = DEFAULT_HURDLE_RATE,
+):
+    """
+    Extend a calculation strategy so that the analytics are calculated along with the IRRs of each batch of
+    entities, while their cashflows are held in memory, instead of scanning the cashflow table again afterwards.
+    The strategy keeps its signature, so it still receives the instrumentation when it accepts one.
+
+    Args:
+        engine (callable): The calculation strategy, e.g. `model.calculate_irrs`.
+        analytics (tuple[str, ...], optional): The analytics to add, among ANALYTICS.
+        hurdle_rate (float, optional): The annual hurdle rate of the NPV.
+    Returns:
+        callable: The extended calculation strategy.
+    """
+
+    @functools.wraps(engine)
+    def calculate_irrs(entities: dict[str : model.Entity], *args, **kwargs):
+        engine(entities, *args, **kwargs)
+        return add_analytics(entities, analytics, hurdle_rate)
+
+    return calculate_irrs
@@ -0,0 +1,185 @@
+import numpy as np
+import model
+import solver
+
+
+def pack_cashflows(
+    entities: list[model.Entity],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pack the cashflows of several entities into padded 2-D arrays, one row per entity and one column per period.
+
+    Args:
+        entities (list[model.Entity]): The entities to pack.
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The net flows and values, both entities x periods and padded with
+                                                   zeros, and the number of periods of each entity.
+    """
+    lengths = np.array([entity.cashflow_count for entity in entities], dtype=int)
+    periods = int(lengths.max()) if lengths.size else 0
+    flows = np.zeros((len(entities), periods))
+    values = np.zeros((len(entities), periods))
+    for row, entity in enumerate(entities):
+        flows[row, : lengths[row]], values[row, : lengths[row]] = (
+            entity.cashflow_arrays()
+        )
+
+    return flows, values, lengths
+
+
+def _sign_changes(matrix: np.ndarray) -> np.ndarray:
+    signs = np.sign(matrix)
+    columns = np.arange(matrix.shape[1])
+    last_non_zero = np.maximum.accumulate(np.where(signs != 0, columns, 0), axis=1)
+    filled = np.take_along_axis(signs, last_non_zero, axis=1)
+    return ((filled[:, 1:] != filled[:, :-1]) & (filled[:, :-1] != 0)).sum(axis=1)
+
+
+def _edge_signs(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    rows = np.arange(matrix.shape[0])
+    non_zero = matrix != 0
+    first = matrix[rows, non_zero.argmax(axis=1)]
+    last = matrix[rows, matrix.shape[1] - 1 - non_zero[:, ::-1].argmax(axis=1)]
+    return np.sign(first), np.sign(last)
+
+
+def _newton(
+    matrix: np.ndarray, rates: np.ndarray, irr_solver: solver.IrrSolver
+) -> tuple[np.ndarray, np.ndarray]:
+    periods = np.arange(matrix.shape[1], dtype=float)
+    rates = rates.copy()
+    active = np.ones(rates.shape[0], dtype=bool)
+    converged = np.zeros(rates.shape[0], dtype=bool)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        for _ in range(irr_solver.max_iterations):
+            if not active.any():
+                break
+            discounted = matrix[active] * (1.0 + rates[active, None]) ** -periods
+            npv = discounted.sum(axis=1)
+            first = -(periods * discounted).sum(axis=1) / (1.0 + rates[active])
+            step = npv / first
+            new_rates = rates[active] - step
+            new_rates = np.where(new_rates <= -1, (rates[active] - 1) / 2, new_rates)
+            stalled = np.abs(new_rates - rates[active]) < irr_solver.tolerance
+            # a vanishing step is only convergence where the NPV vanishes too
+            rows = np.flatnonzero(active)[stalled]
+            converged[rows] = solver.is_root(
+                new_rates[stalled], matrix[rows], irr_solver.tolerance
+            )
+            rates[active] = new_rates
+            active[active] = ~stalled & np.isfinite(new_rates)
+
+    return rates, converged
+
+
+def solve_rows(
+    matrix: np.ndarray, guesses: np.ndarray, irr_solver: solver.IrrSolver = None
+) -> np.ndarray:
+    """
+    Calculate the IRR of every row of a matrix of periodic cashflows at once, with a masked Newton iteration. Rows
+    that may have several IRRs, or that do not converge to the expected side of zero, are solved one by one with
+    the scalar solver.
+
+    Args:
+        matrix (np.ndarray): The periodic cashflows, rows x periods.
+        guesses (np.ndarray): The starting rate of each row.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance, iteration cap and fallback.
+    Returns:
+        np.ndarray: The unrounded rate of each row, nan when there is none.
+    """
+    irr_solver = irr_solver or solver.DEFAULT_SOLVER
+    rates = np.full(matrix.shape[0], np.nan)
+
+    totals = matrix.sum(axis=1)
+    first, last = _edge_signs(matrix)
+    total_sign = np.sign(totals)
+    positive_side, negative_side = first != total_sign, last != total_sign
+    changes = _sign_changes(matrix)
+    bounded = (_sign_changes(np.cumsum(matrix, axis=1)) <= 1) & (
+        _sign_changes(np.cumsum(matrix[:, ::-1], axis=1)) <= 1
+    )
+    solvable = changes > 0
+    rates[solvable & (totals == 0)] = 0.0
+
+    single = solvable & (totals != 0) & bounded & (positive_side ^ negative_side)
+    newton_rates, converged = _newton(matrix[single], guesses[single], irr_solver)
+    accepted = converged & (
+        np.sign(newton_rates) == np.where(positive_side[single], 1, -1)
+    )
+    rates[np.flatnonzero(single)[accepted]] = newton_rates[accepted]
+
+    fallback = solvable & (totals != 0) & ~single
+    fallback[np.flatnonzero(single)[~accepted]] = True
+    for index in np.flatnonzero(fallback):
+        rates[index] = irr_solver.solve(matrix[index], guesses[index]).rate
+
+    return rates
+
+
+def solve_periods(
+    flows: np.ndarray,
+    values: np.ndarray,
+    lengths: np.ndarray,
+    irr_solver: solver.IrrSolver = None,
+) -> np.ndarray:
+    """
+    Calculate the IRR of every prefix of every packed entity. Periods are swept in order and, for each one, the
+    prefixes of all entities long enough are solved together by `solve_rows()`, warm-started from the previous
+    period's rates.
+
+    Args:
+        flows (np.ndarray): The packed net flows, entities x periods.
+        values (np.ndarray): The packed values, entities x periods.
+        lengths (np.ndarray): The number of periods of each entity.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance, iteration cap and fallback.
+    Returns:
+        np.ndarray: The unrounded rates, entities x periods, where column k holds the IRR of the prefix ending at
+                    period k and unused cells are nan.
+    """
+    irr_solver = irr_solver or solver.DEFAULT_SOLVER
+    rates = np.full(flows.shape, np.nan)
+    guesses = np.full(flows.shape[0], solver.DEFAULT_GUESS)
+    for period in range(1, flows.shape[1]):
+        rows = np.flatnonzero(lengths > period)
+        matrix = flows[rows, : period + 1].copy()
+        matrix[:, period] += values[rows, period]
+        period_rates = solve_rows(matrix, guesses[rows], irr_solver)
+
+        rates[rows, period] = period_rates
+        finite = np.isfinite(period_rates)
+        guesses[rows[finite]] = period_rates[finite]
+
+    return rates
+
+
+def calculate_irrs(
+    entities: dict[str : model.Entity], irr_solver: solver.IrrSolver = None
+) -> dict[str : model.Entity]:
+    """
+    Calculate IRR data for all entities at once. This is a drop-in calculation strategy for the IRR pipeline that
+    produces the same Irr objects as `model.calculate_irrs`.
+
+    Args:
+        entities (dict[str, model.Entity]): A dictionary of entities where keys are entity names, and values are
+                                            Entity objects.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance, iteration cap and fallback.
+    Returns:
+        dict[str, model.Entity]: A dictionary of entities with updated IRR data.
+    """
+    solvable = []
+    for entity in entities.values():
+        if entity.cashflow_count < 2:
+            entity.calculate_irr(irr_solver)
+        else:
+            solvable.append(entity)
+    if not solvable:
+        return entities
+
+    rates = solve_periods(*pack_cashflows(solvable), irr_solver)
+    for row, entity in enumerate(solvable):
+        entity.irrs = [
+            model.Irr(date, round(float(rate), model.IRR_DIGITS), entity.entity_name)
+            for date, rate in zip(entity.cashflow_dates()[1:], rates[row, 1:])
+        ]
+
+    return entities
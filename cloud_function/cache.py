@@ -0,0 +1,218 @@
+import hashlib
+import json
+import math
+import sqlite3
+import numpy as np
+import model
+import solver
+
+CACHE_VERSION = 1
+DEFAULT_MAX_ENTRIES = 5_000_000
+# SQLite limits the number of parameters of a statement
+LOOKUP_SIZE = 500
+
+
+def prefix_keys(flows: np.ndarray, values: np.ndarray) -> list[bytes]:
+    """
+    Calculate the key of every prefix of an entity's cashflows from a rolling hash: the net flows are hashed once,
+    in order, and the key of the prefix ending at period k adds the flow plus value of period k to the hash of the
+    flows before it. The key identifies the periodic cashflow vector whatever the entity or date.
+
+    Args:
+        flows (np.ndarray): The net flow (outflow - inflow) of each period.
+        values (np.ndarray): The value held at each period.
+    Returns:
+        list[bytes]: One key per period from the second period onwards.
+    """
+    flows = np.ascontiguousarray(flows, dtype=float)
+    lasts = (flows + np.asarray(values, dtype=float)).tobytes()
+    running = hashlib.blake2b(flows[:1].tobytes(), digest_size=16)
+    keys = []
+    for period in range(1, flows.shape[0]):
+        key = running.copy()
+        key.update(lasts[8 * period : 8 * period + 8])
+        keys.append(key.digest())
+        running.update(flows[period : period + 1].tobytes())
+
+    return keys
+
+
+class IrrCache:
+    """
+    A persistent memo of the rounded IRR of periodic cashflow vectors, stored in a SQLite file. As most cashflow
+    histories only grow, a run finds the IRRs of all but the newest prefixes of each entity solved by the previous
+    run. The cache holds at most `max_entries` IRRs, evicting the least recently used ones, and is emptied when it
+    was filled with other solver settings or rounding.
+
+    Args:
+        path (str): The path of the SQLite file, created if needed. ":memory:" keeps the cache in memory.
+        max_entries (int, optional): The number of IRRs kept.
+        irr_solver (solver.IrrSolver, optional): The solver whose settings the cached IRRs depend on.
+        digits (int, optional): The number of decimals the cached IRRs are rounded to.
+
+    Attributes:
+        hits (int): The number of prefixes found in the cache.
+        misses (int): The number of prefixes solved.
+
+    Methods:
+        solve_prefixes(flows, values): Calculate the rounded IRR of every prefix of an entity's cashflows.
+        invalidate(): Empty the cache.
+        flush(): Save the IRRs solved so far and evict the least recently used ones.
+        close(): Flush and close the cache.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        irr_solver: solver.IrrSolver = None,
+        digits: int = model.IRR_DIGITS,
+    ):
+        self.irr_solver = irr_solver or solver.DEFAULT_SOLVER
+        self.digits = digits
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS irrs "
+            "(key BLOB PRIMARY KEY, rate REAL, used INTEGER NOT NULL) WITHOUT ROWID"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS irrs_used ON irrs (used)")
+
+        settings = json.dumps(
+            {
+                "version": CACHE_VERSION,
+                "tolerance": self.irr_solver.tolerance,
+                "max_iterations": self.irr_solver.max_iterations,
+                "bracket_max_iterations": self.irr_solver.bracket_max_iterations,
+                "digits": digits,
+            },
+            sort_keys=True,
+        )
+        row = self.connection.execute(
+            "SELECT value FROM settings WHERE name = 'solver'"
+        ).fetchone()
+        if row is None or row[0] != settings:
+            self.invalidate()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO settings VALUES ('solver', ?)", (settings,)
+            )
+            self.connection.commit()
+        self.tick = self.connection.execute(
+            "SELECT COALESCE(MAX(used), 0) FROM irrs"
+        ).fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lookup(self, keys: list[bytes]) -> dict[bytes:float]:
+        """
+        Find the cached IRRs of some cashflow vectors.
+
+        Args:
+            keys (list[bytes]): The keys of the cashflow vectors.
+        Returns:
+            dict[bytes, float]: The rounded IRR of each key found, nan for vectors without IRR.
+        """
+        found = {}
+        for start in range(0, len(keys), LOOKUP_SIZE):
+            chunk = keys[start : start + LOOKUP_SIZE]
+            rows = self.connection.execute(
+                "SELECT key, rate FROM irrs "
+                f"WHERE key IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            found.update(
+                (key, math.nan if rate is None else rate) for key, rate in rows
+            )
+
+        return found
+
+    def solve_prefixes(
+        self, flows: np.ndarray, values: np.ndarray
+    ) -> list[solver.SolverResult]:
+        """
+        Calculate the rounded IRR of every prefix of an entity's cashflows, as `model.solve_prefixes()` does, but
+        only solving the prefixes missing from the cache, which are then added to it.
+
+        Args:
+            flows (np.ndarray): The net flow (outflow - inflow) of each period.
+            values (np.ndarray): The value held at each period.
+        Returns:
+            list[solver.SolverResult]: One result per period from the second period onwards, with the "cache"
+                                       method for the IRRs found in the cache.
+        """
+        keys = prefix_keys(flows, values)
+        found = self.lookup(keys)
+        flows = np.asarray(flows, dtype=float)
+        values = np.asarray(values, dtype=float)
+        results = []
+        guess = None
+        for period, key in enumerate(keys, start=1):
+            if key in found:
+                result = solver.SolverResult(found[key], 0, True, "cache")
+            else:
+                periodic_cashflow = flows[: period + 1].copy()
+                periodic_cashflow[period] += values[period]
+                result = model.solve_cashflows(
+                    periodic_cashflow, guess, self.irr_solver
+                )
+                result = solver.SolverResult(
+                    round(result.rate, self.digits),
+                    result.iterations,
+                    result.converged,
+                    result.method,
+                )
+            if math.isfinite(result.rate):
+                guess = result.rate
+            results.append(result)
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        self.tick += 1
+        self.connection.executemany(
+            "INSERT INTO irrs VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET used = excluded.used",
+            (
+                (key, None if math.isnan(result.rate) else result.rate, self.tick)
+                for key, result in zip(keys, results)
+            ),
+        )
+
+        return results
+
+    def invalidate(self):
+        """
+        Empty the cache, e.g. after a change of the IRR calculation that the settings do not capture.
+        """
+        self.connection.execute("DELETE FROM irrs")
+        self.connection.commit()
+        self.tick = 0
+
+    def flush(self):
+        """
+        Save the IRRs solved so far and evict the least recently used ones beyond `max_entries`.
+        """
+        count = self.connection.execute("SELECT COUNT(*) FROM irrs").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM irrs WHERE key IN "
+                "(SELECT key FROM irrs ORDER BY used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        self.connection.commit()
+
+    def close(self):
+        """
+        Flush and close the cache.
+        """
+        self.flush()
+        self.connection.close()
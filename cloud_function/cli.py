@@ -0,0 +1,181 @@
+import argparse
+import functools
+import logging
+import time
+import analytics
+import batch
+import cache
+import hierarchy
+import instrumentation
+import model
+import parallel
+import repository
+import services
+import xirr
+
+ENGINES = {
+    "scalar": model.calculate_irrs,
+    "batch": batch.calculate_irrs,
+    "parallel": parallel.calculate_irrs,
+    "xirr": xirr.calculate_irrs,
+    "rolling": model.calculate_window_irrs,
+}
+
+
+def parse_arguments(argv: list[str] = None) -> argparse.Namespace:
+    """
+    Parse the command line arguments of the local IRR pipeline.
+
+    Args:
+        argv (list[str], optional): The arguments to parse. Defaults to the ones of the process.
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Calculate the IRRs of the cashflows held in local files."
+    )
+    parser.add_argument(
+        "source",
+        help="A .parquet or .csv cashflow file, or a directory of .npy column files.",
+    )
+    parser.add_argument(
+        "-o", "--output", default="irrs.parquet", help="The Parquet file to write."
+    )
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="scalar")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="The number of processes of the parallel engine, all CPUs by default.",
+    )
+    parser.add_argument(
+        "--chunk-periods", type=int, default=parallel.DEFAULT_CHUNK_PERIODS
+    )
+    parser.add_argument(
+        "--day-count",
+        choices=xirr.DAY_COUNT_CONVENTIONS,
+        default=xirr.DEFAULT_DAY_COUNT,
+        help="The day count convention of the xirr engine.",
+    )
+    parser.add_argument(
+        "--windows",
+        nargs="+",
+        type=int,
+        default=list(model.DEFAULT_WINDOWS),
+        help="The months of the trailing windows of the rolling engine.",
+    )
+    parser.add_argument(
+        "--analytics",
+        nargs="+",
+        choices=analytics.ANALYTICS,
+        default=[],
+        help="The analytics calculated along with the IRRs, written as extra columns.",
+    )
+    parser.add_argument(
+        "--hurdle-rate",
+        type=float,
+        default=analytics.DEFAULT_HURDLE_RATE,
+        help="The annual hurdle rate of the npv analytic.",
+    )
+    parser.add_argument(
+        "--hierarchy",
+        help="A CSV file with entity_name and parent_name columns, whose groups are calculated along with the "
+        "entities and written with a level column.",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="Log the metrics of each stage and of the solver as JSON lines.",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Trace the peak memory of each stage, implies --metrics.",
+    )
+    parser.add_argument(
+        "--slowest",
+        type=int,
+        default=0,
+        help="Log the given number of slowest entities to solve, implies --metrics.",
+    )
+    parser.add_argument(
+        "--cache",
+        help="A SQLite file memoizing the IRRs of the scalar engine from one run to the next.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=cache.DEFAULT_MAX_ENTRIES,
+        help="The number of IRRs kept in the cache, the least recently used ones being evicted.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] = None) -> model.IngestionReport:
+    """
+    Run the IRR pipeline on local files, with the calculation engine chosen on the command line.
+
+    Args:
+        argv (list[str], optional): The command line arguments. Defaults to the ones of the process.
+    Returns:
+        model.IngestionReport: The data quality problems found in the cashflows.
+    """
+    arguments = parse_arguments(argv)
+    engine = ENGINES[arguments.engine]
+    if arguments.engine == "parallel":
+        engine = functools.partial(
+            engine, workers=arguments.workers, chunk_periods=arguments.chunk_periods
+        )
+    elif arguments.engine == "xirr":
+        engine = functools.partial(engine, day_count=arguments.day_count)
+    elif arguments.engine == "rolling":
+        engine = functools.partial(engine, windows=tuple(arguments.windows))
+
+    irr_cache = None
+    if arguments.cache:
+        if arguments.engine != "scalar":
+            raise SystemExit("--cache requires the scalar engine")
+        irr_cache = cache.IrrCache(arguments.cache, arguments.cache_size)
+        engine = functools.partial(engine, cache=irr_cache)
+    if arguments.hierarchy:
+        if arguments.engine in ("xirr", "rolling"):
+            raise SystemExit("--hierarchy requires since-inception monthly IRRs")
+        engine = hierarchy.with_hierarchy(
+            engine, hierarchy.read_hierarchy(arguments.hierarchy)
+        )
+    if arguments.analytics:
+        if arguments.engine == "rolling":
+            raise SystemExit("--analytics requires since-inception IRRs")
+        engine = analytics.with_analytics(
+            engine, tuple(arguments.analytics), arguments.hurdle_rate
+        )
+
+    metrics = instrumentation.NO_INSTRUMENTATION
+    if arguments.metrics or arguments.trace_memory or arguments.slowest:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        metrics = instrumentation.MetricsInstrumentation(
+            arguments.trace_memory, arguments.slowest
+        )
+
+    start = time.perf_counter()
+    try:
+        report = services.irr_pipeline(
+            repository.FileRepository(arguments.source, arguments.output),
+            engine=engine,
+            instrumentation=metrics,
+        )
+    finally:
+        if irr_cache is not None:
+            irr_cache.close()
+    print(
+        f"IRRs written to {arguments.output} in {time.perf_counter() - start:.2f}s, "
+        f"{len(report.issues)} ingestion issues"
+    )
+    if irr_cache is not None:
+        print(f"IRR cache: {irr_cache.hits} hits, {irr_cache.misses} misses")
+
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+from dataclasses import dataclass
+import datetime as dt
+import model
+
+UPDATE_ACTION = "update"
+
+
+@dataclass(frozen=True)
+class EntityUpdate:
+    """
+    A data class representing an event-driven update: cashflows just booked or corrected upstream, and entities to
+    recompute entirely, e.g. after cashflows were deleted.
+
+    Attributes:
+        entity_names (tuple[str, ...]): The entities whose IRR data is recomputed from their first period.
+        cashflows (tuple[model.Cashflow, ...]): The new or corrected cashflows. A cashflow replaces the one of the
+                                                same entity and date, if any.
+    """
+
+    entity_names: tuple[str, ...] = ()
+    cashflows: tuple[model.Cashflow, ...] = ()
+
+    @property
+    def affected_entities(self) -> tuple[str, ...]:
+        """
+        The entities whose IRR data changes, in ascending order.
+
+        Returns:
+            tuple[str, ...]: The entity names.
+        """
+        return tuple(
+            sorted(
+                set(self.entity_names)
+                | {cashflow.entity_name for cashflow in self.cashflows}
+            )
+        )
+
+    def since(self) -> dict[str : dt.date]:
+        """
+        Find the earliest date whose IRR data changes for each entity that only receives cashflows. The IRR data of
+        the entities listed by name changes from their first period.
+
+        Returns:
+            dict[str, datetime.date]: The date of the earliest cashflow of each entity, keyed by entity name.
+        """
+        since = {}
+        for cashflow in self.cashflows:
+            if cashflow.entity_name not in self.entity_names:
+                since[cashflow.entity_name] = min(
+                    cashflow.date, since.get(cashflow.entity_name, cashflow.date)
+                )
+        return since
+
+    def to_message(self) -> dict:
+        """
+        Convert the update to the message published by upstream systems, as JSON compatible values.
+
+        Returns:
+            dict: The message, with an "update" action.
+        """
+        return {
+            "action": UPDATE_ACTION,
+            "entity_names": list(self.entity_names),
+            "cashflows": [
+                {
+                    "date": cashflow.date.isoformat(),
+                    "inflow": cashflow.inflow,
+                    "outflow": cashflow.outflow,
+                    "value": cashflow.value,
+                    "entity_name": cashflow.entity_name,
+                }
+                for cashflow in self.cashflows
+            ],
+        }
+
+    @classmethod
+    def from_message(cls, message: dict) -> "EntityUpdate":
+        """
+        Read an update from its message. Both the entity names and the cashflows are optional.
+
+        Args:
+            message (dict): The message, as created by `to_message()`, with ISO dates.
+        Returns:
+            EntityUpdate: The update.
+        Raises:
+            ValueError: If a cashflow has no date or no entity name.
+        """
+        cashflows = []
+        for row in message.get("cashflows") or []:
+            if not row.get("date") or not row.get("entity_name"):
+                raise ValueError(f"Cashflows need a date and an entity name: {row}")
+            cashflows.append(
+                model.Cashflow(
+                    dt.date.fromisoformat(row["date"]),
+                    float(row.get("inflow") or 0),
+                    float(row.get("outflow") or 0),
+                    float(row.get("value") or 0),
+                    row["entity_name"],
+                )
+            )
+        return cls(tuple(message.get("entity_names") or ()), tuple(cashflows))
@@ -0,0 +1,209 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import queue
+import threading
+import time
+from typing import Iterable, Iterator
+
+DEFAULT_PAGE_SIZE = 10_000
+DEFAULT_PREFETCH_PAGES = 4
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_MAX_PENDING_UPLOADS = 8
+DEFAULT_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class _Done:
+    pass
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class Prefetcher:
+    """
+    Iterate over a source in a background thread, e.g. cashflows streamed page by page from BigQuery, so that the
+    next pages are fetched while the previous ones are processed. Items are handed over in pages through a bounded
+    queue, which stops the thread when the consumer falls behind. An error raised by the source is raised again by
+    the consumer, and closing the prefetcher stops the thread.
+
+    Args:
+        source (Iterable): The items to iterate over.
+        page_size (int, optional): The number of items handed over at a time.
+        prefetch_pages (int, optional): The number of pages read ahead of the consumer.
+
+    Methods:
+        start(): Start reading the source in the background.
+        close(): Stop reading the source and wait for the thread to finish.
+    """
+
+    def __init__(
+        self,
+        source: Iterable,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        prefetch_pages: int = DEFAULT_PREFETCH_PAGES,
+    ):
+        self.source = source
+        self.page_size = page_size
+        self.pages = queue.Queue(maxsize=prefetch_pages)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._read, name="prefetch", daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self) -> Iterator:
+        while True:
+            page = self.pages.get()
+            if isinstance(page, _Done):
+                return
+            if isinstance(page, _Failure):
+                raise page.error
+            yield from page
+
+    def start(self):
+        """
+        Start reading the source in the background.
+        """
+        self.thread.start()
+
+    def close(self):
+        """
+        Stop reading the source, once the page being read is complete, and wait for the thread to finish.
+        """
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def _put(self, page) -> bool:
+        while not self.stopped.is_set():
+            try:
+                self.pages.put(page, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self):
+        try:
+            page = []
+            for item in self.source:
+                page.append(item)
+                if len(page) == self.page_size:
+                    if not self._put(page):
+                        return
+                    page = []
+            if page and not self._put(page):
+                return
+            self._put(_Done())
+        except BaseException as error:
+            self._put(_Failure(error))
+
+
+class Uploader:
+    """
+    Run upload jobs, e.g. BigQuery load jobs, in a pool of threads while the caller carries on. At most
+    `max_pending` jobs are queued or running: submitting another one blocks until one finishes, so that a slow
+    destination slows down the producer instead of filling memory. A failed job is attempted again after a delay
+    doubling each time, so every job must be safe to repeat. Once a job failed every attempt, its error is raised by
+    the next call to `submit()` or `wait()`.
+
+    Args:
+        upload (callable): The upload job, called with the arguments given to `submit()`.
+        workers (int, optional): The number of jobs running at the same time.
+        max_pending (int, optional): The number of jobs queued or running at the same time.
+        attempts (int, optional): The number of attempts of each job.
+        retry_delay (float, optional): The seconds waited before the second attempt of a job.
+
+    Methods:
+        submit(*args): Queue an upload job.
+        wait(): Wait for every job to finish.
+        close(cancel: bool): Stop the pool of threads.
+    """
+
+    def __init__(
+        self,
+        upload,
+        workers: int = DEFAULT_UPLOAD_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING_UPLOADS,
+        attempts: int = DEFAULT_ATTEMPTS,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+    ):
+        self.upload = upload
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="upload")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.pending: list[Future] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.close(cancel=exc_type is not None)
+
+    def submit(self, *args):
+        """
+        Queue an upload job, waiting first for a slot when `max_pending` jobs are queued or running.
+
+        Args:
+            *args: The arguments of the upload job.
+        Raises:
+            Exception: The error of a job that failed every attempt.
+        """
+        self._raise_failure()
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(self._run, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        self.pending.append(future)
+
+    def wait(self):
+        """
+        Wait for every job to finish.
+
+        Raises:
+            Exception: The error of the first job that failed every attempt.
+        """
+        for future in self.pending:
+            future.result()
+        self.pending = []
+
+    def close(self, cancel: bool = False):
+        """
+        Stop the pool of threads, waiting for the running jobs.
+
+        Args:
+            cancel (bool, optional): Whether to cancel the queued jobs instead of running them.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def _raise_failure(self):
+        running = []
+        for future in self.pending:
+            if not future.done():
+                running.append(future)
+            elif future.exception() is not None:
+                raise future.exception()
+        self.pending = running
+
+    def _run(self, *args):
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return self.upload(*args)
+            except Exception as error:
+                if attempt == self.attempts:
+                    raise
+                logger.warning("Upload attempt %d failed, retrying: %s", attempt, error)
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
@@ -0,0 +1,172 @@
+import csv
+import functools
+import numpy as np
+import model
+
+
+def read_hierarchy(path: str) -> dict[str:str]:
+    """
+    Read a hierarchy from a CSV file with a header and entity_name and parent_name columns.
+
+    Args:
+        path (str): The path of the CSV file.
+    Returns:
+        dict[str, str]: The name of the parent group of each entity and group, keyed by their name.
+    """
+    with open(path, newline="") as file:
+        return {row["entity_name"]: row["parent_name"] for row in csv.DictReader(file)}
+
+
+def group_levels(parents: dict[str:str]) -> dict[str:int]:
+    """
+    Find the level of each group of a hierarchy: entities are at level 0, and a group is one level above the highest
+    of its children, so that the groups of a level only depend on the levels below.
+
+    Args:
+        parents (dict[str, str]): The name of the parent group of each entity and group, keyed by their name.
+    Returns:
+        dict[str, int]: The level of each group, keyed by group name, in ascending order of level.
+    Raises:
+        ValueError: If the hierarchy has a cycle.
+    """
+    children = {}
+    for child, parent in parents.items():
+        children.setdefault(parent, []).append(child)
+    levels = {}
+    pending = set(children)
+    level = 0
+    while pending:
+        level += 1
+        ready = sorted(
+            group
+            for group in pending
+            if all(
+                child in levels or child not in children for child in children[group]
+            )
+        )
+        if not ready:
+            raise ValueError(f"The hierarchy has a cycle through {sorted(pending)}")
+        levels.update(dict.fromkeys(ready, level))
+        pending.difference_update(ready)
+
+    return levels
+
+
+def sum_cashflows(
+    group_name: str, frames: list[model.CashflowFrame]
+) -> model.CashflowFrame:
+    """
+    Sum the sorted cashflows of the children of a group, aligned on the union of their dates. Inflows and outflows
+    are added on their dates, and the value held by a child carries forward to the dates of the other children, from
+    its first date onwards.
+
+    Args:
+        group_name (str): The name of the group.
+        frames (list[model.CashflowFrame]): The cashflows of each child, sorted by date and without missing dates.
+    Returns:
+        model.CashflowFrame: The cashflows of the group, one per date.
+    """
+    dates = np.unique(np.concatenate([frame.date for frame in frames]))
+    inflow = np.zeros(dates.shape[0])
+    outflow = np.zeros(dates.shape[0])
+    value = np.zeros(dates.shape[0])
+    for frame in frames:
+        positions = np.searchsorted(dates, frame.date)
+        inflow += np.bincount(positions, frame.inflow, dates.shape[0])
+        outflow += np.bincount(positions, frame.outflow, dates.shape[0])
+        # the last cashflow of each date holds the value, as for IRRs
+        latest = np.searchsorted(frame.date, dates, side="right") - 1
+        value += np.where(latest >= 0, frame.value[latest], 0.0)
+
+    return model.CashflowFrame(
+        dates,
+        inflow,
+        outflow,
+        value,
+        np.zeros(dates.shape[0], dtype=np.int32),
+        (group_name,),
+    )
+
+
+def aggregate_entities(
+    entities: dict[str : model.Entity], parents: dict[str:str]
+) -> dict[str : model.Entity]:
+    """
+    Build the entities of the groups of a hierarchy bottom-up, level by level, so that the cashflows of a group are
+    summed from the ones of its children already built at the level below (see `sum_cashflows()`), instead of from
+    all the cashflows of its entities. Children without cashflows, and groups without any, are left out.
+
+    Args:
+        entities (dict[str, model.Entity]): A dictionary of entities where keys are entity names, and values are
+                                            Entity objects.
+        parents (dict[str, str]): The name of the parent group of each entity and group, keyed by their name.
+    Returns:
+        dict[str, model.Entity]: The entities of the groups, keyed by group name, in ascending order of level.
+    Raises:
+        ValueError: If the hierarchy has a cycle, or if a group is also an entity.
+    """
+    levels = group_levels(parents)
+    overlap = sorted(set(levels) & set(entities))
+    if overlap:
+        raise ValueError(f"Groups cannot have cashflows of their own: {overlap}")
+    children = {}
+    for child, parent in parents.items():
+        children.setdefault(parent, []).append(child)
+
+    groups = {}
+    for group_name in levels:
+        frames = []
+        for child in children[group_name]:
+            entity = groups.get(child) or entities.get(child)
+            if entity is None or not entity.cashflow_count:
+                continue
+            frame = entity.frame
+            if frame is None:
+                frame = model.CashflowFrame.from_cashflows(entity.sorted_cashflows)
+            frames.append(frame.take(~np.isnat(frame.date)))
+        frames = [frame for frame in frames if len(frame)]
+        if not frames:
+            model.logger.info("No cashflows for group %s", group_name)
+            continue
+        groups[group_name] = model.Entity.from_frame(
+            group_name, sum_cashflows(group_name, frames)
+        )
+
+    return groups
+
+
+def with_hierarchy(engine, parents: dict[str:str]):
+    """
+    Extend a calculation strategy so that the groups of a hierarchy, e.g. funds, strategies and the total book, are
+    calculated along with the entities, from cashflows aggregated in memory (see `aggregate_entities()`) instead of
+    rows written to the cashflow source and read and sorted again. The groups are added to the dictionary of
+    entities, so that they are loaded with them, and every IRR becomes a LevelIrr giving its level in the hierarchy.
+    The strategy must calculate since-inception monthly IRRs.
+
+    Args:
+        engine (callable): The calculation strategy, e.g. `model.calculate_irrs`.
+        parents (dict[str, str]): The name of the parent group of each entity and group, keyed by their name.
+    Returns:
+        callable: The extended calculation strategy.
+    """
+
+    @functools.wraps(engine)
+    def calculate_irrs(entities: dict[str : model.Entity], *args, **kwargs):
+        levels = group_levels(parents)
+        entities.update(aggregate_entities(entities, parents))
+        engine(entities, *args, **kwargs)
+        for entity in entities.values():
+            level = levels.get(entity.entity_name, 0)
+            if entity.irrs and type(entity.irrs[0]) is not model.Irr:
+                raise ValueError(
+                    f"Hierarchies need since-inception monthly IRRs, got {type(entity.irrs[0]).__name__}"
+                )
+            entity.irrs = [
+                model.LevelIrr(
+                    irr.date, irr.value, irr.entity_name, irr.metrics, level=level
+                )
+                for irr in entity.irrs
+            ]
+        return entities
+
+    return calculate_irrs
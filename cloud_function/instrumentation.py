@@ -0,0 +1,236 @@
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+import heapq
+import inspect
+import json
+import logging
+import math
+import time
+import tracemalloc
+import solver
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+class Instrumentation:
+    """
+    The interface through which `services.irr_pipeline` reports what it does. Every method is a no-op, so this
+    class is also the default instrumentation, which costs nothing. Subclasses override the methods they need.
+
+    Methods:
+        stage(name: str): Context manager wrapping a stage of the pipeline.
+        rows_read(count: int): Report the number of cashflow rows read.
+        engine(engine: callable): Adapt the calculation strategy, e.g. to collect solver telemetry.
+        entity_solved(entity_name: str, periods: int, results: list[solver.SolverResult], seconds: float): Report
+            how the IRRs of an entity were solved.
+        calculated(entities: dict[str, model.Entity]): Report the entities once their IRRs are calculated.
+        finished(): Report the end of the pipeline.
+    """
+
+    def stage(self, name: str):
+        return nullcontext()
+
+    def rows_read(self, count: int):
+        pass
+
+    def engine(self, engine):
+        return engine
+
+    def entity_solved(
+        self,
+        entity_name: str,
+        periods: int,
+        results: list[solver.SolverResult],
+        seconds: float,
+    ):
+        pass
+
+    def calculated(self, entities: dict):
+        pass
+
+    def finished(self):
+        pass
+
+
+NO_INSTRUMENTATION = Instrumentation()
+
+
+@dataclass
+class StageMetrics:
+    """
+    A data class representing the resources used by a stage of the pipeline.
+
+    Attributes:
+        wall_seconds (float): The elapsed time.
+        cpu_seconds (float): The CPU time of the process, which exceeds the elapsed time when work runs in parallel
+                             threads and excludes worker processes.
+        peak_bytes (int): The peak memory allocated by Python during the stage, None unless memory is traced.
+        max_rss_bytes (int): The largest resident set size reached by the process by the end of the stage, None
+                             where the platform does not report it.
+    """
+
+    wall_seconds: float
+    cpu_seconds: float
+    peak_bytes: int = None
+    max_rss_bytes: int = None
+
+
+@dataclass
+class PipelineMetrics:
+    """
+    A data class collecting the metrics of a pipeline run.
+
+    Attributes:
+        stages (dict[str, StageMetrics]): The resources used by each stage, in order.
+        rows_read (int): The number of cashflow rows read.
+        rows_written (int): The number of IRR rows loaded.
+        entities (int): The number of entities.
+        solved_entities (int): The number of entities whose solver telemetry was reported by the engine.
+        solver_iterations (int): The total iterations spent by the root finder on those entities.
+        max_solver_iterations (int): The largest number of iterations spent on the periods of a single entity.
+        non_converged (int): The number of periods whose root finder stopped at its iteration cap.
+        nan_results (int): The number of IRRs that are nan.
+        solver_methods (dict[str, int]): The number of periods solved by each method, e.g. by each closed form of
+                                         `model.solve_cashflows()`.
+        slowest_entities (list[dict]): The slowest entities to solve, with their number of periods, when profiled.
+    """
+
+    stages: dict = field(default_factory=dict)
+    rows_read: int = 0
+    rows_written: int = 0
+    entities: int = 0
+    solved_entities: int = 0
+    solver_iterations: int = 0
+    max_solver_iterations: int = 0
+    non_converged: int = 0
+    nan_results: int = 0
+    solver_methods: dict = field(default_factory=dict)
+    slowest_entities: list = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        """
+        Convert the metrics to a dictionary for serialization.
+
+        Returns:
+            dict: A dictionary representation of the metrics.
+        """
+        return asdict(self)
+
+
+class MetricsInstrumentation(Instrumentation):
+    """
+    An instrumentation collecting PipelineMetrics and emitting them as structured (JSON) log lines: one when each
+    stage finishes, so a run cut by a timeout still leaves a trace, and a summary at the end.
+
+    Solver telemetry is collected from engines accepting an `instrumentation` argument, such as
+    `model.calculate_irrs`. NaN results and rows written are counted for every engine.
+
+    Args:
+        trace_memory (bool, optional): Whether to trace the peak memory of each stage with tracemalloc, which slows
+                                       down the pipeline.
+        slowest_entities (int, optional): The number of slowest entities to keep, 0 to disable profiling.
+        log (bool, optional): Whether to emit the metrics as log lines.
+
+    Attributes:
+        metrics (PipelineMetrics): The metrics collected so far.
+    """
+
+    def __init__(
+        self, trace_memory: bool = False, slowest_entities: int = 0, log: bool = True
+    ):
+        self.metrics = PipelineMetrics()
+        self.trace_memory = trace_memory
+        self.slowest_entity_count = slowest_entities
+        self.log = log
+        self._slowest = []
+
+    def emit(self, message: str, **fields):
+        """
+        Emit a structured log line, whose JSON fields are kept by Cloud Logging.
+
+        Args:
+            message (str): The message of the log line.
+            **fields: The fields of the log line.
+        """
+        if self.log:
+            logger.info(json.dumps({"message": message, **fields}, default=str))
+
+    @contextmanager
+    def stage(self, name: str):
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            metrics = StageMetrics(
+                time.perf_counter() - wall, time.process_time() - cpu
+            )
+            if self.trace_memory:
+                metrics.peak_bytes = tracemalloc.get_traced_memory()[1] - baseline
+            if tracing:
+                tracemalloc.stop()
+            if resource is not None:
+                # ru_maxrss is in kilobytes on Linux
+                metrics.max_rss_bytes = (
+                    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+                )
+            self.metrics.stages[name] = metrics
+            self.emit(f"Stage {name} finished", stage=name, **asdict(metrics))
+
+    def rows_read(self, count: int):
+        self.metrics.rows_read += count
+
+    def engine(self, engine):
+        if "instrumentation" in inspect.signature(engine).parameters:
+            return lambda entities: engine(entities, instrumentation=self)
+        return engine
+
+    def entity_solved(
+        self,
+        entity_name: str,
+        periods: int,
+        results: list[solver.SolverResult],
+        seconds: float,
+    ):
+        iterations = sum(result.iterations for result in results)
+        self.metrics.solved_entities += 1
+        self.metrics.solver_iterations += iterations
+        self.metrics.max_solver_iterations = max(
+            self.metrics.max_solver_iterations, iterations
+        )
+        self.metrics.non_converged += sum(not result.converged for result in results)
+        for result in results:
+            self.metrics.solver_methods[result.method] = (
+                self.metrics.solver_methods.get(result.method, 0) + 1
+            )
+        if self.slowest_entity_count:
+            entry = (seconds, entity_name, periods)
+            if len(self._slowest) < self.slowest_entity_count:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def calculated(self, entities: dict):
+        self.metrics.entities += len(entities)
+        for entity in entities.values():
+            self.metrics.rows_written += len(entity.irrs)
+            self.metrics.nan_results += sum(
+                math.isnan(irr.value) for irr in entity.irrs
+            )
+
+    def finished(self):
+        self.metrics.slowest_entities = [
+            {"entity_name": entity_name, "periods": periods, "seconds": seconds}
+            for seconds, entity_name, periods in sorted(self._slowest, reverse=True)
+        ]
+        self.emit("IRR pipeline finished", **self.metrics.to_dict())
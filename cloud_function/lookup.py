@@ -0,0 +1,237 @@
+import datetime as dt
+import time
+import numpy as np
+from repository import AbstractRepository
+import model
+
+DEFAULT_CHECK_SECONDS = 60.0
+# dates as days since the epoch are shifted to be positive, and keyed after the entity code
+DAY_OFFSET = 2**31
+DAY_SPAN = 2**32
+
+
+class IrrIndex:
+    """
+    A read-only index answering point-in-time IRR lookups: the IRR of an entity as of a date is the one of its latest
+    IRR dated on or before it. The since-inception IRR data is sorted once by entity and date, so that the dates of
+    each entity are a contiguous sorted array found by the offsets of its dictionary encoded name, searched in
+    O(log n). Bulk lookups search a single array of (entity, date) keys for all the pairs at once.
+
+    Args:
+        irrs (model.IrrFrame): The IRR data, e.g. read from the destination. Trailing window IRRs are left out.
+        version (str, optional): The version of the IRR data in the repository it was read from.
+    Attributes:
+        entity_names (tuple[str, ...]): The table of distinct entity names.
+        offsets (np.ndarray): The position of the first row of each entity, followed by the number of rows.
+        version (str): The version of the IRR data.
+    Methods:
+        lookup(entity_name: str, date: datetime.date): Find the IRR of an entity as of a date.
+        positions(entity_names: list[str], dates: list): Find the rows of many (entity, date) pairs.
+        lookup_many(entity_names: list[str], dates: list): Find the IRRs of many (entity, date) pairs.
+    """
+
+    def __init__(self, irrs: model.IrrFrame, version: str = None):
+        rows = (
+            np.ones(len(irrs), dtype=bool) if irrs.window is None else irrs.window == 0
+        )
+        entity_code = irrs.entity_code[rows]
+        days = irrs.date[rows].astype(np.int64)
+        order = np.lexsort((days, entity_code))
+        self.entity_names = irrs.entity_names
+        self.codes = {name: code for code, name in enumerate(self.entity_names)}
+        self.entity_code = entity_code[order]
+        self.days = days[order]
+        self.irr_monthly = irrs.irr_monthly[rows][order]
+        self.irr_annual = irrs.irr_annual[rows][order]
+        self.offsets = np.searchsorted(
+            self.entity_code, np.arange(len(self.entity_names) + 1)
+        )
+        self.keys = (
+            self.entity_code.astype(np.int64) * DAY_SPAN + self.days + DAY_OFFSET
+        )
+        self.version = version
+
+    def __len__(self):
+        return self.days.shape[0]
+
+    def _row(self, position: int) -> dict:
+        irr_monthly, irr_annual = (
+            float(self.irr_monthly[position]),
+            float(self.irr_annual[position]),
+        )
+        return {
+            "date": str(self.days[position].astype("datetime64[D]")),
+            "irr_monthly": None if np.isnan(irr_monthly) else irr_monthly,
+            "irr_annual": None if np.isnan(irr_annual) else irr_annual,
+            "entity_name": self.entity_names[self.entity_code[position]],
+        }
+
+    def lookup(self, entity_name: str, date: dt.date) -> dict:
+        """
+        Find the IRR of an entity as of a date, by binary search in the dates of the entity.
+
+        Args:
+            entity_name (str): The name of the entity.
+            date (datetime.date): The date, or an ISO string.
+        Returns:
+            dict: The latest IRR of the entity dated on or before the date, with the columns of `Irr.to_dict()` and
+                  None for nan, or None when there is none.
+        """
+        code = self.codes.get(entity_name)
+        if code is None:
+            return None
+        start, stop = self.offsets[code], self.offsets[code + 1]
+        day = np.datetime64(date, "D").astype(np.int64)
+        position = start + np.searchsorted(self.days[start:stop], day, "right") - 1
+        if position < start:
+            return None
+        return self._row(position)
+
+    def positions(self, entity_names: list[str], dates: list) -> np.ndarray:
+        """
+        Find the rows answering many (entity, date) pairs at once, with a single vectorized binary search.
+
+        Args:
+            entity_names (list[str]): The name of the entity of each pair.
+            dates (list): The date of each pair, as datetime.date or ISO strings.
+        Returns:
+            np.ndarray: The position of the row of each pair, -1 when the entity is unknown or has no IRR dated on or
+                        before the date.
+        """
+        codes = np.fromiter(
+            (self.codes.get(name, -1) for name in entity_names),
+            dtype=np.int64,
+            count=len(entity_names),
+        )
+        dates = np.array(dates, dtype="datetime64[D]")
+        keys = codes * DAY_SPAN + dates.astype(np.int64) + DAY_OFFSET
+        positions = np.searchsorted(self.keys, keys, "right") - 1
+        known = (codes >= 0) & ~np.isnat(dates)
+        found = known & (positions >= self.offsets[np.maximum(codes, 0)])
+        return np.where(found, positions, -1)
+
+    def lookup_many(self, entity_names: list[str], dates: list) -> list[dict]:
+        """
+        Find the IRRs of many (entity, date) pairs at once (see `positions()`).
+
+        Args:
+            entity_names (list[str]): The name of the entity of each pair.
+            dates (list): The date of each pair, as datetime.date or ISO strings.
+        Returns:
+            list[dict]: The IRR answering each pair, as `lookup()` returns it, or None.
+        """
+        positions = self.positions(entity_names, dates)
+        found = positions >= 0
+        rows = positions[found]
+        irrs = iter(
+            {
+                "date": date,
+                "irr_monthly": None if irr_monthly != irr_monthly else irr_monthly,
+                "irr_annual": None if irr_annual != irr_annual else irr_annual,
+                "entity_name": self.entity_names[code],
+            }
+            for date, irr_monthly, irr_annual, code in zip(
+                np.datetime_as_string(
+                    self.days[rows].astype("datetime64[D]"), unit="D"
+                ).tolist(),
+                self.irr_monthly[rows].tolist(),
+                self.irr_annual[rows].tolist(),
+                self.entity_code[rows].tolist(),
+            )
+        )
+        return [next(irrs) if is_found else None for is_found in found.tolist()]
+
+
+class WarmIndex:
+    """
+    An IrrIndex kept in memory from one lookup to the next, e.g. by the warm invocations of a Cloud Function. The
+    version of the IRR data in the repository is checked at most every `check_seconds`, and the index is built again
+    when a newer run changed it. The version is read before the IRR data, so that a run finishing in between is
+    picked up by the next check.
+
+    Args:
+        repository (AbstractRepository): The repository holding the IRR data.
+        check_seconds (float, optional): The time during which the index is used without checking the version.
+        clock (callable, optional): The monotonic clock giving the time in seconds.
+    Methods:
+        get(): Get an up to date index.
+    """
+
+    def __init__(
+        self,
+        repository: AbstractRepository,
+        check_seconds: float = DEFAULT_CHECK_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.repository = repository
+        self.check_seconds = check_seconds
+        self.clock = clock
+        self.index = None
+        self.checked = None
+
+    def get(self) -> IrrIndex:
+        """
+        Get the index, built again when the IRR data has a new version.
+
+        Returns:
+            IrrIndex: The index of the latest IRR data.
+        """
+        now = self.clock()
+        if self.index is not None and now - self.checked < self.check_seconds:
+            return self.index
+        version = self.repository.get_irrs_version()
+        if self.index is None or version != self.index.version:
+            self.index = IrrIndex(self.repository.get_irr_frame(), version)
+        self.checked = now
+
+        return self.index
+
+
+def parse_lookup(lookup: dict) -> tuple[str, dt.date]:
+    """
+    Read the entity and the date of a lookup of a request, checking their types, as they come from a JSON body.
+
+    Args:
+        lookup (dict): {"entity_name": ..., "date": ...}, with an ISO date.
+    Returns:
+        tuple[str, datetime.date]: The name of the entity and the date.
+    Raises:
+        ValueError: If the lookup is not an object with a non-empty entity_name string and a date string, or if the
+                    date is invalid.
+    """
+    if (
+        not isinstance(lookup, dict)
+        or not isinstance(lookup.get("entity_name"), str)
+        or not isinstance(lookup.get("date"), str)
+        or not lookup["entity_name"]
+    ):
+        raise ValueError("A lookup needs an entity_name and a date, as strings")
+    return lookup["entity_name"], dt.date.fromisoformat(lookup["date"])
+
+
+def handle_request(index: IrrIndex, request: dict) -> dict:
+    """
+    Answer a lookup request, either for one entity and date, or for a list of them.
+
+    Args:
+        index (IrrIndex): The index to search.
+        request (dict): Either {"entity_name": ..., "date": ...} or {"lookups": [{"entity_name": ..., "date": ...},
+                        ...]}, with ISO dates.
+    Returns:
+        dict: {"irr": ...} or {"irrs": [...]}, with the IRRs as `IrrIndex.lookup()` returns them, and the version of
+              the IRR data.
+    Raises:
+        ValueError: If the request has neither an entity and a date nor a list of lookups, if an entity or a date is
+                    not a string (see `parse_lookup()`), or if a date is invalid.
+    """
+    if "lookups" in request:
+        if not isinstance(request["lookups"], list):
+            raise ValueError("Lookups need to be a list")
+        lookups = [parse_lookup(lookup) for lookup in request["lookups"]]
+        irrs = index.lookup_many(
+            [entity_name for entity_name, _ in lookups],
+            [date for _, date in lookups],
+        )
+        return {"irrs": irrs, "version": index.version}
+    irr = index.lookup(*parse_lookup(request))
+    return {"irr": irr, "version": index.version}
@@ -1,11 +1,159 @@
+import functools
+import logging
+import os
+import events
+import instrumentation
+import model
 import repository
 import services
+import sharding
+
+
+@functools.cache
+def get_repository() -> repository.BiqQueryRepository:
+    """
+    Create the BigQuery repository of this instance on its first invocation. Warm invocations reuse it, with its
+    authenticated client and connection pool, instead of creating a client each time.
+
+    Returns:
+        repository.BiqQueryRepository: The repository of this instance.
+    """
+    return repository.BiqQueryRepository()
+
+
+@functools.cache
+def get_publisher(topic: str) -> sharding.PubSubPublisher:
+    """
+    Create the Pub/Sub publisher of a topic on the first invocation that publishes to it, reused by the warm ones.
+
+    Args:
+        topic (str): The full name of the topic.
+    Returns:
+        sharding.PubSubPublisher: The publisher of the topic.
+    """
+    return sharding.PubSubPublisher(topic)
+
+
+@functools.cache
+def get_irr_index() -> "lookup.WarmIndex":
+    """
+    Create the IRR index of this instance on its first lookup. Warm invocations reuse it, the index being built again
+    only when a newer run changed the IRR data, checked at most every `IRR_LOOKUP_CHECK_SECONDS`.
+
+    Returns:
+        lookup.WarmIndex: The IRR index of this instance.
+    """
+    import lookup
+
+    return lookup.WarmIndex(
+        get_repository(),
+        float(os.environ.get("IRR_LOOKUP_CHECK_SECONDS", lookup.DEFAULT_CHECK_SECONDS)),
+    )
+
+
+def lookup_entry_point(request):
+    """
+    HTTP entry point of point-in-time IRR lookups, e.g. for dashboards, instead of querying the destination table row
+    by row. The IRR data is loaded into an index kept warm between invocations (see `get_irr_index()`), and each
+    lookup is a binary search in memory.
+
+    The JSON body is either {"entity_name": "entity a", "date": "2024-01-31"}, answered by {"irr": {...}}, the latest
+    IRR of the entity dated on or before the date, or {"lookups": [{"entity_name": ..., "date": ...}, ...]} for many
+    lookups at once, answered by {"irrs": [...]}. IRRs are null when there is none.
+
+    Args:
+        request (flask.Request): The HTTP request.
+    Returns:
+        tuple[dict, int]: The JSON response and its status, 400 for invalid requests.
+    """
+    import lookup
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return {"error": "The request body must be a JSON object"}, 400
+    try:
+        return lookup.handle_request(get_irr_index().get(), payload), 200
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
+
+def check_environment():
+    """
+    Check the environment variables selecting the calculation strategy of the full pipeline before anything is read,
+    as the command line does with its arguments, so that a misconfigured function fails at once instead of ignoring
+    a variable or failing after the whole calculation.
+
+    Raises:
+        ValueError: If a day count convention or an analytic is unknown, if windows are not integers, or if
+                    variables that cannot be combined are set: trailing windows are monthly IRRs, so they exclude a
+                    day count convention, and hierarchies and analytics need since-inception IRRs.
+    """
+    day_count = os.environ.get("IRR_PIPELINE_DAY_COUNT")
+    windows = os.environ.get("IRR_PIPELINE_WINDOWS")
+    if day_count:
+        import xirr
+
+        if day_count not in xirr.DAY_COUNT_CONVENTIONS:
+            raise ValueError(f"Unknown day count convention {day_count}")
+    if windows and not all(window.strip().isdigit() for window in windows.split(",")):
+        raise ValueError(f"Invalid IRR_PIPELINE_WINDOWS {windows}")
+    if windows and day_count:
+        raise ValueError(
+            "IRR_PIPELINE_WINDOWS cannot be combined with IRR_PIPELINE_DAY_COUNT"
+        )
+    if os.environ.get("IRR_PIPELINE_HIERARCHY") and (day_count or windows):
+        raise ValueError(
+            "IRR_PIPELINE_HIERARCHY requires since-inception monthly IRRs, "
+            "without IRR_PIPELINE_DAY_COUNT or IRR_PIPELINE_WINDOWS"
+        )
+    if os.environ.get("IRR_PIPELINE_ANALYTICS"):
+        import analytics
+
+        if windows:
+            raise ValueError(
+                "IRR_PIPELINE_ANALYTICS requires since-inception IRRs, without IRR_PIPELINE_WINDOWS"
+            )
+        unknown = set(os.environ["IRR_PIPELINE_ANALYTICS"].split(",")) - set(
+            analytics.ANALYTICS
+        )
+        if unknown:
+            raise ValueError(f"Unknown analytics {sorted(unknown)}")
 
 
 def function_entry_point(event, context):
     """
     Entry point for the application. This function initializes a BigQuery repository connector and invokes the
-    IRR pipeline.
+    IRR pipeline. When the environment variable `IRR_PIPELINE_MODE` is set to `delta`, only the entities whose
+    cashflows changed since the last delta run are recomputed. When `IRR_PIPELINE_METRICS` is set, the full pipeline
+    logs the metrics of each stage and of the solver as JSON lines, along with the `IRR_PIPELINE_SLOWEST_ENTITIES`
+    slowest entities if set. When `IRR_PIPELINE_DAY_COUNT` is set to a day count convention, e.g. `ACT/365F`, the
+    full pipeline calculates date-aware IRRs (XIRR) and writes them with a day_count column. When
+    `IRR_PIPELINE_ANALYTICS` lists analytics separated by commas, e.g. `npv,tvpi,dpi,moic`, the full pipeline writes
+    them as extra columns, the npv being discounted at the annual `IRR_PIPELINE_HURDLE_RATE`. When
+    `IRR_PIPELINE_WINDOWS` lists months separated by commas, e.g. `12,36,60`, the full pipeline also writes the
+    trailing IRRs over windows of those months, with a window column. When `IRR_PIPELINE_HIERARCHY` is set, the full
+    pipeline also calculates the groups of the repository's entity hierarchy, e.g. funds, strategies and the total
+    book, from cashflows aggregated in memory, and writes every IRR with its level in the hierarchy.
+
+    When `IRR_PIPELINE_MODE` is set to `sharded`, the invocation triggered by the scheduler only splits the entities
+    into `IRR_PIPELINE_SHARDS` shards (by `IRR_PIPELINE_SHARD_STRATEGY`, `hash` or `balanced`) and publishes one
+    message per shard to the topic `IRR_PIPELINE_TOPIC`, which triggers this function again. Those invocations read
+    their shard from the event, calculate it, and the last one publishes the message merging the results.
+
+    When `IRR_PIPELINE_MODE` is set to `checkpointed`, entities are calculated in batches of
+    `IRR_PIPELINE_CHECKPOINT_ENTITIES`, each staged once calculated. When an invocation fails, the retried
+    invocation of the same event skips the staged batches, and the IRR data is replaced once every batch is staged.
+
+    Whatever the mode, an event whose message has the "update" action, as created by `events.EntityUpdate`, holds
+    cashflows just booked or corrected upstream, and entities to recompute. Only those entities are recomputed, from
+    the date of their earliest new cashflow onwards, and only their IRR data from that date is replaced.
+
+    Invalid or incompatible variables selecting the calculation strategy fail the invocation before anything is
+    read (see `check_environment()`).
+
+    The BigQuery and Pub/Sub clients are created, and their libraries imported, on the first invocation of an
+    instance only (see `get_repository()` and `get_publisher()`), the warm invocations reusing them. The modules of
+    the XIRR, hierarchy and analytics engines are imported by the first invocation selecting them.
 
     Args:
          event: The dictionary with data specific to this type of event. The `@type` field maps to
@@ -18,5 +166,75 @@ def function_entry_point(event, context):
                   API endpoint pubsub.googleapis.com, the triggering topic's name, and the triggering event type
                   `type.googleapis.com/google.pubsub.v1.PubsubMessage`.
     """
-    bq_repository = repository.BiqQueryRepository()
-    services.irr_pipeline(bq_repository)
+    check_environment()
+    bq_repository = get_repository()
+    mode = os.environ.get("IRR_PIPELINE_MODE", "full")
+    message = sharding.decode_event(event)
+    if message is not None and message["action"] == events.UPDATE_ACTION:
+        services.event_irr_pipeline(
+            bq_repository, events.EntityUpdate.from_message(message)
+        )
+    elif message is not None:
+        publisher = get_publisher(os.environ["IRR_PIPELINE_TOPIC"])
+        services.handle_shard_message(bq_repository, message, publisher.publish)
+    elif mode == "sharded":
+        publisher = get_publisher(os.environ["IRR_PIPELINE_TOPIC"])
+        services.sharded_irr_pipeline(
+            bq_repository,
+            publisher.publish,
+            int(os.environ.get("IRR_PIPELINE_SHARDS", services.DEFAULT_SHARD_COUNT)),
+            os.environ.get("IRR_PIPELINE_SHARD_STRATEGY", "hash"),
+            getattr(context, "event_id", None) or "run",
+        )
+    elif mode == "delta":
+        services.delta_irr_pipeline(bq_repository)
+    elif mode == "checkpointed":
+        services.checkpointed_irr_pipeline(
+            bq_repository,
+            getattr(context, "event_id", None) or "run",
+            batch_entities=int(
+                os.environ.get(
+                    "IRR_PIPELINE_CHECKPOINT_ENTITIES",
+                    services.DEFAULT_CHECKPOINT_ENTITIES,
+                )
+            ),
+        )
+    else:
+        engine = model.calculate_irrs
+        if os.environ.get("IRR_PIPELINE_DAY_COUNT"):
+            import xirr
+
+            engine = functools.partial(
+                xirr.calculate_irrs, day_count=os.environ["IRR_PIPELINE_DAY_COUNT"]
+            )
+        if os.environ.get("IRR_PIPELINE_WINDOWS"):
+            engine = functools.partial(
+                model.calculate_window_irrs,
+                windows=tuple(
+                    int(window)
+                    for window in os.environ["IRR_PIPELINE_WINDOWS"].split(",")
+                ),
+            )
+        if os.environ.get("IRR_PIPELINE_HIERARCHY"):
+            import hierarchy
+
+            engine = hierarchy.with_hierarchy(engine, bq_repository.get_hierarchy())
+        if os.environ.get("IRR_PIPELINE_ANALYTICS"):
+            import analytics
+
+            engine = analytics.with_analytics(
+                engine,
+                tuple(os.environ["IRR_PIPELINE_ANALYTICS"].split(",")),
+                float(
+                    os.environ.get(
+                        "IRR_PIPELINE_HURDLE_RATE", analytics.DEFAULT_HURDLE_RATE
+                    )
+                ),
+            )
+        metrics = instrumentation.NO_INSTRUMENTATION
+        if os.environ.get("IRR_PIPELINE_METRICS"):
+            logging.basicConfig(level=logging.INFO, format="%(message)s")
+            metrics = instrumentation.MetricsInstrumentation(
+                slowest_entities=int(os.environ.get("IRR_PIPELINE_SLOWEST_ENTITIES", 0))
+            )
+        services.irr_pipeline(bq_repository, engine, metrics)
@@ -1,6 +1,21 @@
-from dataclasses import dataclass
+import bisect
+from dataclasses import dataclass, field
 import datetime as dt
-import numpy_financial as npf
+import hashlib
+import itertools
+import logging
+import math
+import time
+from typing import Iterable, Iterator
+import numpy as np
+import instrumentation
+import solver
+
+CASHFLOW_COLUMNS = ("date", "inflow", "outflow", "value", "entity_name")
+IRR_DIGITS = 4
+DEFAULT_WINDOWS = (12, 36, 60)
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass(frozen=True)
@@ -43,6 +58,8 @@ class Irr:
         date (datetime.datetime): The date of the IRR calculation.
         value (float): The monthly IRR value.
         entity_name (str): The name of the associated entity.
+        metrics (dict[str, float], optional): Other metrics of the entity at the same date, keyed by column name,
+                                              e.g. the ones of `analytics.add_analytics()`.
     Properties:
         value_annual (float): Calculate the annualized IRR value based on the monthly value.
     Methods:
@@ -52,6 +69,7 @@ class Irr:
     date: dt.datetime
     value: float
     entity_name: str
+    metrics: dict = field(default=None, hash=False)
 
     @property
     def value_annual(self):
@@ -74,13 +92,719 @@ class Irr:
             "date": self.date.strftime("%Y-%m-%d"),
             "irr_monthly": self.value,
             "irr_annual": self.value_annual,
+            **(self.metrics or {}),
             "entity_name": self.entity_name,
         }
 
 
+@dataclass(frozen=True, kw_only=True)
+class Xirr(Irr):
+    """
+    A data class representing IRR data calculated from the dates of the cashflows, as a spreadsheet XIRR does,
+    instead of assuming evenly spaced monthly periods. The annual rate is the one solved, and the monthly value is
+    its monthly equivalent, so that both fit the columns of Irr.
+
+    Attributes:
+        annual (float): The annual IRR value (rounded to 4 decimal places).
+        day_count (str): The day count convention giving the year fraction between two dates, e.g. "ACT/365F".
+    Properties:
+        value_annual (float): The annual IRR value.
+    Methods:
+        to_dict(): Convert the IRR data to a dictionary for serialization, with its day count convention.
+    """
+
+    annual: float
+    day_count: str
+
+    @property
+    def value_annual(self):
+        return self.annual
+
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), "day_count": self.day_count}
+
+
+@dataclass(frozen=True, kw_only=True)
+class WindowIrr(Irr):
+    """
+    A data class representing IRR data over a trailing window of monthly periods ending at its date, instead of
+    since the entity's first cashflow. Since-inception IRR data calculated along with it has no window.
+
+    Attributes:
+        window (int): The number of months of the trailing window, None since inception.
+    Methods:
+        to_dict(): Convert the IRR data to a dictionary for serialization, with its window.
+    """
+
+    window: int = None
+
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), "window": self.window}
+
+
+@dataclass(frozen=True, kw_only=True)
+class LevelIrr(Irr):
+    """
+    A data class representing IRR data at a level of a hierarchy of entities: level 0 for the entities themselves,
+    and for a group one more than the highest level of its children, e.g. 1 for funds, 2 for strategies and 3 for
+    the total book.
+
+    Attributes:
+        level (int): The level of the entity or group in the hierarchy.
+    Methods:
+        to_dict(): Convert the IRR data to a dictionary for serialization, with its level.
+    """
+
+    level: int = 0
+
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), "level": self.level}
+
+
+class CashflowFrame:
+    """
+    A columnar (struct of arrays) collection of cashflows. Each column is a NumPy array with one position per
+    cashflow, and entity names are dictionary encoded: `entity_code` holds positions in the `entity_names` table.
+    This avoids one Cashflow object per row for large sources, while `to_cashflows()` keeps them available.
+
+    Args:
+        date (np.ndarray): The dates of the cashflows as datetime64[D], NaT for missing dates.
+        inflow (np.ndarray): The inflow amounts.
+        outflow (np.ndarray): The outflow amounts.
+        value (np.ndarray): The net values.
+        entity_code (np.ndarray): The position of each cashflow's entity name in `entity_names`.
+        entity_names (tuple[str, ...]): The table of distinct entity names.
+    Methods:
+        from_columns(date, inflow, outflow, value, entity_name): Build a frame from plain column sequences.
+        from_cashflows(cashflows: list[Cashflow]): Build a frame from Cashflow objects.
+        from_arrow(table: pyarrow.Table): Build a frame from an Arrow table.
+        take(indices: np.ndarray): Select cashflows by position.
+        slice(start: int, stop: int): Select a contiguous range of cashflows without copying.
+        sort(): Sort cashflows by entity and date.
+        groups(): Iterate over the entities of a sorted frame.
+        to_cashflows(): Materialise the cashflows as Cashflow objects.
+    """
+
+    def __init__(
+        self,
+        date: np.ndarray,
+        inflow: np.ndarray,
+        outflow: np.ndarray,
+        value: np.ndarray,
+        entity_code: np.ndarray,
+        entity_names: tuple[str, ...],
+    ):
+        self.date = date
+        self.inflow = inflow
+        self.outflow = outflow
+        self.value = value
+        self.entity_code = entity_code
+        self.entity_names = tuple(entity_names)
+
+    @classmethod
+    def from_columns(cls, date, inflow, outflow, value, entity_name) -> "CashflowFrame":
+        """
+        Build a frame from plain column sequences, e.g. lists filled while reading a query result.
+
+        Args:
+            date (Sequence): The dates of the cashflows (datetime.date, ISO strings or None).
+            inflow (Sequence[float]): The inflow amounts.
+            outflow (Sequence[float]): The outflow amounts.
+            value (Sequence[float]): The net values.
+            entity_name (Sequence[str]): The entity name of each cashflow.
+        Returns:
+            CashflowFrame: The frame holding those columns.
+        """
+        codes = {}
+        entity_code = np.fromiter(
+            (codes.setdefault(name, len(codes)) for name in entity_name),
+            dtype=np.int32,
+            count=len(entity_name),
+        )
+        return cls(
+            np.array(date, dtype="datetime64[D]"),
+            np.array(inflow, dtype=float),
+            np.array(outflow, dtype=float),
+            np.array(value, dtype=float),
+            entity_code,
+            tuple(codes),
+        )
+
+    @classmethod
+    def from_cashflows(cls, cashflows: list[Cashflow]) -> "CashflowFrame":
+        """
+        Build a frame from Cashflow objects.
+
+        Args:
+            cashflows (list[Cashflow]): The cashflows to store.
+        Returns:
+            CashflowFrame: The frame holding those cashflows.
+        """
+        return cls.from_columns(
+            [cashflow.date for cashflow in cashflows],
+            [cashflow.inflow for cashflow in cashflows],
+            [cashflow.outflow for cashflow in cashflows],
+            [cashflow.value for cashflow in cashflows],
+            [cashflow.entity_name for cashflow in cashflows],
+        )
+
+    @classmethod
+    def from_arrow(cls, table) -> "CashflowFrame":
+        """
+        Build a frame from an Arrow table with the cashflow columns, converting whole columns at once. Missing
+        dates become NaT, missing amounts nan.
+
+        Args:
+            table (pyarrow.Table): The cashflows, with date, inflow, outflow, value and entity_name columns.
+        Returns:
+            CashflowFrame: The frame holding those columns.
+        """
+        import pyarrow as pa
+
+        dates = table.column("date")
+        if not pa.types.is_date(dates.type):
+            dates = dates.cast(pa.date32())
+        names = table.column("entity_name").combine_chunks().fill_null("")
+        names = names.dictionary_encode()
+
+        return cls(
+            # NaT is stored as the smallest int64
+            dates.cast(pa.int32())
+            .cast(pa.int64())
+            .fill_null(np.iinfo(np.int64).min)
+            .to_numpy()
+            .view("datetime64[D]"),
+            *(
+                table.column(name).cast(pa.float64()).to_numpy()
+                for name in ("inflow", "outflow", "value")
+            ),
+            names.indices.to_numpy().astype(np.int32),
+            tuple(names.dictionary.to_pylist()),
+        )
+
+    def __len__(self):
+        return self.entity_code.shape[0]
+
+    def take(self, indices: np.ndarray) -> "CashflowFrame":
+        """
+        Select cashflows by position. The entity name table is shared with this frame.
+
+        Args:
+            indices (np.ndarray): The positions (or boolean mask) of the cashflows to select.
+        Returns:
+            CashflowFrame: A new frame with the selected cashflows.
+        """
+        return CashflowFrame(
+            self.date[indices],
+            self.inflow[indices],
+            self.outflow[indices],
+            self.value[indices],
+            self.entity_code[indices],
+            self.entity_names,
+        )
+
+    def slice(self, start: int, stop: int) -> "CashflowFrame":
+        """
+        Select a contiguous range of cashflows. The columns of the result are views on this frame's arrays.
+
+        Args:
+            start (int): The position of the first cashflow.
+            stop (int): The position after the last cashflow.
+        Returns:
+            CashflowFrame: A frame viewing the selected cashflows.
+        """
+        return self.take(slice(start, stop))
+
+    def sort(self) -> "CashflowFrame":
+        """
+        Sort cashflows by entity and then by date with a single stable argsort. As for Cashflow, missing dates are
+        placed first.
+
+        Returns:
+            CashflowFrame: A new frame with the sorted cashflows.
+        """
+        # NaT is stored as the smallest int64, so integer dates sort missing dates first
+        return self.take(np.lexsort((self.date.astype(np.int64), self.entity_code)))
+
+    def groups(self):
+        """
+        Iterate over the entities of a frame sorted by entity, without copying the columns.
+
+        Yields:
+            tuple[str, CashflowFrame]: The name of each entity and a frame viewing its cashflows.
+        """
+        if not len(self):
+            return
+        boundaries = np.flatnonzero(np.diff(self.entity_code)) + 1
+        starts = np.concatenate(([0], boundaries))
+        stops = np.concatenate((boundaries, [len(self)]))
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            yield self.entity_names[self.entity_code[start]], self.slice(start, stop)
+
+    def dates(self) -> list:
+        """
+        Convert the dates to Python objects.
+
+        Returns:
+            list: The date of each cashflow as datetime.date, or None when missing.
+        """
+        return self.date.astype(object).tolist()
+
+    def to_cashflows(self) -> list[Cashflow]:
+        """
+        Materialise the cashflows as Cashflow objects.
+
+        Returns:
+            list[Cashflow]: One Cashflow per row, in the frame's order.
+        """
+        return [
+            Cashflow(date, inflow, outflow, value, self.entity_names[code])
+            for date, inflow, outflow, value, code in zip(
+                self.dates(),
+                self.inflow.tolist(),
+                self.outflow.tolist(),
+                self.value.tolist(),
+                self.entity_code.tolist(),
+            )
+        ]
+
+
+class IrrFrame:
+    """
+    A columnar collection of Internal Rate of Return (IRR) data, with the same columns as `Irr.to_dict()`, plus a
+    day_count column for Xirr data, a window column for WindowIrr data and a level column for LevelIrr data. Entity
+    names are dictionary encoded as in CashflowFrame.
+
+    Args:
+        date (np.ndarray): The dates of the IRR calculations as datetime64[D].
+        irr_monthly (np.ndarray): The monthly IRR values.
+        entity_code (np.ndarray): The position of each IRR's entity name in `entity_names`.
+        entity_names (tuple[str, ...]): The table of distinct entity names.
+        annual (np.ndarray, optional): The annual IRR values of Xirr data, which are not derived from the monthly
+                                       ones.
+        day_count (str, optional): The day count convention of Xirr data.
+        metrics (dict[str, np.ndarray], optional): The columns of the other metrics of the IRR data, in order.
+        window (np.ndarray, optional): The trailing window in months of WindowIrr data, 0 since inception.
+        level (np.ndarray, optional): The hierarchy level of LevelIrr data.
+    Properties:
+        irr_annual (np.ndarray): The annualized IRR values, calculated for the whole column at once.
+    Methods:
+        from_irrs(irrs: Iterable[Irr]): Collect IRR data.
+        from_arrow(table: pyarrow.Table): Build a frame from an Arrow table.
+        from_entities(entities: dict[str, Entity]): Collect the IRR data of a dictionary of entities.
+        to_arrow(): Convert the IRR data to an Arrow table.
+        to_dicts(): Convert the IRR data to dictionaries for serialization.
+    """
+
+    def __init__(
+        self,
+        date: np.ndarray,
+        irr_monthly: np.ndarray,
+        entity_code: np.ndarray,
+        entity_names: tuple[str, ...],
+        annual: np.ndarray = None,
+        day_count: str = None,
+        metrics: dict[str : np.ndarray] = None,
+        window: np.ndarray = None,
+        level: np.ndarray = None,
+    ):
+        self.date = date
+        self.irr_monthly = irr_monthly
+        self.entity_code = entity_code
+        self.entity_names = tuple(entity_names)
+        self.annual = annual
+        self.day_count = day_count
+        self.metrics = metrics or {}
+        self.window = window
+        self.level = level
+
+    @classmethod
+    def from_irrs(cls, irrs: Iterable[Irr]) -> "IrrFrame":
+        """
+        Collect IRR data into columns. The data is either all Irr, all Xirr with the same day count convention, all
+        WindowIrr or all LevelIrr, and all have the metrics of the first IRR.
+
+        Args:
+            irrs (Iterable[Irr]): The IRR data.
+        Returns:
+            IrrFrame: The IRR data held in columns.
+        """
+        irrs = list(irrs)
+        dates, values, entity_code, codes = [], [], [], {}
+        for irr in irrs:
+            dates.append(irr.date)
+            values.append(irr.value)
+            entity_code.append(codes.setdefault(irr.entity_name, len(codes)))
+        annual, day_count = None, None
+        if irrs and isinstance(irrs[0], Xirr):
+            annual = np.array([irr.annual for irr in irrs], dtype=float)
+            day_count = irrs[0].day_count
+        window = None
+        if irrs and isinstance(irrs[0], WindowIrr):
+            window = np.array([irr.window or 0 for irr in irrs], dtype=np.int64)
+        level = None
+        if irrs and isinstance(irrs[0], LevelIrr):
+            level = np.array([irr.level for irr in irrs], dtype=np.int64)
+        metrics = {}
+        if irrs and irrs[0].metrics:
+            metrics = {
+                name: np.array([irr.metrics[name] for irr in irrs], dtype=float)
+                for name in irrs[0].metrics
+            }
+        return cls(
+            np.array(dates, dtype="datetime64[D]"),
+            np.array(values, dtype=float),
+            np.array(entity_code, dtype=np.int32),
+            tuple(codes),
+            annual,
+            day_count,
+            metrics,
+            window,
+            level,
+        )
+
+    @classmethod
+    def from_arrow(cls, table) -> "IrrFrame":
+        """
+        Build a frame from an Arrow table with the columns written by `to_arrow()`, e.g. IRR data read back from the
+        destination. The annual values are kept as read, and the day_count, window and level columns are read when
+        present. Metric columns are left out.
+
+        Args:
+            table (pyarrow.Table): The IRR data, with at least date, irr_monthly, irr_annual and entity_name columns.
+        Returns:
+            IrrFrame: The IRR data held in columns.
+        """
+        import pyarrow as pa
+
+        dates = table.column("date")
+        if not pa.types.is_date(dates.type):
+            dates = dates.cast(pa.date32())
+        names = table.column("entity_name").combine_chunks()
+        if not pa.types.is_dictionary(names.type):
+            names = names.dictionary_encode()
+        day_count = None
+        if "day_count" in table.column_names and table.num_rows:
+            day_count = str(table.column("day_count")[0])
+        window, level = None, None
+        if "window" in table.column_names:
+            window = table.column("window").fill_null(0).to_numpy().astype(np.int64)
+        if "level" in table.column_names:
+            level = table.column("level").to_numpy().astype(np.int64)
+
+        return cls(
+            dates.cast(pa.int32()).to_numpy().astype("datetime64[D]"),
+            table.column("irr_monthly").cast(pa.float64()).to_numpy(),
+            names.indices.to_numpy().astype(np.int32),
+            tuple(names.dictionary.to_pylist()),
+            table.column("irr_annual").cast(pa.float64()).to_numpy(),
+            day_count,
+            None,
+            window,
+            level,
+        )
+
+    @classmethod
+    def from_entities(cls, entities: dict[str:"Entity"]) -> "IrrFrame":
+        """
+        Collect the IRR data of a dictionary of entities into columns.
+
+        Args:
+            entities (dict[str, Entity]): A dictionary of Entity objects with calculated IRR data.
+        Returns:
+            IrrFrame: The IRR data held in columns.
+        """
+        return cls.from_irrs(irr for entity in entities.values() for irr in entity.irrs)
+
+    def __len__(self):
+        return self.entity_code.shape[0]
+
+    @property
+    def irr_annual(self) -> np.ndarray:
+        """
+        Calculate the annualized IRR values based on the monthly values, as `Irr.value_annual` does, unless the
+        annual values of Xirr data are held.
+
+        Returns:
+            np.ndarray: The annualized IRR values (rounded to 4 decimal places).
+        """
+        if self.annual is not None:
+            return self.annual
+        return np.round((1 + self.irr_monthly) ** 12 - 1, 4)
+
+    def to_arrow(self):
+        """
+        Convert the IRR data to an Arrow table with an explicit schema. Entity names, and the day count convention
+        of Xirr data, are kept dictionary encoded.
+
+        Returns:
+            pyarrow.Table: The IRR data, with date, irr_monthly, irr_annual, the other metrics and entity_name
+                           columns, a day_count column for Xirr data, a window column for WindowIrr data, null
+                           since inception, and a level column for LevelIrr data.
+        """
+        import pyarrow as pa
+
+        columns = {
+            "date": pa.array(self.date, type=pa.date32()),
+            "irr_monthly": pa.array(self.irr_monthly, type=pa.float64()),
+            "irr_annual": pa.array(self.irr_annual, type=pa.float64()),
+            **{
+                name: pa.array(column, type=pa.float64())
+                for name, column in self.metrics.items()
+            },
+            "entity_name": pa.DictionaryArray.from_arrays(
+                pa.array(self.entity_code, type=pa.int32()),
+                pa.array(self.entity_names, type=pa.string()),
+            ),
+        }
+        if self.day_count is not None:
+            columns["day_count"] = pa.DictionaryArray.from_arrays(
+                pa.array(np.zeros(len(self), dtype=np.int32)),
+                pa.array([self.day_count], type=pa.string()),
+            )
+        if self.window is not None:
+            columns["window"] = pa.array(
+                self.window, type=pa.int64(), mask=self.window == 0
+            )
+        if self.level is not None:
+            columns["level"] = pa.array(self.level, type=pa.int64())
+        return pa.table(columns)
+
+    def to_dicts(self) -> list[dict]:
+        """
+        Convert the IRR data to dictionaries for serialization, as `Irr.to_dict()` does for each IRR.
+
+        Returns:
+            list[dict]: A dictionary representation of each IRR.
+        """
+        extra = {} if self.day_count is None else {"day_count": self.day_count}
+        names = list(self.metrics)
+        dicts = [
+            {
+                "date": date,
+                "irr_monthly": irr_monthly,
+                "irr_annual": irr_annual,
+                **dict(zip(names, metrics)),
+                "entity_name": self.entity_names[code],
+                **extra,
+            }
+            for date, irr_monthly, irr_annual, code, *metrics in zip(
+                np.datetime_as_string(self.date, unit="D").tolist(),
+                self.irr_monthly.tolist(),
+                self.irr_annual.tolist(),
+                self.entity_code.tolist(),
+                *(column.tolist() for column in self.metrics.values()),
+            )
+        ]
+        if self.window is not None:
+            for row, window in zip(dicts, self.window.tolist()):
+                row["window"] = window or None
+        if self.level is not None:
+            for row, level in zip(dicts, self.level.tolist()):
+                row["level"] = level
+        return dicts
+
+
+PREFIX_PATHS = ("none", "exact", "two_period", "power", "annuity", "unique", "general")
+# the largest exponent of a discount factor, exp(700) being close to the largest float
+MAX_EXPONENT = 700.0
+
+
+def classify_cashflows(values: np.ndarray) -> str:
+    """
+    Classify a cashflow vector by the cheapest way its IRR can be found, checked in this order:
+
+    - "none": no sign change, so no IRR (nan).
+    - "exact": the flows add up to zero, so the IRR is exactly 0.
+    - "two_period": two periods, solved in closed form as CF1 / -CF0 - 1.
+    - "power": a single outflow and a single inflow, solved as a root of their ratio.
+    - "annuity": a flow followed by level payments, the last of them with a balloon of the same sign, which has a
+      single sign change and an NPV evaluated in constant time.
+    - "unique": a single sign change, so a single IRR by Descartes' rule of signs, found by the Halley method.
+    - "general": anything else, left to the general solver.
+
+    Args:
+        values (np.ndarray): The periodic cashflows.
+    Returns:
+        str: One of PREFIX_PATHS.
+    """
+    non_zero = np.flatnonzero(values)
+    if non_zero.shape[0] < 2:
+        return "none"
+    signs = np.sign(values[non_zero])
+    changes = int(np.count_nonzero(signs[1:] != signs[:-1]))
+    if changes == 0:
+        return "none"
+    if values.sum() == 0:
+        return "exact"
+    if non_zero.shape[0] == 2:
+        return "two_period" if values.shape[0] == 2 else "power"
+    if changes > 1:
+        return "general"
+    first, last = int(non_zero[0]), int(non_zero[-1])
+    payments = values[first + 1 : last]
+    if last == values.shape[0] - 1 and np.all(payments == payments[0]):
+        return "annuity"
+    return "unique"
+
+
+def _solve_annuity(
+    values: np.ndarray, guess: float, irr_solver: solver.IrrSolver
+) -> solver.SolverResult:
+    # NPV = c0 + P * a(n, r) + B * (1 + r) ** -n, with a(n, r) = (1 - (1 + r) ** -n) / r, the flows being shifted
+    # so that c0 is at period 0, which does not change the IRR
+    first = int(np.flatnonzero(values)[0])
+    periods = values.shape[0] - 1 - first
+    initial, payment = float(values[first]), float(values[first + 1])
+    balloon = float(values[-1]) - payment
+    rate = float(guess)
+    for iteration in range(1, irr_solver.max_iterations + 1):
+        if abs(rate) < 1e-3:
+            # a(n, r) cancels out near zero, evaluate the flows one by one there
+            npv, slope, _ = solver.npv_derivatives(rate, values[first:])
+        else:
+            # the exponent is clipped so that rates close to -1 overflow to a huge discount, not to inf
+            discount = math.exp(min(-periods * math.log1p(rate), MAX_EXPONENT))
+            annuity = (1.0 - discount) / rate
+            npv = initial + payment * annuity + balloon * discount
+            slope = payment * (
+                periods * discount / (1.0 + rate) - annuity
+            ) / rate - periods * balloon * discount / (1.0 + rate)
+        if slope == 0 or not math.isfinite(slope) or not math.isfinite(npv):
+            break
+        new_rate = rate - npv / slope
+        if new_rate <= -1:
+            new_rate = (rate - 1) / 2
+        if abs(new_rate - rate) < irr_solver.tolerance:
+            if solver.is_root(new_rate, values, irr_solver.tolerance):
+                return solver.SolverResult(new_rate, iteration, True, "annuity")
+            break
+        rate = new_rate
+
+    return irr_solver.solve(values, guess)
+
+
+def solve_cashflows(
+    values: np.ndarray, guess: float = None, irr_solver: solver.IrrSolver = None
+) -> solver.SolverResult:
+    """
+    Calculate the IRR of a cashflow vector through the cheapest path given by `classify_cashflows()`. Closed forms
+    give the same IRR as the general solver, which is used for the "unique" and "general" paths.
+
+    Args:
+        values (np.ndarray): The periodic cashflows.
+        guess (float, optional): The starting rate of iterative paths, usually the IRR of the previous prefix.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance, iteration cap and fallback.
+    Returns:
+        solver.SolverResult: The rate found, whose method names the closed form used, if any.
+    """
+    irr_solver = irr_solver or solver.DEFAULT_SOLVER
+    path = classify_cashflows(values)
+    if path == "none":
+        return solver.SolverResult(math.nan, 0, True, "none")
+    if path == "exact":
+        return solver.SolverResult(0.0, 0, True, "exact")
+    if path in ("two_period", "power"):
+        start, stop = np.flatnonzero(values).tolist()
+        rate = (-values[stop] / values[start]) ** (1 / (stop - start)) - 1
+        return solver.SolverResult(float(rate), 0, True, path)
+    if path == "annuity":
+        if guess is None or not math.isfinite(guess) or guess <= -1:
+            guess = solver.DEFAULT_GUESS
+        return _solve_annuity(values, guess, irr_solver)
+    if path == "unique":
+        # NPV tends to the sign of the first flow as the rate grows, so the IRR is positive when the total differs
+        side = 1 if np.sign(values[values != 0][0]) != np.sign(values.sum()) else -1
+        return irr_solver.solve_side(values, side, guess)
+    return irr_solver.solve(values, guess)
+
+
+def solve_prefixes(
+    flows: np.ndarray,
+    values: np.ndarray,
+    irr_solver: solver.IrrSolver = None,
+    start: int = 1,
+) -> list[solver.SolverResult]:
+    """
+    Calculate the IRR of every prefix of an entity's cashflows, as `IrrSolver.solve_prefixes()` does, but solving
+    each prefix through `solve_cashflows()`.
+
+    Args:
+        flows (np.ndarray): The net flow (outflow - inflow) of each period.
+        values (np.ndarray): The value held at each period.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance, iteration cap and fallback.
+        start (int, optional): The first period solved, the IRRs of the earlier ones being known already.
+    Returns:
+        list[solver.SolverResult]: One result per period from period `start` onwards.
+    """
+    flows = np.asarray(flows, dtype=float)
+    values = np.asarray(values, dtype=float)
+    results = []
+    guess = None
+    for period in range(max(start, 1), flows.shape[0]):
+        periodic_cashflow = flows[: period + 1].copy()
+        periodic_cashflow[period] += values[period]
+        result = solve_cashflows(periodic_cashflow, guess, irr_solver)
+        if math.isfinite(result.rate):
+            guess = result.rate
+        results.append(result)
+
+    return results
+
+
+def solve_windows(
+    flows: np.ndarray,
+    values: np.ndarray,
+    window: int,
+    irr_solver: solver.IrrSolver = None,
+) -> list[solver.SolverResult]:
+    """
+    Calculate the IRR of every trailing window of an entity's cashflows. The window ending at period k opens with
+    the value held at period k - window, entered as a synthetic outflow as if the entity were bought at that value,
+    takes the flows of the following periods and closes with the value held at period k.
+
+    All the windows are laid out at once as rows of a matrix copied from a sliding view of the flows. Each window is
+    then solved on its own through `solve_cashflows()`, which recomputes its NPV from all of its flows at every
+    iteration. Only the starting rate is carried over: each window starts from the IRR of the previous window, which
+    differs from it by one period at each end, so it usually converges in a few iterations.
+
+    Args:
+        flows (np.ndarray): The net flow (outflow - inflow) of each period.
+        values (np.ndarray): The value held at each period.
+        window (int): The number of periods of each window.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance, iteration cap and fallback.
+    Returns:
+        list[solver.SolverResult]: One result per period from period `window` onwards.
+    Raises:
+        ValueError: If the window is not positive.
+    """
+    if window < 1:
+        raise ValueError(f"Windows must be positive, got {window}")
+    flows = np.asarray(flows, dtype=float)
+    values = np.asarray(values, dtype=float)
+    count = flows.shape[0] - window
+    if count < 1:
+        return []
+    windows = np.empty((count, window + 1))
+    windows[:, 1:] = np.lib.stride_tricks.sliding_window_view(flows[1:], window)
+    windows[:, 0] = -values[:count]
+    windows[:, -1] += values[window:]
+    results = []
+    guess = None
+    for periodic_cashflow in windows:
+        result = solve_cashflows(periodic_cashflow, guess, irr_solver)
+        if math.isfinite(result.rate):
+            guess = result.rate
+        results.append(result)
+
+    return results
+
+
 class Entity:
     """
     A class representing an entity with associated cashflows and calculated Internal Rate of Return (IRR) data.
+    The cashflows are either kept as a list of Cashflow objects or, for entities built with `from_frame()`, as a
+    sorted CashflowFrame from which Cashflow objects are only materialised on access.
 
     Args:
         entity_name (str): The name of the entity.
@@ -88,54 +812,249 @@ class Entity:
         entity_name (str): The name of the entity.
         sorted_cashflows (list[Cashflow]): A list of sorted Cashflow objects for the entity.
         irrs (list[Irr]): A list of calculated IRR data.
+    Properties:
+        cashflow_count (int): The number of cashflows of the entity.
     Methods:
+        from_frame(entity_name: str, cashflows: CashflowFrame): Create an entity viewing sorted columnar cashflows.
         add_cashflow(cashflow: Cashflow): Add a Cashflow to the entity's list of cashflows.
-        calculate_irr(): Calculate IRR data based on the entity's cashflows.
+        upsert_cashflow(cashflow: Cashflow): Add a Cashflow, or replace the one of the same date.
+        cashflow_arrays(): Build the flow and value arrays of the entity's cashflows.
+        cashflow_columns(): Build the inflow, outflow and value arrays of the entity's cashflows.
+        cashflow_dates(): List the dates of the entity's cashflows.
+        calculate_irr(irr_solver: solver.IrrSolver): Calculate IRR data based on the entity's cashflows.
+        calculate_window_irrs(windows: tuple[int, ...], irr_solver: solver.IrrSolver): Calculate since-inception
+                                                                                      and trailing window IRR data.
     """
 
     def __init__(self, entity_name: str):
         self.entity_name: str = entity_name
-        self.sorted_cashflows: list[Cashflow] = []
+        self._sorted_cashflows: list[Cashflow] = []
+        self.frame: CashflowFrame = None
         self.irrs: list[Irr] = []
 
+    @classmethod
+    def from_frame(cls, entity_name: str, cashflows: CashflowFrame) -> "Entity":
+        """
+        Create an entity whose cashflows are held by a CashflowFrame already sorted by date.
+
+        Args:
+            entity_name (str): The name of the entity.
+            cashflows (CashflowFrame): The entity's cashflows, sorted by date.
+        Returns:
+            Entity: The entity viewing those cashflows.
+        """
+        entity = cls(entity_name)
+        entity.frame = cashflows
+        return entity
+
+    @property
+    def sorted_cashflows(self) -> list[Cashflow]:
+        if self.frame is not None:
+            return self.frame.to_cashflows()
+        return self._sorted_cashflows
+
+    @sorted_cashflows.setter
+    def sorted_cashflows(self, cashflows: list[Cashflow]):
+        self.frame = None
+        self._sorted_cashflows = cashflows
+
+    @property
+    def cashflow_count(self) -> int:
+        """
+        The number of cashflows of the entity.
+
+        Returns:
+            int: The number of cashflows.
+        """
+        if self.frame is not None:
+            return len(self.frame)
+        return len(self._sorted_cashflows)
+
     def add_cashflow(self, cashflow: Cashflow):
         """
-        Add a Cashflow to the entity's list of cashflows and ensure the list remains sorted by date.
+        Add a Cashflow to the entity's list of cashflows and ensure the list remains sorted by date. Its position is
+        found by binary search, after the cashflows of the same date, instead of sorting the list again.
 
         Args:
             cashflow (Cashflow): The Cashflow to add.
         """
-        self.sorted_cashflows.append(cashflow)
-        self.sorted_cashflows = sorted(self.sorted_cashflows)
+        if self.frame is not None:
+            self.sorted_cashflows = self.frame.to_cashflows()
+        bisect.insort_right(self._sorted_cashflows, cashflow)
+
+    def upsert_cashflow(self, cashflow: Cashflow):
+        """
+        Add a Cashflow to the entity's sorted list of cashflows, or replace the cashflow of the same date, e.g. when
+        a booked cashflow is corrected. Its position is found by binary search.
+
+        Args:
+            cashflow (Cashflow): The Cashflow to add or to replace the one of its date with.
+        """
+        if self.frame is not None:
+            self.sorted_cashflows = self.frame.to_cashflows()
+        cashflows = self._sorted_cashflows
+        position = bisect.bisect_left(cashflows, cashflow)
+        if (
+            cashflow.date is not None
+            and position < len(cashflows)
+            and cashflows[position].date == cashflow.date
+        ):
+            cashflows[position] = cashflow
+        else:
+            cashflows.insert(position, cashflow)
+
+    def cashflow_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Build the arrays the IRR solvers work on from the entity's sorted cashflows.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The net flow (outflow - inflow) and the value of each cashflow.
+        """
+        if self.frame is not None:
+            return self.frame.outflow - self.frame.inflow, self.frame.value
+        flows = np.array(
+            [cashflow.outflow - cashflow.inflow for cashflow in self.sorted_cashflows],
+            dtype=float,
+        )
+        values = np.array(
+            [cashflow.value for cashflow in self.sorted_cashflows], dtype=float
+        )
+        return flows, values
+
+    def cashflow_columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Build the inflow, outflow and value arrays of the entity's sorted cashflows.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: The inflow, the outflow and the value of each cashflow.
+        """
+        if self.frame is not None:
+            return self.frame.inflow, self.frame.outflow, self.frame.value
+        cashflows = self.sorted_cashflows
+        return (
+            np.array([cashflow.inflow for cashflow in cashflows], dtype=float),
+            np.array([cashflow.outflow for cashflow in cashflows], dtype=float),
+            np.array([cashflow.value for cashflow in cashflows], dtype=float),
+        )
+
+    def cashflow_dates(self) -> list:
+        """
+        List the dates of the entity's sorted cashflows.
+
+        Returns:
+            list: The date of each cashflow.
+        """
+        if self.frame is not None:
+            return self.frame.dates()
+        return [cashflow.date for cashflow in self._sorted_cashflows]
 
-    def calculate_irr(self):
+    def calculate_irr(
+        self,
+        irr_solver: solver.IrrSolver = None,
+        instrumentation: instrumentation.Instrumentation = None,
+        cache=None,
+        since: dt.date = None,
+    ):
         """
         Calculate IRR data based on the entity's sorted cashflows. This method calculates IRR based on cashflows and
-        stores the results in the 'irrs' attribute.
+        stores the results in the 'irrs' attribute. Each period is solved starting from the IRR of the previous one.
+        The IRR of a period only depends on the cashflows up to it, so when only the cashflows from a date onwards
+        changed, `since` restricts the calculation to the periods from that date onwards.
+
+        If there are not enough cashflows for calculation, a message is logged.
 
-        If there are not enough cashflows for calculation, a message is printed.
+        Args:
+            irr_solver (solver.IrrSolver, optional): The solver to use. Defaults to solver.DEFAULT_SOLVER.
+            instrumentation (instrumentation.Instrumentation, optional): Where to report the solver results and the
+                                                                         time spent.
+            cache (cache.IrrCache, optional): The memo of IRRs consulted before solving a period. It is built for a
+                                              solver, which replaces `irr_solver`.
+            since (datetime.date, optional): Only calculate the IRR data dated on or after this date.
         """
         self.irrs = []
-        if self.sorted_cashflows.__len__() < 2:
-            print(f"Not enough values for {self.entity_name}")
-            # raise Exception("Not enough values")
-            # todo: make this to be logged
+        if instrumentation is not None:
+            start = time.perf_counter()
+        results = []
+        if self.cashflow_count < 2:
+            logger.info("Not enough values for %s", self.entity_name)
         else:
-            periodic_cashflow = [
-                self.sorted_cashflows[0].outflow - self.sorted_cashflows[0].inflow
-            ]
-            for cashflow in self.sorted_cashflows[1:]:
-                periodic_cashflow.append(
-                    cashflow.value + cashflow.outflow - cashflow.inflow
+            flows, values = self.cashflow_arrays()
+            dates = self.cashflow_dates()
+            first_period = 1
+            if since is not None:
+                # missing dates are sorted first
+                first_period = max(
+                    bisect.bisect_left(
+                        dates, since, key=lambda date: date or dt.date.min
+                    ),
+                    1,
                 )
+            if cache is not None:
+                results = cache.solve_prefixes(flows, values)[first_period - 1 :]
+            else:
+                results = solve_prefixes(flows, values, irr_solver, first_period)
+            for date, result in zip(dates[first_period:], results):
                 self.irrs.append(
-                    Irr(
-                        cashflow.date,
-                        round(npf.irr(periodic_cashflow), 4),
-                        self.entity_name,
-                    )
+                    Irr(date, round(result.rate, IRR_DIGITS), self.entity_name)
                 )
-                periodic_cashflow[-1] = cashflow.outflow - cashflow.inflow
+        if instrumentation is not None:
+            instrumentation.entity_solved(
+                self.entity_name,
+                self.cashflow_count,
+                results,
+                time.perf_counter() - start,
+            )
+
+    def calculate_window_irrs(
+        self,
+        windows: tuple[int, ...] = DEFAULT_WINDOWS,
+        irr_solver: solver.IrrSolver = None,
+        instrumentation: instrumentation.Instrumentation = None,
+    ):
+        """
+        Calculate since-inception IRR data, as `calculate_irr()` does, followed by the IRR data of each trailing
+        window of months ending at every date from the end of the first window onwards (see `solve_windows()`).
+        Every IRR is a WindowIrr, with no window since inception.
+
+        Args:
+            windows (tuple[int, ...], optional): The number of months of each trailing window.
+            irr_solver (solver.IrrSolver, optional): The solver to use. Defaults to solver.DEFAULT_SOLVER.
+            instrumentation (instrumentation.Instrumentation, optional): Where to report the solver results and the
+                                                                         time spent.
+        Raises:
+            ValueError: If a window is not positive.
+        """
+        self.irrs = []
+        if instrumentation is not None:
+            start = time.perf_counter()
+        results = []
+        if self.cashflow_count < 2:
+            logger.info("Not enough values for %s", self.entity_name)
+        else:
+            flows, values = self.cashflow_arrays()
+            dates = self.cashflow_dates()
+            for window in (None, *windows):
+                if window is None:
+                    window_results = solve_prefixes(flows, values, irr_solver)
+                else:
+                    window_results = solve_windows(flows, values, window, irr_solver)
+                for date, result in zip(dates[window or 1 :], window_results):
+                    self.irrs.append(
+                        WindowIrr(
+                            date,
+                            round(result.rate, IRR_DIGITS),
+                            self.entity_name,
+                            window=window,
+                        )
+                    )
+                results += window_results
+        if instrumentation is not None:
+            instrumentation.entity_solved(
+                self.entity_name,
+                self.cashflow_count,
+                results,
+                time.perf_counter() - start,
+            )
 
     def __eq__(self, other):
         if not isinstance(other, Entity):
@@ -146,38 +1065,289 @@ class Entity:
         return hash(self.entity_name)
 
 
-def allocate_cashflows_to_entities(
-    cashflows: list[Cashflow], entities: dict[str:Entity]
-):
+def calculate_irrs(
+    entities: dict[str:Entity],
+    irr_solver: solver.IrrSolver = None,
+    instrumentation: instrumentation.Instrumentation = None,
+    cache=None,
+) -> dict[str:Entity]:
+    """
+    Calculate IRR data for every entity, one entity at a time. This is the default calculation strategy of the IRR
+    pipeline.
+
+    Args:
+        entities (dict[str, Entity]): A dictionary of entities where keys are entity names, and values are Entity
+                                      objects.
+        irr_solver (solver.IrrSolver, optional): The solver to use. Defaults to solver.DEFAULT_SOLVER.
+        instrumentation (instrumentation.Instrumentation, optional): Where to report the solver results of each
+                                                                     entity.
+        cache (cache.IrrCache, optional): The memo of IRRs consulted before solving, flushed once every entity is
+                                          calculated.
+    Returns:
+        dict[str, Entity]: A dictionary of entities with updated IRR data.
+    """
+    for entity in entities.values():
+        entity.calculate_irr(irr_solver, instrumentation, cache)
+    if cache is not None:
+        cache.flush()
+
+    return entities
+
+
+def calculate_window_irrs(
+    entities: dict[str:Entity],
+    windows: tuple[int, ...] = DEFAULT_WINDOWS,
+    irr_solver: solver.IrrSolver = None,
+    instrumentation: instrumentation.Instrumentation = None,
+) -> dict[str:Entity]:
     """
-    Allocate cashflows to entities based on the entity names.
+    Calculate since-inception and trailing window IRR data for every entity, one entity at a time. This is a
+    calculation strategy for the IRR pipeline producing WindowIrr objects.
 
     Args:
-        cashflows (list[Cashflow]): A list of Cashflow objects to be allocated to entities.
         entities (dict[str, Entity]): A dictionary of entities where keys are entity names, and values are Entity
                                       objects.
+        windows (tuple[int, ...], optional): The number of months of each trailing window.
+        irr_solver (solver.IrrSolver, optional): The solver to use. Defaults to solver.DEFAULT_SOLVER.
+        instrumentation (instrumentation.Instrumentation, optional): Where to report the solver results of each
+                                                                     entity.
     Returns:
-        dict[str, Entity]: A dictionary of entities with updated cashflow data.
+        dict[str, Entity]: A dictionary of entities with updated IRR data.
+    Raises:
+        ValueError: If a window is not positive.
     """
-    for cashflow in cashflows:
-        entities[cashflow.entity_name].add_cashflow(cashflow)
-    # todo: get an except catcher for KeyError!?
+    for entity in entities.values():
+        entity.calculate_window_irrs(windows, irr_solver, instrumentation)
 
     return entities
 
 
-def entities_collection_creation(cashflows: list[Cashflow]) -> dict[str:Entity]:
+def iter_entities(cashflows: Iterable[Cashflow]) -> Iterator[Entity]:
     """
-    Create a collection of entities based on the provided list of cashflows.
+    Create entities from a stream of cashflows ordered by entity name and then by date. Each entity is yielded as
+    soon as its last cashflow has been read, so only one entity's cashflows are held in memory at a time.
 
     Args:
-        cashflows (list[Cashflow]): A list of Cashflow objects from which entities will be created.
+        cashflows (Iterable[Cashflow]): The cashflows, ordered by entity name and then by date.
+    Yields:
+        Entity: The entities, in order, holding their sorted cashflows.
+    Raises:
+        ValueError: If the cashflows are not ordered by entity name.
+    """
+    previous_name = None
+    for entity_name, entity_cashflows in itertools.groupby(
+        cashflows, key=lambda cashflow: cashflow.entity_name
+    ):
+        if previous_name is not None and entity_name <= previous_name:
+            raise ValueError(
+                f"Cashflows are not ordered by entity name: {entity_name} after {previous_name}"
+            )
+        previous_name = entity_name
+        entity = Entity(entity_name)
+        entity.sorted_cashflows = list(entity_cashflows)
+        yield entity
+
+
+@dataclass(frozen=True)
+class IngestionIssue:
+    """
+    A data class representing a data quality problem found while ingesting cashflows.
+
+    Attributes:
+        kind (str): The kind of problem: "null_date", "unknown_entity" or "duplicate_date".
+        entity_name (str): The name of the entity concerned.
+        date (datetime.date): The date concerned, None when the problem is not about a given date.
+        rows (int): The number of cashflow rows concerned.
+    """
+
+    kind: str
+    entity_name: str
+    date: dt.date
+    rows: int
+
+
+@dataclass
+class IngestionReport:
+    """
+    A data class collecting the problems found while ingesting cashflows. Rows with a null date or an unknown
+    entity are left out of the entities, rows sharing a date are kept in their original order.
+
+    Attributes:
+        issues (list[IngestionIssue]): The problems found.
+    Properties:
+        null_dates (list[IngestionIssue]): The entities with rows without date.
+        unknown_entities (list[IngestionIssue]): The entities that were not expected.
+        duplicate_dates (list[IngestionIssue]): The entity dates with more than one row.
+    """
+
+    issues: list[IngestionIssue] = field(default_factory=list)
+
+    @property
+    def null_dates(self) -> list[IngestionIssue]:
+        return [issue for issue in self.issues if issue.kind == "null_date"]
+
+    @property
+    def unknown_entities(self) -> list[IngestionIssue]:
+        return [issue for issue in self.issues if issue.kind == "unknown_entity"]
+
+    @property
+    def duplicate_dates(self) -> list[IngestionIssue]:
+        return [issue for issue in self.issues if issue.kind == "duplicate_date"]
+
+
+def _count_issues(
+    kind: str, frame: CashflowFrame, mask: np.ndarray
+) -> list[IngestionIssue]:
+    codes, rows = np.unique(frame.entity_code[mask], return_counts=True)
+    return [
+        IngestionIssue(kind, frame.entity_names[code], None, count)
+        for code, count in zip(codes.tolist(), rows.tolist())
+    ]
+
+
+def sort_cashflows(
+    cashflows: CashflowFrame, entity_names=None
+) -> tuple[CashflowFrame, IngestionReport]:
+    """
+    Allocate columnar cashflows to their entities: rows with problems are left out or reported, and the remaining
+    rows are sorted once by entity and date, so that the cashflows of each entity are contiguous.
+
+    Args:
+        cashflows (CashflowFrame): The cashflows to sort, in any order.
+        entity_names (Iterable[str], optional): The expected entities. Rows of any other entity are reported as
+                                                unknown and left out. By default every entity is expected.
+    Returns:
+        tuple[CashflowFrame, IngestionReport]: The sorted cashflows and the problems found.
+    """
+    report = IngestionReport()
+    keep = np.ones(len(cashflows), dtype=bool)
+
+    null_dates = np.isnat(cashflows.date)
+    if null_dates.any():
+        report.issues.extend(_count_issues("null_date", cashflows, null_dates))
+        keep &= ~null_dates
+
+    if entity_names is not None:
+        expected = set(entity_names)
+        known_codes = np.array(
+            [name in expected for name in cashflows.entity_names], dtype=bool
+        )
+        unknown = ~known_codes[cashflows.entity_code]
+        if unknown.any():
+            report.issues.extend(_count_issues("unknown_entity", cashflows, unknown))
+            keep &= ~unknown
+
+    frame = (cashflows if keep.all() else cashflows.take(keep)).sort()
+
+    repeated = (np.diff(frame.entity_code) == 0) & (np.diff(frame.date) == 0)
+    if repeated.any():
+        starts = np.flatnonzero(repeated & ~np.concatenate(([False], repeated[:-1])))
+        for start in starts.tolist():
+            stop = start + 1
+            while stop < repeated.shape[0] and repeated[stop]:
+                stop += 1
+            report.issues.append(
+                IngestionIssue(
+                    "duplicate_date",
+                    frame.entity_names[frame.entity_code[start]],
+                    frame.date[start].astype(object),
+                    stop - start + 1,
+                )
+            )
+
+    return frame, report
+
+
+def create_entities(cashflows: CashflowFrame) -> dict[str:Entity]:
+    """
+    Create the collection of entities from cashflows sorted by `sort_cashflows()`. Each entity gets a view on its
+    contiguous range of rows.
+
+    Args:
+        cashflows (CashflowFrame): The cashflows, sorted by entity and date.
     Returns:
         dict[str, Entity]: A dictionary of entities with entity names as keys and corresponding Entity objects.
     """
-    entities = {}
-    entity_names = tuple([cashflow.entity_name for cashflow in cashflows])
-    for entity_name in entity_names:
-        entities[entity_name] = Entity(entity_name)
+    return {
+        entity_name: Entity.from_frame(entity_name, entity_frame)
+        for entity_name, entity_frame in cashflows.groups()
+    }
 
-    return entities
+
+def ingest_cashflows(
+    cashflows: CashflowFrame, entity_names=None
+) -> tuple[dict[str:Entity], IngestionReport]:
+    """
+    Create the collection of entities from columnar cashflows in a single pass: rows are sorted once by entity and
+    date, and each entity gets a view on its contiguous range of rows. Problems in the data are reported instead of
+    raised.
+
+    Args:
+        cashflows (CashflowFrame): The cashflows to ingest, in any order.
+        entity_names (Iterable[str], optional): The expected entities. Rows of any other entity are reported as
+                                                unknown and left out. By default every entity is expected.
+    Returns:
+        tuple[dict[str, Entity], IngestionReport]: A dictionary of entities with entity names as keys and
+                                                   corresponding Entity objects, and the problems found.
+    """
+    frame, report = sort_cashflows(cashflows, entity_names)
+
+    return create_entities(frame), report
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """
+    A data class summarising the cashflows of an entity, used to detect entities whose cashflows changed between
+    two runs.
+
+    Attributes:
+        row_count (int): The number of cashflows.
+        max_date (datetime.date): The date of the latest cashflow.
+        content_hash (str): A hash of the content of the cashflows, independent of their order.
+    """
+
+    row_count: int
+    max_date: dt.date
+    content_hash: str
+
+
+def fingerprint_cashflows(cashflows: CashflowFrame) -> dict[str:Fingerprint]:
+    """
+    Calculate the fingerprint of every entity's cashflows.
+
+    Args:
+        cashflows (CashflowFrame): The cashflows of the entities, in any order.
+    Returns:
+        dict[str, Fingerprint]: The fingerprint of each entity, keyed by entity name.
+    """
+    # sorting on every column makes the hash independent of the order rows are read in, and leaves the latest
+    # date last in each entity
+    frame = cashflows.take(
+        np.lexsort(
+            (
+                cashflows.value,
+                cashflows.outflow,
+                cashflows.inflow,
+                cashflows.date.astype(np.int64),
+                cashflows.entity_code,
+            )
+        )
+    )
+    fingerprints = {}
+    for entity_name, entity_frame in frame.groups():
+        content = hashlib.blake2b(digest_size=16)
+        for column in (
+            entity_frame.date.astype(np.int64),
+            entity_frame.inflow,
+            entity_frame.outflow,
+            entity_frame.value,
+        ):
+            content.update(np.ascontiguousarray(column).tobytes())
+        fingerprints[entity_name] = Fingerprint(
+            len(entity_frame),
+            entity_frame.date[-1].astype(object),
+            content.hexdigest(),
+        )
+
+    return fingerprints
@@ -0,0 +1,121 @@
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+import math
+import os
+import numpy as np
+import batch
+import model
+import solver
+
+DEFAULT_CHUNK_PERIODS = 200_000
+
+
+def balance_chunks(period_counts: list[int], chunk_count: int) -> list[list[int]]:
+    """
+    Split entities into chunks of similar total number of periods, assigning the longest entities first to the
+    chunk with the fewest periods so far. Ties are broken by position, so the split only depends on its inputs.
+
+    Args:
+        period_counts (list[int]): The number of periods of each entity.
+        chunk_count (int): The number of chunks to create.
+    Returns:
+        list[list[int]]: The positions of the entities of each non empty chunk, in ascending order.
+    """
+    chunks = [[] for _ in range(chunk_count)]
+    loads = [(0, chunk) for chunk in range(chunk_count)]
+    for position in sorted(
+        range(len(period_counts)), key=lambda position: -period_counts[position]
+    ):
+        load, chunk = heapq.heappop(loads)
+        chunks[chunk].append(position)
+        heapq.heappush(loads, (load + period_counts[position], chunk))
+
+    return [sorted(chunk) for chunk in chunks if chunk]
+
+
+def _solve_chunk(
+    flows: np.ndarray,
+    values: np.ndarray,
+    lengths: np.ndarray,
+    irr_solver: solver.IrrSolver,
+) -> np.ndarray:
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    packed_flows = np.zeros((lengths.shape[0], int(lengths.max())))
+    packed_values = np.zeros_like(packed_flows)
+    for row in range(lengths.shape[0]):
+        packed_flows[row, : lengths[row]] = flows[offsets[row] : offsets[row + 1]]
+        packed_values[row, : lengths[row]] = values[offsets[row] : offsets[row + 1]]
+    rates = batch.solve_periods(packed_flows, packed_values, lengths, irr_solver)
+
+    return rates[np.arange(packed_flows.shape[1]) < lengths[:, None]]
+
+
+def calculate_irrs(
+    entities: dict[str : model.Entity],
+    irr_solver: solver.IrrSolver = None,
+    workers: int = None,
+    chunk_periods: int = DEFAULT_CHUNK_PERIODS,
+) -> dict[str : model.Entity]:
+    """
+    Calculate IRR data for all entities in a pool of processes. Entities are split into chunks balanced by their
+    number of periods, and each chunk is sent to a worker as flat flow, value and length arrays, solved with the
+    batch engine. The results do not depend on the number of workers. Use `functools.partial` to set workers or
+    chunk size when passing it as the calculation strategy of the IRR pipeline.
+
+    Args:
+        entities (dict[str, model.Entity]): A dictionary of entities where keys are entity names, and values are
+                                            Entity objects.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance, iteration cap and fallback.
+        workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+        chunk_periods (int, optional): The target number of periods of a chunk. More chunks than workers are
+                                       created when the entities hold more periods than workers x chunk_periods.
+    Returns:
+        dict[str, model.Entity]: A dictionary of entities with updated IRR data.
+    """
+    irr_solver = irr_solver or solver.DEFAULT_SOLVER
+    workers = workers or os.cpu_count() or 1
+    solvable = []
+    for entity in entities.values():
+        if entity.cashflow_count < 2:
+            entity.calculate_irr(irr_solver)
+        else:
+            solvable.append(entity)
+    if not solvable:
+        return entities
+
+    arrays = [entity.cashflow_arrays() for entity in solvable]
+    lengths = np.array([entity.cashflow_count for entity in solvable], dtype=int)
+    chunk_count = min(
+        len(solvable), max(workers, math.ceil(lengths.sum() / chunk_periods))
+    )
+    chunks = balance_chunks(lengths.tolist(), chunk_count)
+    payloads = [
+        (
+            np.concatenate([arrays[position][0] for position in chunk]),
+            np.concatenate([arrays[position][1] for position in chunk]),
+            lengths[chunk],
+            irr_solver,
+        )
+        for chunk in chunks
+    ]
+
+    if workers == 1 or len(payloads) == 1:
+        results = [_solve_chunk(*payload) for payload in payloads]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(payloads))) as executor:
+            results = list(executor.map(_solve_chunk, *zip(*payloads)))
+
+    for chunk, rates in zip(chunks, results):
+        offset = 0
+        for position in chunk:
+            entity = solvable[position]
+            entity_rates = rates[offset : offset + lengths[position]]
+            offset += lengths[position]
+            entity.irrs = [
+                model.Irr(
+                    date, round(float(rate), model.IRR_DIGITS), entity.entity_name
+                )
+                for date, rate in zip(entity.cashflow_dates()[1:], entity_rates[1:])
+            ]
+
+    return entities
@@ -1,8 +1,106 @@
 from abc import ABC, abstractmethod
-from google.cloud import bigquery
+import datetime as dt
+import importlib
+import importlib.util
+import io
+import itertools
+import os
+from typing import Iterable, Iterator
+import uuid
+import numpy as np
 import model
 
 
+class LazyModule:
+    """
+    A module imported on first attribute access instead of at import time, so that the processes which never use
+    it, e.g. local runs on files, do not pay for it, and a Cloud Function instance pays for it once, on the first
+    invocation that needs it.
+
+    Args:
+        name (str): The name of the module.
+        submodules (str): The submodules imported along with it, read as its attributes.
+    """
+
+    def __init__(self, name: str, *submodules: str):
+        self.name = name
+        self.submodules = submodules
+        self.module = None
+
+    def __getattr__(self, attribute: str):
+        if self.module is None:
+            for submodule in self.submodules:
+                importlib.import_module(f"{self.name}.{submodule}")
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attribute)
+
+
+bigquery = LazyModule("google.cloud.bigquery")
+api_exceptions = LazyModule("google.api_core.exceptions")
+# pyarrow is optional, only looked up here, so that it is imported by the first read or load of Arrow data
+pyarrow = (
+    LazyModule("pyarrow", "csv", "parquet")
+    if importlib.util.find_spec("pyarrow") is not None
+    else None
+)
+
+IRR_COLUMNS = (
+    ("date", "DATE"),
+    ("irr_monthly", "FLOAT64"),
+    ("irr_annual", "FLOAT64"),
+    ("entity_name", "STRING"),
+)
+STATE_COLUMNS = (
+    ("entity_name", "STRING"),
+    ("row_count", "INT64"),
+    ("max_date", "DATE"),
+    ("content_hash", "STRING"),
+)
+FRAME_COLUMNS = ("date", "inflow", "outflow", "value", "entity_code", "entity_names")
+
+
+def irr_schema(
+    metrics: list[str] = (),
+    day_count: bool = False,
+    window: bool = False,
+    level: bool = False,
+) -> list:
+    """
+    Build the schema of IRR data with extra metric columns next to irr_monthly and irr_annual, as
+    `model.IrrFrame.to_arrow()` lays them out, with the day count convention column of Xirr data, the window
+    column of WindowIrr data and the level column of LevelIrr data.
+
+    Args:
+        metrics (list[str], optional): The names of the metric columns.
+        day_count (bool, optional): Whether the data is Xirr data.
+        window (bool, optional): Whether the data is WindowIrr data.
+        level (bool, optional): Whether the data is LevelIrr data.
+    Returns:
+        list[bigquery.SchemaField]: The schema.
+    """
+    columns = (
+        IRR_COLUMNS[:3]
+        + tuple((name, "FLOAT64") for name in metrics)
+        + IRR_COLUMNS[3:]
+        + ((("day_count", "STRING"),) if day_count else ())
+        + ((("window", "INT64"),) if window else ())
+        + ((("level", "INT64"),) if level else ())
+    )
+    return [bigquery.SchemaField(name, field_type) for name, field_type in columns]
+
+
+def state_schema() -> list:
+    """
+    Build the schema of the state table of delta runs.
+
+    Returns:
+        list[bigquery.SchemaField]: The schema.
+    """
+    return [
+        bigquery.SchemaField(name, field_type) for name, field_type in STATE_COLUMNS
+    ]
+
+
 class AbstractRepository(ABC):
     """
     An abstract base class for repository interfaces that define methods to interact with a data source.
@@ -11,14 +109,31 @@ class AbstractRepository(ABC):
 
     Methods:
         get_cashflows: Abstract method for retrieving cashflows from the repository.
+        get_cashflow_frame: Method for retrieving cashflows from the repository as a CashflowFrame.
+        get_hierarchy: Method for retrieving the parent group of each entity and group.
+        get_irr_frame: Method for retrieving the IRR data loaded into the repository.
+        get_irrs_version: Method for identifying the IRR data loaded into the repository.
         load_irrs: Abstract method for loading Internal Rate of Return (IRR) data into the repository.
+        get_fingerprints: Method for retrieving the current fingerprint of every entity's cashflows.
+        get_state: Method for retrieving the fingerprints saved by the last delta run.
+        save_state: Method for saving the fingerprints of a delta run.
+        upsert_irrs: Method for replacing the IRR data of some entities.
+        iter_cashflows: Method for streaming cashflows ordered by entity name and date.
+        load_irrs_batches: Method for loading IRR data streamed in batches.
+        load_shard_irrs: Method for staging the IRR data of a shard of a sharded run.
+        get_staged_shards: Method for listing the shards of a sharded run whose IRR data is staged.
+        merge_shards: Method for replacing the IRR data with the staged IRR data of every shard of a run.
     """
 
     @abstractmethod
-    def get_cashflows(self) -> list[model.Cashflow]:
+    def get_cashflows(self, entity_names: list[str] = None) -> list[model.Cashflow]:
         """
         Abstract method for retrieving cashflows from the repository.
 
+        Args:
+            entity_names (list[str], optional): Only retrieve the cashflows of these entities. By default all
+                                                cashflows are retrieved.
+
         Returns:
             A list of Cashflow objects representing the cashflows.
 
@@ -27,6 +142,20 @@ class AbstractRepository(ABC):
         """
         raise NotImplementedError
 
+    def get_cashflow_frame(self, entity_names: list[str] = None) -> model.CashflowFrame:
+        """
+        Retrieve cashflows from the repository as a columnar CashflowFrame. Repositories that can build the columns
+        directly should override this method, the default converts the result of `get_cashflows()`.
+
+        Args:
+            entity_names (list[str], optional): Only retrieve the cashflows of these entities. By default all
+                                                cashflows are retrieved.
+
+        Returns:
+            model.CashflowFrame: The cashflows held in columns.
+        """
+        return model.CashflowFrame.from_cashflows(self.get_cashflows(entity_names))
+
     @abstractmethod
     def load_irrs(self, entities: dict[str : model.Entity]):
         """
@@ -41,6 +170,601 @@ class AbstractRepository(ABC):
         """
         raise NotImplementedError
 
+    def get_hierarchy(self) -> dict[str:str]:
+        """
+        Method for retrieving the hierarchy of entities, in which entities belong to groups, e.g. funds, and groups
+        to higher groups, e.g. strategies and the total book.
+
+        Returns:
+            dict[str, str]: The name of the parent group of each entity and group, keyed by their name.
+
+        Raises:
+            NotImplementedError: Repositories supporting hierarchical runs should implement this method.
+        """
+        raise NotImplementedError
+
+    def get_irr_frame(self) -> model.IrrFrame:
+        """
+        Method for retrieving the IRR data loaded into the repository, e.g. to serve lookups.
+
+        Returns:
+            model.IrrFrame: The IRR data held in columns.
+
+        Raises:
+            NotImplementedError: Repositories supporting IRR lookups should implement this method.
+        """
+        raise NotImplementedError
+
+    def get_irrs_version(self) -> str:
+        """
+        Method for identifying the IRR data loaded into the repository, cheaply enough to be called before each
+        lookup, so that readers know when a newer run replaced or updated it.
+
+        Returns:
+            str: A value which changes whenever IRR data is loaded, None when there is no IRR data.
+
+        Raises:
+            NotImplementedError: Repositories supporting IRR lookups should implement this method.
+        """
+        raise NotImplementedError
+
+    def get_fingerprints(self) -> dict[str : model.Fingerprint]:
+        """
+        Method for retrieving the current fingerprint of every entity's cashflows, used by delta runs to detect the
+        entities whose cashflows changed.
+
+        Returns:
+            dict[str, model.Fingerprint]: The fingerprint of each entity, keyed by entity name.
+
+        Raises:
+            NotImplementedError: Repositories supporting delta runs should implement this method.
+        """
+        raise NotImplementedError
+
+    def get_state(self) -> dict[str : model.Fingerprint]:
+        """
+        Method for retrieving the fingerprints saved by the last delta run.
+
+        Returns:
+            dict[str, model.Fingerprint]: The fingerprint of each entity, keyed by entity name. Empty when no delta
+                                          run has been saved yet.
+
+        Raises:
+            NotImplementedError: Repositories supporting delta runs should implement this method.
+        """
+        raise NotImplementedError
+
+    def save_state(
+        self, fingerprints: dict[str : model.Fingerprint], removed: list[str]
+    ):
+        """
+        Method for saving the fingerprints of a delta run.
+
+        Args:
+            fingerprints (dict[str, model.Fingerprint]): The fingerprints of the entities recomputed, which replace
+                                                         the saved ones.
+            removed (list[str]): The entities which no longer have cashflows, whose fingerprints are deleted.
+
+        Raises:
+            NotImplementedError: Repositories supporting delta runs should implement this method.
+        """
+        raise NotImplementedError
+
+    def upsert_irrs(
+        self,
+        entities: dict[str : model.Entity],
+        entity_names: list[str],
+        since: dict[str : dt.date] = None,
+    ):
+        """
+        Method for replacing the IRR data of some entities, leaving the IRR data of any other entity untouched.
+
+        Args:
+            entities (dict): A dictionary of Entity objects whose IRR data will be loaded.
+            entity_names (list[str]): The entities whose IRR data is replaced. Entities in this list but not in
+                                      `entities` end up without IRR data.
+            since (dict[str, datetime.date], optional): For the entities in this dictionary, only the IRR data dated
+                                                        on or after their date is replaced, e.g. by event-driven
+                                                        updates. The IRR data of the entities must be the one from
+                                                        that date onwards.
+
+        Raises:
+            NotImplementedError: Repositories supporting delta runs should implement this method.
+        """
+        raise NotImplementedError
+
+    def iter_cashflows(self) -> Iterator[model.Cashflow]:
+        """
+        Method for streaming cashflows ordered by entity name and then by date, without holding them all in memory.
+
+        Returns:
+            Iterator[model.Cashflow]: The cashflows, in order.
+
+        Raises:
+            NotImplementedError: Repositories supporting streaming runs should implement this method.
+        """
+        raise NotImplementedError
+
+    def load_irrs_batches(self, batches: Iterable[list[model.Irr]]):
+        """
+        Method for loading IRR data streamed in batches, replacing the IRR data held by the repository. Batches are
+        consumed one at a time as they are produced.
+
+        Args:
+            batches (Iterable[list[model.Irr]]): The batches of IRR data to load.
+
+        Raises:
+            NotImplementedError: Repositories supporting streaming runs should implement this method.
+        """
+        raise NotImplementedError
+
+    def load_shard_irrs(
+        self, run_id: str, shard: int, entities: dict[str : model.Entity]
+    ):
+        """
+        Method for staging the IRR data of a shard of a sharded run, replacing the data staged by a previous attempt
+        of the same shard.
+
+        Args:
+            run_id (str): The identifier of the run.
+            shard (int): The position of the shard.
+            entities (dict): A dictionary of Entity objects whose IRR data will be staged.
+
+        Raises:
+            NotImplementedError: Repositories supporting sharded runs should implement this method.
+        """
+        raise NotImplementedError
+
+    def get_staged_shards(self, run_id: str) -> set[int]:
+        """
+        Method for listing the shards of a sharded run whose IRR data is staged.
+
+        Args:
+            run_id (str): The identifier of the run.
+
+        Returns:
+            set[int]: The positions of the staged shards.
+
+        Raises:
+            NotImplementedError: Repositories supporting sharded runs should implement this method.
+        """
+        raise NotImplementedError
+
+    def merge_shards(self, run_id: str, shard_count: int):
+        """
+        Method for replacing the IRR data held by the repository with the staged IRR data of every shard of a run,
+        and for removing the staged data.
+
+        Args:
+            run_id (str): The identifier of the run.
+            shard_count (int): The number of shards of the run.
+
+        Raises:
+            NotImplementedError: Repositories supporting sharded runs should implement this method.
+        """
+        raise NotImplementedError
+
+
+class InMemoryRepository(AbstractRepository):
+    """
+    A concrete implementation of the AbstractRepository that keeps cashflows and Internal Rate of Return (IRR) data
+    in memory. It is meant for tests, benchmarks and local runs.
+
+    Args:
+        cashflows (list[model.Cashflow], optional): The cashflows held by the repository.
+        hierarchy (dict[str, str], optional): The parent group of each entity and group.
+
+    Attributes:
+        cashflows (list[model.Cashflow]): The cashflows held by the repository.
+        hierarchy (dict[str, str]): The parent group of each entity and group.
+        irrs (list[model.Irr]): The IRR data loaded into the repository.
+        irrs_version (int): The number of times IRR data was loaded.
+        state (dict[str, model.Fingerprint]): The fingerprints saved by the last delta run.
+        staging (dict[str, dict[int, list[model.Irr]]]): The IRR data staged by each shard of each sharded run.
+    """
+
+    def __init__(
+        self, cashflows: list[model.Cashflow] = None, hierarchy: dict[str:str] = None
+    ):
+        self.cashflows = list(cashflows or [])
+        self.hierarchy = dict(hierarchy or {})
+        self.irrs = []
+        self.irrs_version = 0
+        self.state = {}
+        self.staging = {}
+
+    def get_cashflows(self, entity_names: list[str] = None) -> list[model.Cashflow]:
+        """
+        Retrieve the cashflows held by the repository.
+
+        Args:
+            entity_names (list[str], optional): Only retrieve the cashflows of these entities.
+
+        Returns:
+            list[model.Cashflow]: A list of Cashflow objects representing the cashflows.
+        """
+        if entity_names is None:
+            return list(self.cashflows)
+        entity_names = set(entity_names)
+        return [
+            cashflow
+            for cashflow in self.cashflows
+            if cashflow.entity_name in entity_names
+        ]
+
+    def load_irrs(self, entities: dict[str : model.Entity]):
+        """
+        Replace the IRR data held by the repository with the IRR data of a dictionary of Entity objects.
+
+        Args:
+            entities (dict): A dictionary of Entity objects where the keys are entity IDs.
+        """
+        self.irrs = [irr for entity in entities.values() for irr in entity.irrs]
+        self.irrs_version += 1
+
+    def get_irr_frame(self) -> model.IrrFrame:
+        """
+        Collect the IRR data held by the repository into columns.
+
+        Returns:
+            model.IrrFrame: The IRR data held in columns.
+        """
+        return model.IrrFrame.from_irrs(self.irrs)
+
+    def get_irrs_version(self) -> str:
+        """
+        Identify the IRR data held by the repository by the number of times it was loaded.
+
+        Returns:
+            str: The number of loads, None before the first one.
+        """
+        return str(self.irrs_version) if self.irrs_version else None
+
+    def get_hierarchy(self) -> dict[str:str]:
+        """
+        Retrieve the hierarchy held by the repository.
+
+        Returns:
+            dict[str, str]: The name of the parent group of each entity and group, keyed by their name.
+        """
+        return dict(self.hierarchy)
+
+    def get_fingerprints(self) -> dict[str : model.Fingerprint]:
+        """
+        Calculate the fingerprint of every entity's cashflows.
+
+        Returns:
+            dict[str, model.Fingerprint]: The fingerprint of each entity, keyed by entity name.
+        """
+        return model.fingerprint_cashflows(self.get_cashflow_frame())
+
+    def get_state(self) -> dict[str : model.Fingerprint]:
+        """
+        Retrieve the fingerprints saved by the last delta run.
+
+        Returns:
+            dict[str, model.Fingerprint]: The fingerprint of each entity, keyed by entity name.
+        """
+        return dict(self.state)
+
+    def save_state(
+        self, fingerprints: dict[str : model.Fingerprint], removed: list[str]
+    ):
+        """
+        Save the fingerprints of a delta run.
+
+        Args:
+            fingerprints (dict[str, model.Fingerprint]): The fingerprints of the entities recomputed.
+            removed (list[str]): The entities which no longer have cashflows.
+        """
+        for entity_name in removed:
+            self.state.pop(entity_name, None)
+        self.state.update(fingerprints)
+
+    def upsert_irrs(
+        self,
+        entities: dict[str : model.Entity],
+        entity_names: list[str],
+        since: dict[str : dt.date] = None,
+    ):
+        """
+        Replace the IRR data of some entities.
+
+        Args:
+            entities (dict): A dictionary of Entity objects whose IRR data will be loaded.
+            entity_names (list[str]): The entities whose IRR data is replaced.
+            since (dict[str, datetime.date], optional): For the entities in this dictionary, only the IRR data dated
+                                                        on or after their date is replaced.
+        """
+        entity_names = set(entity_names)
+        since = since or {}
+        self.irrs = [
+            irr
+            for irr in self.irrs
+            if irr.entity_name not in entity_names
+            or (irr.entity_name in since and irr.date < since[irr.entity_name])
+        ]
+        self.irrs.extend(
+            irr
+            for entity in entities.values()
+            if entity.entity_name in entity_names
+            for irr in entity.irrs
+        )
+        self.irrs_version += 1
+
+    def iter_cashflows(self) -> Iterator[model.Cashflow]:
+        """
+        Stream the cashflows held by the repository ordered by entity name and then by date.
+
+        Returns:
+            Iterator[model.Cashflow]: The cashflows, in order.
+        """
+        # sorted() places missing dates first, as Cashflow does
+        by_date = sorted(self.cashflows)
+        return iter(sorted(by_date, key=lambda cashflow: cashflow.entity_name))
+
+    def load_irrs_batches(self, batches: Iterable[list[model.Irr]]):
+        """
+        Replace the IRR data held by the repository with IRR data streamed in batches.
+
+        Args:
+            batches (Iterable[list[model.Irr]]): The batches of IRR data to load.
+        """
+        self.irrs = []
+        for irrs in batches:
+            self.irrs.extend(irrs)
+        self.irrs_version += 1
+
+    def load_shard_irrs(
+        self, run_id: str, shard: int, entities: dict[str : model.Entity]
+    ):
+        """
+        Stage the IRR data of a shard of a sharded run.
+
+        Args:
+            run_id (str): The identifier of the run.
+            shard (int): The position of the shard.
+            entities (dict): A dictionary of Entity objects whose IRR data will be staged.
+        """
+        self.staging.setdefault(run_id, {})[shard] = [
+            irr for entity in entities.values() for irr in entity.irrs
+        ]
+
+    def get_staged_shards(self, run_id: str) -> set[int]:
+        """
+        List the shards of a sharded run whose IRR data is staged.
+
+        Args:
+            run_id (str): The identifier of the run.
+
+        Returns:
+            set[int]: The positions of the staged shards.
+        """
+        return set(self.staging.get(run_id, {}))
+
+    def merge_shards(self, run_id: str, shard_count: int):
+        """
+        Replace the IRR data held by the repository with the staged IRR data of every shard of a run.
+
+        Args:
+            run_id (str): The identifier of the run.
+            shard_count (int): The number of shards of the run.
+        """
+        staged = self.staging.pop(run_id)
+        self.irrs = [irr for shard in range(shard_count) for irr in staged[shard]]
+        self.irrs_version += 1
+
+
+def save_cashflow_columns(cashflows: model.CashflowFrame, directory: str):
+    """
+    Save a CashflowFrame as one NumPy file per column, the layout read by FileRepository with memory mapping.
+
+    Args:
+        cashflows (model.CashflowFrame): The cashflows to save.
+        directory (str): The directory where the column files are written. It is created if needed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in FRAME_COLUMNS:
+        column = getattr(cashflows, name)
+        if name == "entity_names":
+            column = np.array(column, dtype=str)
+        np.save(os.path.join(directory, f"{name}.npy"), column)
+
+
+class FileRepository(AbstractRepository):
+    """
+    A concrete implementation of the AbstractRepository that reads cashflows from local files and writes Internal
+    Rate of Return (IRR) data to a Parquet file, so the pipeline can run without any cloud dependency.
+
+    The cashflow source is either a Parquet file, a CSV file with a header (both with date, inflow, outflow, value
+    and entity_name columns and read with pyarrow), or a directory of NumPy column files written by
+    `save_cashflow_columns()`, which are memory mapped instead of read into memory.
+
+    Args:
+        source (str): The path of the cashflow file or directory.
+        destination (str): The path of the Parquet file where IRR data is written.
+
+    Attributes:
+        source (str): The path of the cashflow file or directory.
+        destination (str): The path of the Parquet file where IRR data is written.
+
+    Methods:
+        get_cashflows(entity_names: list[str]) -> list[model.Cashflow]: Read cashflows as Cashflow objects.
+        get_cashflow_frame(entity_names: list[str]) -> model.CashflowFrame: Read cashflows into columns.
+        load_irrs(entities: dict[str, model.Entity]): Write IRR data to the destination file.
+        get_irr_frame() -> model.IrrFrame: Read IRR data from the destination file.
+        get_irrs_version() -> str: Identify the destination file by its modification time.
+        iter_cashflows() -> Iterator[model.Cashflow]: Stream cashflows ordered by entity name and date.
+        load_irrs_batches(batches: Iterable[list[model.Irr]]): Write IRR data streamed in batches.
+    """
+
+    def __init__(self, source: str, destination: str):
+        self.source = source
+        self.destination = destination
+
+    def read_cashflow_frame(self) -> model.CashflowFrame:
+        """
+        Read every cashflow of the source into a CashflowFrame.
+
+        Returns:
+            model.CashflowFrame: The cashflows held in columns.
+
+        Raises:
+            ValueError: If the source is neither a directory nor a .parquet or .csv file.
+        """
+        if os.path.isdir(self.source):
+            columns = {
+                name: np.load(
+                    os.path.join(self.source, f"{name}.npy"),
+                    mmap_mode=None if name == "entity_names" else "r",
+                )
+                for name in FRAME_COLUMNS
+            }
+            columns["entity_names"] = tuple(columns["entity_names"].tolist())
+            return model.CashflowFrame(**columns)
+
+        extension = os.path.splitext(self.source)[1].lower()
+        if extension == ".parquet":
+            table = pyarrow.parquet.read_table(
+                self.source, columns=list(model.CASHFLOW_COLUMNS)
+            )
+        elif extension == ".csv":
+            table = pyarrow.csv.read_csv(
+                self.source,
+                convert_options=pyarrow.csv.ConvertOptions(
+                    column_types={
+                        "date": pyarrow.date32(),
+                        "inflow": pyarrow.float64(),
+                        "outflow": pyarrow.float64(),
+                        "value": pyarrow.float64(),
+                        "entity_name": pyarrow.string(),
+                    },
+                    include_columns=list(model.CASHFLOW_COLUMNS),
+                ),
+            )
+        else:
+            raise ValueError(f"Unsupported cashflow source {self.source}")
+
+        return model.CashflowFrame.from_arrow(table)
+
+    def get_cashflow_frame(self, entity_names: list[str] = None) -> model.CashflowFrame:
+        """
+        Read cashflows from the source into a CashflowFrame.
+
+        Args:
+            entity_names (list[str], optional): Only retrieve the cashflows of these entities.
+
+        Returns:
+            model.CashflowFrame: The cashflows held in columns.
+        """
+        cashflows = self.read_cashflow_frame()
+        if entity_names is None:
+            return cashflows
+        entity_names = set(entity_names)
+        codes = [
+            code
+            for code, entity_name in enumerate(cashflows.entity_names)
+            if entity_name in entity_names
+        ]
+        return cashflows.take(np.isin(cashflows.entity_code, codes))
+
+    def get_cashflows(self, entity_names: list[str] = None) -> list[model.Cashflow]:
+        """
+        Read cashflows from the source as Cashflow objects.
+
+        Args:
+            entity_names (list[str], optional): Only retrieve the cashflows of these entities.
+
+        Returns:
+            list[model.Cashflow]: A list of Cashflow objects representing the cashflows.
+        """
+        return self.get_cashflow_frame(entity_names).to_cashflows()
+
+    def load_irrs(self, entities: dict[str : model.Entity]):
+        """
+        Write the IRR data of a dictionary of Entity objects to the destination Parquet file, replacing it.
+
+        Args:
+            entities (dict): A dictionary of Entity objects where the keys are entity IDs.
+        """
+        self.load_irrs_batches(
+            [[irr for entity in entities.values() for irr in entity.irrs]]
+        )
+
+    def get_irr_frame(self) -> model.IrrFrame:
+        """
+        Read the IRR data of the destination Parquet file into columns.
+
+        Returns:
+            model.IrrFrame: The IRR data held in columns.
+        """
+        return model.IrrFrame.from_arrow(pyarrow.parquet.read_table(self.destination))
+
+    def get_irrs_version(self) -> str:
+        """
+        Identify the destination Parquet file by its modification time.
+
+        Returns:
+            str: The modification time in nanoseconds, None when the file does not exist.
+        """
+        try:
+            return str(os.stat(self.destination).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def iter_cashflows(self) -> Iterator[model.Cashflow]:
+        """
+        Stream the cashflows of the source ordered by entity name and then by date. The columns are sorted as a
+        whole, but Cashflow objects are only created one entity at a time.
+
+        Returns:
+            Iterator[model.Cashflow]: The cashflows, in order.
+        """
+        cashflows = self.read_cashflow_frame()
+        # recode entities in name order, so that sorting by code sorts by name
+        order = sorted(
+            range(len(cashflows.entity_names)),
+            key=lambda code: cashflows.entity_names[code],
+        )
+        ranks = np.empty(len(order), dtype=np.int32)
+        ranks[order] = np.arange(len(order), dtype=np.int32)
+        cashflows = model.CashflowFrame(
+            cashflows.date,
+            cashflows.inflow,
+            cashflows.outflow,
+            cashflows.value,
+            ranks[cashflows.entity_code],
+            tuple(cashflows.entity_names[code] for code in order),
+        ).sort()
+        for _, entity_cashflows in cashflows.groups():
+            yield from entity_cashflows.to_cashflows()
+
+    def load_irrs_batches(self, batches: Iterable[list[model.Irr]]):
+        """
+        Write IRR data streamed in batches to the destination Parquet file, one row group per batch. The schema is
+        the one of the first batch, with a day_count column for Xirr data and a window column for WindowIrr data.
+
+        Args:
+            batches (Iterable[list[model.Irr]]): The batches of IRR data to write.
+        """
+        writer = None
+        try:
+            for irrs in batches:
+                if irrs:
+                    table = model.IrrFrame.from_irrs(irrs).to_arrow()
+                    if writer is None:
+                        writer = pyarrow.parquet.ParquetWriter(
+                            self.destination, table.schema
+                        )
+                    writer.write_table(table)
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(
+                    self.destination, model.IrrFrame.from_irrs([]).to_arrow().schema
+                )
+        finally:
+            if writer is not None:
+                writer.close()
+
 
 class BiqQueryRepository(AbstractRepository):
     """
@@ -50,49 +774,114 @@ class BiqQueryRepository(AbstractRepository):
 
     Args:
         project (str, optional): The Google Cloud project ID. If not specified, the default project is used.
+        client (bigquery.Client, optional): The client to use instead of creating one.
 
     Attributes:
         client (bigquery.Client): The Google BigQuery client instance.
         cashflow_source (str): The SQL source query for cashflows.
+        hierarchy_source (str): The SQL source query for the parent group of each entity and group.
         irr_destination (str): The destination table for IRR data.
+        state_destination (str): The table holding the entity fingerprints saved by delta runs.
+        page_size (int): The number of rows fetched at a time when streaming cashflows.
+        use_arrow (bool): Whether to read cashflows as Arrow tables and load IRR data as Parquet when pyarrow is
+            installed.
 
     Methods:
-        get(query: str) -> bigquery.table.RowIterator: Execute a SQL query and return the results.
-        get_cashflows() -> list[model.Cashflow]: Retrieve cashflow data and convert it to Cashflow objects.
+        get(query: str, job_config: bigquery.QueryJobConfig) -> bigquery.table.RowIterator: Execute a SQL query and
+            return the results.
+        get_cashflows(entity_names: list[str]) -> list[model.Cashflow]: Retrieve cashflow data and convert it to
+            Cashflow objects.
+        get_cashflow_frame(entity_names: list[str]) -> model.CashflowFrame: Retrieve cashflow data into columns.
+        get_hierarchy() -> dict[str, str]: Retrieve the parent group of each entity and group.
         load_table_from_json(data: list[dict], destination: str, job_config: bigquery.job.load.LoadJobConfig):
             Load data from a list of dictionaries into a BigQuery table.
+        load_table_from_parquet(table: pyarrow.Table, destination: str, job_config: bigquery.job.load.LoadJobConfig):
+            Load an Arrow table into a BigQuery table as Parquet.
+        load_irr_frame(irrs: model.IrrFrame, destination: str, write_disposition: str): Load columnar IRR data.
         load_irrs(entities: dict[str, model.Entity]): Load IRR data from a dictionary of Entity objects.
+        get_irr_frame() -> model.IrrFrame: Retrieve the IRR data of the destination table into columns.
+        get_irrs_version() -> str: Identify the destination table by its last modification time.
+        get_fingerprints() -> dict[str, model.Fingerprint]: Calculate the fingerprints of the cashflows in SQL.
+        get_state() -> dict[str, model.Fingerprint]: Retrieve the fingerprints saved by the last delta run.
+        save_state(fingerprints: dict[str, model.Fingerprint], removed: list[str]): Merge fingerprints into the
+            state table.
+        upsert_irrs(entities: dict[str, model.Entity], entity_names: list[str]): Merge the IRR data of some
+            entities into the destination table.
+        iter_cashflows() -> Iterator[model.Cashflow]: Stream cashflow data ordered by entity name and date.
+        load_irrs_batches(batches: Iterable[list[model.Irr]]): Load IRR data streamed in batches.
+        load_shard_irrs(run_id: str, shard: int, entities: dict[str, model.Entity]): Load the IRR data of a shard
+            into its own staging table.
+        get_staged_shards(run_id: str) -> set[int]: List the staging tables of a sharded run.
+        merge_shards(run_id: str, shard_count: int): Replace the destination table with the staging tables.
     """
 
-    def __init__(self, project=None):
-        self.client = bigquery.Client(project=project)
-        self.cashflow_source = "SELECT * FROM dm_accounting.cashflows"
+    def __init__(self, project=None, client: "bigquery.Client" = None):
+        self.client = client or bigquery.Client(project=project)
+        self.cashflow_source = "SELECT date, inflow, outflow, value, entity_name FROM dm_accounting.cashflows"
+        self.hierarchy_source = (
+            "SELECT entity_name, parent_name FROM dm_accounting.entity_hierarchy"
+        )
         self.irr_destination = "publishing.entity_irrs"
+        self.state_destination = "publishing.entity_irrs_state"
+        self.page_size = 50_000
+        self.use_arrow = True
 
-    def get(self, query: str) -> bigquery.table.RowIterator:
+    def get(
+        self, query: str, job_config: "bigquery.QueryJobConfig" = None
+    ) -> "bigquery.table.RowIterator":
         """
         Execute a SQL query and return the results as a RowIterator.
 
         Args:
             query (str): The SQL query to execute.
+            job_config (bigquery.QueryJobConfig, optional): Job configuration, e.g. with query parameters.
 
         Returns:
             bigquery.table.RowIterator: An iterator for the query results.
         """
-        query_job = self.client.query(query)
+        query_job = self.client.query(query, job_config=job_config)
         rows = query_job.result()
 
         return rows
 
-    def get_cashflows(self) -> list[model.Cashflow]:
+    def get_cashflow_rows(
+        self, entity_names: list[str] = None
+    ) -> "bigquery.table.RowIterator":
+        """
+        Query the cashflow source, optionally restricted to some entities.
+
+        Args:
+            entity_names (list[str], optional): Only retrieve the cashflows of these entities.
+
+        Returns:
+            bigquery.table.RowIterator: An iterator for the cashflow rows.
+        """
+        if entity_names is None:
+            return self.get(self.cashflow_source)
+        return self.get(
+            f"SELECT * FROM ({self.cashflow_source}) "
+            "WHERE entity_name IN UNNEST(@entity_names)",
+            bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ArrayQueryParameter(
+                        "entity_names", "STRING", list(entity_names)
+                    )
+                ]
+            ),
+        )
+
+    def get_cashflows(self, entity_names: list[str] = None) -> list[model.Cashflow]:
         """
         Retrieve cashflow data and convert it into a list of Cashflow objects.
 
+        Args:
+            entity_names (list[str], optional): Only retrieve the cashflows of these entities.
+
         Returns:
             list[model.Cashflow]: A list of Cashflow objects representing the cashflows.
         """
         cashflows = []
-        for row in self.get(self.cashflow_source):
+        for row in self.get_cashflow_rows(entity_names):
             cashflows.append(
                 model.Cashflow(
                     row.date, row.inflow, row.outflow, row.value, row.entity_name
@@ -101,11 +890,47 @@ class BiqQueryRepository(AbstractRepository):
 
         return cashflows
 
+    def get_cashflow_frame(self, entity_names: list[str] = None) -> model.CashflowFrame:
+        """
+        Retrieve cashflow data into a CashflowFrame. When pyarrow is installed the result is downloaded as an Arrow
+        table, through the BigQuery Storage Read API if available, and converted column by column. Otherwise one
+        list per column is filled from the rows, still without creating a Cashflow object per row.
+
+        Args:
+            entity_names (list[str], optional): Only retrieve the cashflows of these entities.
+
+        Returns:
+            model.CashflowFrame: The cashflows held in columns.
+        """
+        rows = self.get_cashflow_rows(entity_names)
+        if self.use_arrow and pyarrow is not None:
+            return model.CashflowFrame.from_arrow(
+                rows.to_arrow(create_bqstorage_client=True)
+            )
+
+        columns = {name: [] for name in model.CASHFLOW_COLUMNS}
+        for row in rows:
+            for name, column in columns.items():
+                column.append(row[name])
+
+        return model.CashflowFrame.from_columns(**columns)
+
+    def get_hierarchy(self) -> dict[str:str]:
+        """
+        Retrieve the parent group of each entity and group from the hierarchy source.
+
+        Returns:
+            dict[str, str]: The name of the parent group of each entity and group, keyed by their name.
+        """
+        return {
+            row.entity_name: row.parent_name for row in self.get(self.hierarchy_source)
+        }
+
     def load_table_from_json(
         self,
         data: list[dict],
         destination: str,
-        job_config: bigquery.job.load.LoadJobConfig,
+        job_config: "bigquery.job.load.LoadJobConfig",
     ):
         """
         Load data from a list of dictionaries into a BigQuery table.
@@ -120,17 +945,473 @@ class BiqQueryRepository(AbstractRepository):
         )
         load_job.result()
 
+    def load_table_from_parquet(
+        self,
+        table,
+        destination: str,
+        job_config: "bigquery.job.load.LoadJobConfig",
+    ):
+        """
+        Load an Arrow table into a BigQuery table, uploaded as a Parquet file.
+
+        Args:
+            table (pyarrow.Table): The data to load.
+            destination (str): The destination table in BigQuery.
+            job_config (bigquery.job.load.LoadJobConfig): Job configuration for the load operation.
+        """
+        buffer = io.BytesIO()
+        pyarrow.parquet.write_table(table, buffer)
+        buffer.seek(0)
+        load_job = self.client.load_table_from_file(
+            buffer, destination, job_config=job_config
+        )
+        load_job.result()
+
+    def load_irr_frame(
+        self, irrs: model.IrrFrame, destination: str, write_disposition: str
+    ):
+        """
+        Load columnar IRR data into a BigQuery table with the schema of its columns (see `irr_schema()`). When
+        pyarrow is installed the data is uploaded as Parquet, otherwise as newline delimited JSON.
+
+        Args:
+            irrs (model.IrrFrame): The IRR data to load.
+            destination (str): The destination table in BigQuery.
+            write_disposition (str): The write disposition of the load job.
+        """
+        schema = irr_schema(
+            list(irrs.metrics),
+            irrs.day_count is not None,
+            irrs.window is not None,
+            irrs.level is not None,
+        )
+        if self.use_arrow and pyarrow is not None:
+            job_config = bigquery.LoadJobConfig(
+                schema=schema,
+                write_disposition=write_disposition,
+                source_format=bigquery.SourceFormat.PARQUET,
+            )
+            self.load_table_from_parquet(irrs.to_arrow(), destination, job_config)
+        else:
+            job_config = bigquery.LoadJobConfig(
+                schema=schema,
+                write_disposition=write_disposition,
+                source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            )
+            self.load_table_from_json(irrs.to_dicts(), destination, job_config)
+
     def load_irrs(self, entities: dict[str : model.Entity]):
         """
-        Load IRR data from a dictionary of Entity objects into BigQuery. This method extracts IRR data from Entity
-        objects and loads it into the specified BigQuery destination table.
+        Load IRR data from a dictionary of Entity objects into BigQuery. This method collects the IRR data of the
+        Entity objects into columns and loads it into the specified BigQuery destination table.
 
         Args:
             entities (dict): A dictionary of Entity objects where the keys are entity IDs.
         """
-        irrs = [irr.to_dict() for entity in entities.values() for irr in entity.irrs]
+        self.load_irr_frame(
+            model.IrrFrame.from_entities(entities),
+            self.irr_destination,
+            bigquery.WriteDisposition.WRITE_TRUNCATE,
+        )
+
+    def get_irr_frame(self) -> model.IrrFrame:
+        """
+        Retrieve the IRR data of the destination table into columns. When pyarrow is installed the table is
+        downloaded as an Arrow table, through the BigQuery Storage Read API if available. Otherwise one list per
+        column is filled from the rows, leaving out the day_count, metric and level columns.
+
+        Returns:
+            model.IrrFrame: The IRR data held in columns.
+        """
+        rows = self.get(f"SELECT * FROM {self.irr_destination}")
+        if self.use_arrow and pyarrow is not None:
+            return model.IrrFrame.from_arrow(
+                rows.to_arrow(create_bqstorage_client=True)
+            )
+
+        dates, monthly, annual, windows, entity_code, codes = [], [], [], [], [], {}
+        for row in rows:
+            dates.append(row["date"])
+            monthly.append(row["irr_monthly"])
+            annual.append(row["irr_annual"])
+            windows.append(row.get("window") or 0)
+            entity_code.append(codes.setdefault(row["entity_name"], len(codes)))
+        return model.IrrFrame(
+            np.array(dates, dtype="datetime64[D]"),
+            np.array(monthly, dtype=float),
+            np.array(entity_code, dtype=np.int32),
+            tuple(codes),
+            np.array(annual, dtype=float),
+            window=np.array(windows, dtype=np.int64),
+        )
+
+    def get_irrs_version(self) -> str:
+        """
+        Identify the destination table by its last modification time, read from its metadata without running a
+        query. Full, sharded, delta and event-driven runs all modify it.
+
+        Returns:
+            str: The last modification time, None when the table does not exist.
+        """
+        try:
+            table = self.client.get_table(self.irr_destination)
+        except api_exceptions.NotFound:
+            return None
+        return table.modified.isoformat()
+
+    def get_fingerprints(self) -> dict[str : model.Fingerprint]:
+        """
+        Calculate the fingerprint of every entity's cashflows in BigQuery, so that only one row per entity is read.
+        The content hash fingerprints the rows serialised and sorted, as `model.fingerprint_cashflows()` does, which
+        makes it independent of the order of the rows, while a pair of duplicate rows still changes it.
+
+        Returns:
+            dict[str, model.Fingerprint]: The fingerprint of each entity, keyed by entity name.
+        """
+        rows = self.get(
+            "SELECT entity_name, COUNT(*) AS row_count, MAX(date) AS max_date, "
+            "FORMAT('%x', FARM_FINGERPRINT(STRING_AGG(content, ',' ORDER BY content))) "
+            "AS content_hash FROM (SELECT entity_name, date, "
+            "TO_JSON_STRING(STRUCT(date, inflow, outflow, value)) AS content "
+            f"FROM ({self.cashflow_source})) GROUP BY entity_name"
+        )
+        return {
+            row.entity_name: model.Fingerprint(
+                row.row_count, row.max_date, row.content_hash
+            )
+            for row in rows
+        }
+
+    def get_state(self) -> dict[str : model.Fingerprint]:
+        """
+        Retrieve the fingerprints saved by the last delta run from the state table.
+
+        Returns:
+            dict[str, model.Fingerprint]: The fingerprint of each entity, keyed by entity name. Empty when the state
+                                          table does not exist yet.
+        """
+        try:
+            rows = self.get(
+                "SELECT entity_name, row_count, max_date, content_hash "
+                f"FROM {self.state_destination}"
+            )
+        except api_exceptions.NotFound:
+            return {}
+        return {
+            row.entity_name: model.Fingerprint(
+                row.row_count, row.max_date, row.content_hash
+            )
+            for row in rows
+        }
+
+    def merge_from_staging(
+        self,
+        data: list[dict],
+        destination: str,
+        schema: list["bigquery.SchemaField"],
+        merge: str,
+        query_parameters: list = None,
+    ):
+        """
+        Load data into a staging table next to the destination table, and merge it into the destination table,
+        which is created first if needed. Each call stages into a table of its own, named with a random suffix, so
+        that concurrent runs, e.g. event-driven upserts and a delta run, do not overwrite each other's staging
+        table. The staging table is deleted afterwards, even when the merge fails.
+
+        The destination table may have more columns than the staging table, e.g. the metric, day count, window
+        and level columns of a full run followed by an event-driven upsert, so the merge names the columns of the
+        staging table instead of relying on their positions. The ones missing from the destination table are
+        added to it first, as `merge_shards()` does.
+
+        Args:
+            data (list[dict]): The data to load as a list of dictionaries.
+            destination (str): The destination table in BigQuery.
+            schema (list[bigquery.SchemaField]): The schema of the staging table.
+            merge (str): The MERGE statement, where `{destination}` and `{staging}` are replaced by the table names,
+                         `{columns}` by the column names of the staging table and `{values}` by the same columns
+                         of the source table aliased S.
+            query_parameters (list, optional): The query parameters of the MERGE statement.
+        """
+        staging = f"{destination}_staging_{uuid.uuid4().hex}"
+        # window is a reserved keyword, so column names are quoted
+        definitions = [f"`{field.name}` {field.field_type}" for field in schema]
+        self.get(f"CREATE TABLE IF NOT EXISTS {destination} ({', '.join(definitions)})")
+        self.get(
+            f"ALTER TABLE {destination} "
+            + ", ".join(f"ADD COLUMN IF NOT EXISTS {column}" for column in definitions)
+        )
         job_config = bigquery.LoadJobConfig(
+            schema=schema,
             write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
             source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
         )
-        self.load_table_from_json(irrs, self.irr_destination, job_config)
+        try:
+            self.load_table_from_json(data, staging, job_config)
+            self.get(
+                merge.format(
+                    destination=destination,
+                    staging=staging,
+                    columns=", ".join(f"`{field.name}`" for field in schema),
+                    values=", ".join(f"S.`{field.name}`" for field in schema),
+                ),
+                bigquery.QueryJobConfig(query_parameters=query_parameters or []),
+            )
+        finally:
+            self.client.delete_table(staging, not_found_ok=True)
+
+    def save_state(
+        self, fingerprints: dict[str : model.Fingerprint], removed: list[str]
+    ):
+        """
+        Merge the fingerprints of a delta run into the state table. The latest date is null for entities whose
+        cashflows have no date.
+
+        Args:
+            fingerprints (dict[str, model.Fingerprint]): The fingerprints of the entities recomputed.
+            removed (list[str]): The entities which no longer have cashflows.
+        """
+        self.merge_from_staging(
+            [
+                {
+                    "entity_name": entity_name,
+                    "row_count": fingerprint.row_count,
+                    "max_date": (
+                        None
+                        if fingerprint.max_date is None
+                        else fingerprint.max_date.strftime("%Y-%m-%d")
+                    ),
+                    "content_hash": fingerprint.content_hash,
+                }
+                for entity_name, fingerprint in fingerprints.items()
+            ],
+            self.state_destination,
+            state_schema(),
+            "MERGE {destination} T USING {staging} S ON T.entity_name = S.entity_name "
+            "WHEN MATCHED THEN UPDATE SET row_count = S.row_count, max_date = S.max_date, "
+            "content_hash = S.content_hash "
+            "WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({values}) "
+            "WHEN NOT MATCHED BY SOURCE AND T.entity_name IN UNNEST(@removed) THEN DELETE",
+            [bigquery.ArrayQueryParameter("removed", "STRING", list(removed))],
+        )
+
+    def upsert_irrs(
+        self,
+        entities: dict[str : model.Entity],
+        entity_names: list[str],
+        since: dict[str : dt.date] = None,
+    ):
+        """
+        Replace the IRR data of some entities in the destination table with a MERGE statement, instead of
+        truncating the whole table. When only the IRR data from a date onwards is replaced for some entities, the
+        rows are deleted and inserted in a single transaction instead.
+
+        Args:
+            entities (dict): A dictionary of Entity objects whose IRR data will be loaded.
+            entity_names (list[str]): The entities whose IRR data is replaced.
+            since (dict[str, datetime.date], optional): For the entities in this dictionary, only the IRR data dated
+                                                        on or after their date is replaced.
+        """
+        entity_names = list(entity_names)
+        selected = set(entity_names)
+        irrs = [
+            irr
+            for entity in entities.values()
+            if entity.entity_name in selected
+            for irr in entity.irrs
+        ]
+        self.merge_from_staging(
+            [irr.to_dict() for irr in irrs],
+            self.irr_destination,
+            irr_schema(
+                list(irrs[0].metrics or {}) if irrs else [],
+                bool(irrs) and isinstance(irrs[0], model.Xirr),
+                bool(irrs) and isinstance(irrs[0], model.WindowIrr),
+                bool(irrs) and isinstance(irrs[0], model.LevelIrr),
+            ),
+            (
+                "BEGIN TRANSACTION; "
+                "DELETE FROM {destination} T WHERE T.entity_name IN UNNEST(@entity_names) "
+                "AND NOT EXISTS (SELECT 1 FROM UNNEST(@since) S "
+                "WHERE S.entity_name = T.entity_name AND T.date < S.since); "
+                "INSERT INTO {destination} ({columns}) SELECT {columns} FROM {staging}; "
+                "COMMIT TRANSACTION;"
+                if since
+                else "MERGE {destination} T USING {staging} S ON FALSE "
+                "WHEN NOT MATCHED BY SOURCE AND T.entity_name IN UNNEST(@entity_names) THEN DELETE "
+                "WHEN NOT MATCHED THEN INSERT ({columns}) VALUES ({values})"
+            ),
+            [bigquery.ArrayQueryParameter("entity_names", "STRING", entity_names)]
+            + (
+                [
+                    bigquery.ArrayQueryParameter(
+                        "since",
+                        "STRUCT",
+                        [
+                            bigquery.StructQueryParameter(
+                                None,
+                                bigquery.ScalarQueryParameter(
+                                    "entity_name", "STRING", entity_name
+                                ),
+                                bigquery.ScalarQueryParameter("since", "DATE", date),
+                            )
+                            for entity_name, date in since.items()
+                        ],
+                    )
+                ]
+                if since
+                else []
+            ),
+        )
+
+    def iter_cashflows(self) -> Iterator[model.Cashflow]:
+        """
+        Stream cashflow data ordered by entity name and then by date. Rows are fetched page by page as the iterator
+        is consumed, so only one page is held in memory at a time.
+
+        Returns:
+            Iterator[model.Cashflow]: The cashflows, in order.
+        """
+        query_job = self.client.query(
+            f"SELECT * FROM ({self.cashflow_source}) ORDER BY entity_name, date"
+        )
+        for row in query_job.result(page_size=self.page_size):
+            yield model.Cashflow(
+                row.date, row.inflow, row.outflow, row.value, row.entity_name
+            )
+
+    def load_irrs_batches(self, batches: Iterable[list[model.Irr]]):
+        """
+        Load IRR data streamed in batches into BigQuery, one load job per batch. The first load truncates the
+        destination table, even when there is no IRR data at all, and the following ones append to it.
+
+        Args:
+            batches (Iterable[list[model.Irr]]): The batches of IRR data to load.
+        """
+        write_disposition = bigquery.WriteDisposition.WRITE_TRUNCATE
+        for irrs in itertools.chain(batches, [[]]):
+            if irrs or write_disposition == bigquery.WriteDisposition.WRITE_TRUNCATE:
+                self.load_irr_frame(
+                    model.IrrFrame.from_irrs(irrs),
+                    self.irr_destination,
+                    write_disposition,
+                )
+                write_disposition = bigquery.WriteDisposition.WRITE_APPEND
+
+    def shard_table(self, run_id: str, shard: int) -> str:
+        """
+        Name the staging table of a shard of a sharded run, next to the destination table.
+
+        Args:
+            run_id (str): The identifier of the run, made of letters, digits and underscores.
+            shard (int): The position of the shard.
+
+        Returns:
+            str: The name of the staging table.
+        """
+        return f"{self.irr_destination}_shard_{run_id}_{shard}"
+
+    def load_shard_irrs(
+        self, run_id: str, shard: int, entities: dict[str : model.Entity]
+    ):
+        """
+        Load the IRR data of a shard of a sharded run into its own staging table, truncating it.
+
+        Args:
+            run_id (str): The identifier of the run.
+            shard (int): The position of the shard.
+            entities (dict): A dictionary of Entity objects whose IRR data will be staged.
+        """
+        self.load_irr_frame(
+            model.IrrFrame.from_entities(entities),
+            self.shard_table(run_id, shard),
+            bigquery.WriteDisposition.WRITE_TRUNCATE,
+        )
+
+    def get_staged_shards(self, run_id: str) -> set[int]:
+        """
+        List the staging tables of a sharded run from the INFORMATION_SCHEMA of the destination dataset.
+
+        Args:
+            run_id (str): The identifier of the run.
+
+        Returns:
+            set[int]: The positions of the staged shards.
+        """
+        dataset, table = self.irr_destination.rsplit(".", 1)
+        prefix = f"{table}_shard_{run_id}_"
+        rows = self.get(
+            f"SELECT table_name FROM {dataset}.INFORMATION_SCHEMA.TABLES "
+            "WHERE STARTS_WITH(table_name, @prefix)",
+            bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ScalarQueryParameter("prefix", "STRING", prefix)
+                ]
+            ),
+        )
+        suffixes = (row.table_name[len(prefix) :] for row in rows)
+        return {int(suffix) for suffix in suffixes if suffix.isdigit()}
+
+    def merge_shards(self, run_id: str, shard_count: int):
+        """
+        Replace the content of the destination table with the staging tables of every shard of a run in a single
+        transaction, so that readers never see partial results, and delete the staging tables.
+
+        The columns are read from the INFORMATION_SCHEMA of the staging tables, so that the metric, day count,
+        window and level columns of the engine are kept. A shard without IRR data is staged with the default
+        columns only, so the widest staging table gives the columns, filled with NULL for the other tables, and
+        the ones missing from the destination table are added to it first.
+
+        Args:
+            run_id (str): The identifier of the run.
+            shard_count (int): The number of shards of the run.
+        """
+        dataset, table = self.irr_destination.rsplit(".", 1)
+        tables = [f"{table}_shard_{run_id}_{shard}" for shard in range(shard_count)]
+        rows = self.get(
+            "SELECT table_name, column_name, data_type "
+            f"FROM {dataset}.INFORMATION_SCHEMA.COLUMNS "
+            "WHERE table_name IN UNNEST(@tables) ORDER BY table_name, ordinal_position",
+            bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ArrayQueryParameter("tables", "STRING", tables)
+                ]
+            ),
+        )
+        staged = {table: {} for table in tables}
+        for row in rows:
+            staged[row.table_name][row.column_name] = row.data_type
+        columns = dict(max(staged.values(), key=len, default=None) or IRR_COLUMNS)
+        for table_columns in staged.values():
+            columns.update(table_columns)
+
+        # window is a reserved keyword, so column names are quoted
+        definitions = [f"`{name}` {field_type}" for name, field_type in columns.items()]
+        self.get(
+            f"CREATE TABLE IF NOT EXISTS {self.irr_destination} ({', '.join(definitions)})"
+        )
+        self.get(
+            f"ALTER TABLE {self.irr_destination} "
+            + ", ".join(f"ADD COLUMN IF NOT EXISTS {column}" for column in definitions)
+        )
+        selects = " UNION ALL ".join(
+            "SELECT "
+            + ", ".join(
+                (
+                    f"`{name}`"
+                    if name in staged[table]
+                    else f"CAST(NULL AS {field_type}) AS `{name}`"
+                )
+                for name, field_type in columns.items()
+            )
+            + f" FROM {dataset}.{table}"
+            for table in tables
+        )
+        names = ", ".join(f"`{name}`" for name in columns)
+        self.get(
+            "BEGIN TRANSACTION; "
+            f"TRUNCATE TABLE {self.irr_destination}; "
+            f"INSERT INTO {self.irr_destination} ({names}) {selects}; "
+            "COMMIT TRANSACTION;"
+        )
+        for shard in range(shard_count):
+            self.client.delete_table(self.shard_table(run_id, shard), not_found_ok=True)
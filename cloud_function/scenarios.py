@@ -0,0 +1,253 @@
+from dataclasses import dataclass, field
+import zlib
+import numpy as np
+import batch
+import model
+import solver
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+DEFAULT_CHUNK_CELLS = 5_000_000
+
+
+@dataclass(frozen=True)
+class ScenarioSpec:
+    """
+    A data class describing stressed scenarios of an entity's cashflows. Each scenario draws its own shocks,
+    uniformly within the given bounds:
+
+    - distribution_scale: a factor applied to every distribution (outflow).
+    - exit delay: a number of months, from 0 to `max_exit_delay`, by which the terminal value is received later.
+    - terminal_haircut: the share of the terminal value lost.
+
+    The shocks of an entity only depend on the seed and on its name, so results are reproducible whatever the
+    order of the entities and the size of the chunks.
+
+    Attributes:
+        scenarios (int): The number of scenarios of each entity.
+        distribution_scale (tuple[float, float]): The bounds of the factor applied to the distributions.
+        max_exit_delay (int): The largest delay of the terminal value, in months.
+        terminal_haircut (tuple[float, float]): The bounds of the share of the terminal value lost.
+        seed (int): The seed of the random draws.
+        percentiles (tuple[float, ...]): The percentiles of the IRR distribution summarised.
+    Methods:
+        draw(entity_name: str): Draw the shocks of every scenario of an entity.
+    Raises:
+        ValueError: If a bound is invalid.
+    """
+
+    scenarios: int = 1_000
+    distribution_scale: tuple[float, float] = (1.0, 1.0)
+    max_exit_delay: int = 0
+    terminal_haircut: tuple[float, float] = (0.0, 0.0)
+    seed: int = 0
+    percentiles: tuple[float, ...] = DEFAULT_PERCENTILES
+
+    def __post_init__(self):
+        if self.scenarios < 1:
+            raise ValueError(f"At least one scenario is needed, got {self.scenarios}")
+        if self.max_exit_delay < 0:
+            raise ValueError(f"Exit delays cannot be negative: {self.max_exit_delay}")
+        low, high = self.terminal_haircut
+        if not 0 <= low <= high <= 1:
+            raise ValueError(f"Invalid terminal haircut bounds {self.terminal_haircut}")
+        low, high = self.distribution_scale
+        if not 0 <= low <= high:
+            raise ValueError(
+                f"Invalid distribution scale bounds {self.distribution_scale}"
+            )
+
+    def draw(self, entity_name: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Draw the shocks of every scenario of an entity.
+
+        Args:
+            entity_name (str): The name of the entity.
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: The distribution scale, the exit delay and the terminal
+                                                       haircut of each scenario.
+        """
+        rng = np.random.default_rng([self.seed, zlib.crc32(entity_name.encode())])
+        return (
+            rng.uniform(*self.distribution_scale, size=self.scenarios),
+            rng.integers(0, self.max_exit_delay, size=self.scenarios, endpoint=True),
+            rng.uniform(*self.terminal_haircut, size=self.scenarios),
+        )
+
+
+@dataclass(frozen=True)
+class ScenarioSummary:
+    """
+    A data class summarising the distribution of an entity's since-inception IRR over its scenarios.
+
+    Attributes:
+        entity_name (str): The name of the entity.
+        scenarios (int): The number of scenarios.
+        solved (int): The number of scenarios having an IRR, the others being left out of the statistics.
+        mean (float): The mean annual IRR (rounded to 4 decimal places).
+        percentiles (dict[float, float]): The annual IRR at each percentile (rounded to 4 decimal places).
+    Methods:
+        from_rates(entity_name: str, rates: np.ndarray, percentiles: tuple): Summarise monthly IRRs.
+        to_dict(): Convert the summary to a dictionary for serialization.
+    """
+
+    entity_name: str
+    scenarios: int
+    solved: int
+    mean: float
+    percentiles: dict = field(hash=False)
+
+    @classmethod
+    def from_rates(
+        cls,
+        entity_name: str,
+        rates: np.ndarray,
+        percentiles: tuple[float, ...] = DEFAULT_PERCENTILES,
+    ) -> "ScenarioSummary":
+        """
+        Summarise the monthly IRRs of the scenarios of an entity, annualised as `model.Irr.value_annual` is.
+
+        Args:
+            entity_name (str): The name of the entity.
+            rates (np.ndarray): The monthly IRR of each scenario, nan when there is none.
+            percentiles (tuple[float, ...], optional): The percentiles to calculate.
+        Returns:
+            ScenarioSummary: The summary, with nan statistics when no scenario has an IRR.
+        """
+        annual = (1 + rates[np.isfinite(rates)]) ** 12 - 1
+        if annual.size:
+            mean = round(float(annual.mean()), model.IRR_DIGITS)
+            values = np.round(np.percentile(annual, percentiles), model.IRR_DIGITS)
+        else:
+            mean, values = np.nan, np.full(len(percentiles), np.nan)
+        return cls(
+            entity_name,
+            int(rates.shape[0]),
+            int(annual.size),
+            mean,
+            dict(zip(percentiles, values.tolist())),
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Convert the summary to a dictionary for serialization, with one "p<percentile>" key per percentile.
+
+        Returns:
+            dict: A dictionary representation of the summary.
+        """
+        return {
+            "entity_name": self.entity_name,
+            "scenarios": self.scenarios,
+            "solved": self.solved,
+            "mean": self.mean,
+            **{
+                f"p{percentile:g}": value
+                for percentile, value in self.percentiles.items()
+            },
+        }
+
+
+def shock_cashflows(
+    inflow: np.ndarray,
+    outflow: np.ndarray,
+    value: np.ndarray,
+    scales: np.ndarray,
+    delays: np.ndarray,
+    haircuts: np.ndarray,
+) -> np.ndarray:
+    """
+    Build the shocked periodic cashflows of scenarios of an entity, one row per scenario. As for the IRR of the last
+    prefix, each row holds the net flows of every period and the terminal value, received at the last period
+    delayed by the scenario's exit delay, net of its haircut.
+
+    Args:
+        inflow (np.ndarray): The inflow of each period of the entity.
+        outflow (np.ndarray): The outflow (distribution) of each period of the entity.
+        value (np.ndarray): The value held at each period of the entity.
+        scales (np.ndarray): The distribution scale of each scenario.
+        delays (np.ndarray): The exit delay of each scenario, in months.
+        haircuts (np.ndarray): The terminal haircut of each scenario.
+    Returns:
+        np.ndarray: The periodic cashflows, scenarios x (periods + the longest delay).
+    """
+    periods = inflow.shape[0]
+    matrix = np.zeros((scales.shape[0], periods + int(delays.max(initial=0))))
+    matrix[:, :periods] = scales[:, None] * outflow - inflow
+    matrix[np.arange(scales.shape[0]), periods - 1 + delays] += value[-1] * (
+        1 - haircuts
+    )
+
+    return matrix
+
+
+def evaluate_entity(
+    entity: model.Entity,
+    spec: ScenarioSpec,
+    irr_solver: solver.IrrSolver = None,
+    chunk_cells: int = DEFAULT_CHUNK_CELLS,
+) -> ScenarioSummary:
+    """
+    Calculate the distribution of an entity's since-inception IRR over the scenarios of a spec. The shocks are
+    drawn at once, and the scenarios are built and solved in chunks of at most `chunk_cells` scenarios x periods,
+    all the rows of a chunk together (see `batch.solve_rows()`), starting from the IRR of the unshocked cashflows.
+    Memory is bounded by the chunk size, whatever the number of scenarios.
+
+    Args:
+        entity (model.Entity): The entity, with its sorted cashflows.
+        spec (ScenarioSpec): The scenarios.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance, iteration cap and fallback.
+        chunk_cells (int, optional): The largest number of scenarios x periods solved at a time.
+    Returns:
+        ScenarioSummary: The summary of the IRR distribution.
+    """
+    rates = np.full(spec.scenarios, np.nan)
+    if entity.cashflow_count < 2:
+        model.logger.info("Not enough values for %s", entity.entity_name)
+        return ScenarioSummary.from_rates(entity.entity_name, rates, spec.percentiles)
+
+    inflow, outflow, value = entity.cashflow_columns()
+    base = outflow - inflow
+    base[-1] += value[-1]
+    guess = model.solve_cashflows(base, irr_solver=irr_solver).rate
+    if not np.isfinite(guess):
+        guess = solver.DEFAULT_GUESS
+    scales, delays, haircuts = spec.draw(entity.entity_name)
+    chunk = max(chunk_cells // (inflow.shape[0] + spec.max_exit_delay), 1)
+    for start in range(0, spec.scenarios, chunk):
+        stop = min(start + chunk, spec.scenarios)
+        matrix = shock_cashflows(
+            inflow,
+            outflow,
+            value,
+            scales[start:stop],
+            delays[start:stop],
+            haircuts[start:stop],
+        )
+        rates[start:stop] = batch.solve_rows(
+            matrix, np.full(stop - start, guess), irr_solver
+        )
+
+    return ScenarioSummary.from_rates(entity.entity_name, rates, spec.percentiles)
+
+
+def calculate_scenarios(
+    entities: dict[str : model.Entity],
+    spec: ScenarioSpec,
+    irr_solver: solver.IrrSolver = None,
+    chunk_cells: int = DEFAULT_CHUNK_CELLS,
+) -> list[ScenarioSummary]:
+    """
+    Calculate the distribution of the since-inception IRR of every entity over the scenarios of a spec.
+
+    Args:
+        entities (dict[str, model.Entity]): A dictionary of entities where keys are entity names, and values are
+                                            Entity objects.
+        spec (ScenarioSpec): The scenarios.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance, iteration cap and fallback.
+        chunk_cells (int, optional): The largest number of scenarios x periods solved at a time.
+    Returns:
+        list[ScenarioSummary]: The summary of each entity, in the order of the dictionary.
+    """
+    return [
+        evaluate_entity(entity, spec, irr_solver, chunk_cells)
+        for entity in entities.values()
+    ]
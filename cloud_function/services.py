@@ -1,20 +1,449 @@
+import hashlib
+import json
+import logging
+from typing import Iterable, Iterator
+from instrumentation import NO_INSTRUMENTATION, Instrumentation
 from repository import AbstractRepository
+import events
+import executor
 import model
+import scenarios
+import sharding
 
+DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_PIPELINED_BATCH_PERIODS = 100_000
+DEFAULT_SHARD_COUNT = 8
+DEFAULT_CHECKPOINT_ENTITIES = 10_000
 
-def irr_pipeline(repository: AbstractRepository):
+logger = logging.getLogger(__name__)
+
+
+def log_issues(report: model.IngestionReport):
+    """
+    Log the data quality problems found while ingesting cashflows, one warning per problem.
+
+    Args:
+        report (model.IngestionReport): The data quality problems found.
+    """
+    for issue in report.issues:
+        logger.warning("Ingestion issue %s", issue)
+
+
+def irr_pipeline(
+    repository: AbstractRepository,
+    engine=model.calculate_irrs,
+    instrumentation: Instrumentation = NO_INSTRUMENTATION,
+) -> model.IngestionReport:
+    """
+    Perform an Internal Rate of Return (IRR) data pipeline. The pipeline retrieves cashflows, ingests them into
+    entities in a single sorting pass, calculates IRRs, and loads IRR data into the repository.
+
+    Args:
+        repository (AbstractRepository): The repository for data retrieval and storage.
+        engine (callable, optional): The calculation strategy, which takes the dictionary of entities and
+                                     calculates their IRRs, e.g. `model.calculate_irrs` (default) or
+                                     `batch.calculate_irrs`.
+        instrumentation (Instrumentation, optional): Where to report the stages (fetch, allocation, entity
+                                                     creation, calculation and load) and the calculation results.
+                                                     Nothing is reported by default.
+    Returns:
+        model.IngestionReport: The data quality problems found in the cashflows.
+    """
+    with instrumentation.stage("fetch"):
+        cashflows = repository.get_cashflow_frame()
+    instrumentation.rows_read(len(cashflows))
+    with instrumentation.stage("allocation"):
+        cashflows, report = model.sort_cashflows(cashflows)
+    log_issues(report)
+    with instrumentation.stage("entity creation"):
+        entities = model.create_entities(cashflows)
+
+    with instrumentation.stage("calculation"):
+        instrumentation.engine(engine)(entities)
+    instrumentation.calculated(entities)
+
+    with instrumentation.stage("load"):
+        repository.load_irrs(entities)
+    instrumentation.finished()
+
+    return report
+
+
+def checkpointed_irr_pipeline(
+    repository: AbstractRepository,
+    run_id: str,
+    engine=model.calculate_irrs,
+    batch_entities: int = DEFAULT_CHECKPOINT_ENTITIES,
+) -> model.IngestionReport:
+    """
+    Perform a resumable Internal Rate of Return (IRR) data pipeline. Entities are split into batches in order of
+    name, and the IRRs of each batch are staged as soon as it is calculated, recording it as finished (see
+    `AbstractRepository.load_shard_irrs()`). When an attempt fails, e.g. on the function timeout or a transient
+    error, an attempt with the same run id skips the staged batches and only calculates the others. The
+    destination is replaced with every staged batch at once, only when they are all finished.
+
+    Staged batches are keyed by the run id and a digest of the batches, so that an attempt finding different
+    entities, or using another batch size, starts over instead of mixing batches of different plans.
+
+    Args:
+        repository (AbstractRepository): The repository for data retrieval, staging and storage.
+        run_id (str): The identifier of the run, the same for every attempt, e.g. the id of the triggering event.
+        engine (callable, optional): The calculation strategy, as for `irr_pipeline`, applied to each batch.
+        batch_entities (int, optional): The number of entities of each batch.
+    Returns:
+        model.IngestionReport: The data quality problems found in the cashflows.
+    """
+    cashflows = repository.get_cashflow_frame()
+    entities, report = model.ingest_cashflows(cashflows)
+    log_issues(report)
+
+    entity_names = sorted(entities)
+    batches = [
+        entity_names[start : start + batch_entities]
+        for start in range(0, len(entity_names), batch_entities)
+    ] or [[]]
+    digest = hashlib.sha1(
+        json.dumps([batch_entities, entity_names]).encode()
+    ).hexdigest()[:12]
+    staging_id = sharding.normalise_run_id(f"{run_id}_{digest}")
+    staged = repository.get_staged_shards(staging_id)
+    if staged:
+        logger.info(
+            "Resuming run %s: %d of %d batches staged",
+            run_id,
+            len(staged),
+            len(batches),
+        )
+    for position, batch in enumerate(batches):
+        if position in staged:
+            continue
+        batch = {entity_name: entities[entity_name] for entity_name in batch}
+        engine(batch)
+        repository.load_shard_irrs(staging_id, position, batch)
+        for entity in batch.values():
+            entity.irrs = []
+
+    repository.merge_shards(staging_id, len(batches))
+
+    return report
+
+
+def delta_irr_pipeline(
+    repository: AbstractRepository, engine=model.calculate_irrs
+) -> model.IngestionReport:
+    """
+    Perform an incremental Internal Rate of Return (IRR) data pipeline. The fingerprints of every entity's cashflows
+    are compared with the ones saved by the previous delta run, and only the entities whose cashflows changed are
+    retrieved, recomputed and upserted into the repository. Entities that no longer have cashflows lose their IRR
+    data. The fingerprints are saved last, so a failed run is fully retried by the next one.
+
+    Args:
+        repository (AbstractRepository): The repository for data retrieval and storage.
+        engine (callable, optional): The calculation strategy, as for `irr_pipeline`.
+    Returns:
+        model.IngestionReport: The data quality problems found in the cashflows retrieved.
+    """
+    fingerprints = repository.get_fingerprints()
+    state = repository.get_state()
+    changed = [
+        entity_name
+        for entity_name, fingerprint in fingerprints.items()
+        if state.get(entity_name) != fingerprint
+    ]
+    removed = [entity_name for entity_name in state if entity_name not in fingerprints]
+    if not changed and not removed:
+        return model.IngestionReport()
+
+    # the first run recomputes every entity, so there is no need to filter them
+    cashflows = repository.get_cashflow_frame(changed if state else None)
+    entities, report = model.ingest_cashflows(cashflows, changed)
+    log_issues(report)
+
+    engine(entities)
+
+    repository.upsert_irrs(entities, changed + removed)
+    repository.save_state(
+        {entity_name: fingerprints[entity_name] for entity_name in changed}, removed
+    )
+
+    return report
+
+
+def event_irr_pipeline(
+    repository: AbstractRepository,
+    update: events.EntityUpdate,
+    irr_solver=None,
+) -> model.IngestionReport:
     """
-    Perform an Internal Rate of Return (IRR) data pipeline. The pipeline retrieves cashflows, creates entities,
-    allocates cashflows to entities, calculates IRRs, and loads IRR data into the repository.
+    Perform the Internal Rate of Return (IRR) data pipeline of an event-driven update, for near real time IRRs
+    between scheduled runs. Only the cashflow histories of the affected entities are retrieved, and the cashflows of
+    the update are merged into them by binary search. As the IRR of a period only depends on the cashflows up to it,
+    each entity is only recomputed from the date of its earliest new cashflow, and only the IRR data from that date
+    onwards is replaced in the repository. Entities listed by name are recomputed and replaced entirely.
+
+    Delivering the same update again gives the same result, whether or not its cashflows reached the cashflow
+    source in the meantime, since a cashflow replaces the one of the same date.
 
     Args:
         repository (AbstractRepository): The repository for data retrieval and storage.
+        update (events.EntityUpdate): The new or corrected cashflows, and the entities to recompute.
+        irr_solver (solver.IrrSolver, optional): The solver to use. Defaults to solver.DEFAULT_SOLVER.
+    Returns:
+        model.IngestionReport: The data quality problems found in the cashflow histories retrieved.
     """
-    cashflows = repository.get_cashflows()
-    entities = model.entities_collection_creation(cashflows)
-    entities = model.allocate_cashflows_to_entities(cashflows, entities)
+    entity_names = update.affected_entities
+    if not entity_names:
+        return model.IngestionReport()
+    cashflows = repository.get_cashflow_frame(list(entity_names))
+    entities, report = model.ingest_cashflows(cashflows, entity_names)
+    log_issues(report)
 
+    for cashflow in update.cashflows:
+        entity = entities.setdefault(
+            cashflow.entity_name, model.Entity(cashflow.entity_name)
+        )
+        entity.upsert_cashflow(cashflow)
+    since = update.since()
     for entity in entities.values():
+        entity.calculate_irr(irr_solver, since=since.get(entity.entity_name))
+
+    repository.upsert_irrs(entities, list(entity_names), since)
+
+    return report
+
+
+def scenario_pipeline(
+    repository: AbstractRepository,
+    spec: scenarios.ScenarioSpec,
+    entity_names: list[str] = None,
+    irr_solver=None,
+    chunk_cells: int = scenarios.DEFAULT_CHUNK_CELLS,
+) -> list[scenarios.ScenarioSummary]:
+    """
+    Perform the scenario analysis of entities: their cashflows are retrieved once, and the distribution of their
+    since-inception IRR over the stressed scenarios of the spec is summarised. Nothing is written to the
+    repository.
+
+    Args:
+        repository (AbstractRepository): The repository for data retrieval.
+        spec (scenarios.ScenarioSpec): The scenarios.
+        entity_names (list[str], optional): The entities to analyse. Defaults to every entity.
+        irr_solver (solver.IrrSolver, optional): The solver to use. Defaults to solver.DEFAULT_SOLVER.
+        chunk_cells (int, optional): The largest number of scenarios x periods solved at a time.
+    Returns:
+        list[scenarios.ScenarioSummary]: The summary of each entity, in ascending order of entity names.
+    """
+    cashflows = repository.get_cashflow_frame(entity_names)
+    entities, report = model.ingest_cashflows(cashflows, entity_names)
+    log_issues(report)
+
+    entities = {name: entities[name] for name in sorted(entities)}
+    return scenarios.calculate_scenarios(entities, spec, irr_solver, chunk_cells)
+
+
+def batch_irrs(entities: Iterable[model.Entity], batch_size: int) -> Iterator[list]:
+    """
+    Calculate the IRRs of a stream of entities and group them into batches of fixed size.
+
+    Args:
+        entities (Iterable[model.Entity]): The entities, whose IRRs are calculated as they are read.
+        batch_size (int): The number of IRRs in each batch, but the last one.
+    Yields:
+        list[model.Irr]: The batches of IRRs.
+    """
+    batch = []
+    for entity in entities:
         entity.calculate_irr()
+        for irr in entity.irrs:
+            batch.append(irr)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def streaming_irr_pipeline(
+    repository: AbstractRepository, batch_size: int = DEFAULT_BATCH_SIZE
+):
+    """
+    Perform an Internal Rate of Return (IRR) data pipeline in bounded memory. Cashflows are streamed ordered by
+    entity name and date, each entity's IRRs are calculated as soon as its last cashflow has been read, and IRRs
+    are loaded into the repository in batches of fixed size. Memory holds at most one entity and one batch at a
+    time, however large the cashflow table is.
+
+    Args:
+        repository (AbstractRepository): The repository for data retrieval and storage.
+        batch_size (int, optional): The number of IRRs loaded into the repository at a time.
+    """
+    entities = model.iter_entities(repository.iter_cashflows())
+    repository.load_irrs_batches(batch_irrs(entities, batch_size))
+
+
+def pipelined_irr_pipeline(
+    repository: AbstractRepository,
+    engine=model.calculate_irrs,
+    run_id: str = "pipelined",
+    batch_periods: int = DEFAULT_PIPELINED_BATCH_PERIODS,
+    page_size: int = executor.DEFAULT_PAGE_SIZE,
+    prefetch_pages: int = executor.DEFAULT_PREFETCH_PAGES,
+    upload_workers: int = executor.DEFAULT_UPLOAD_WORKERS,
+    max_pending_uploads: int = executor.DEFAULT_MAX_PENDING_UPLOADS,
+    attempts: int = executor.DEFAULT_ATTEMPTS,
+) -> int:
+    """
+    Perform an Internal Rate of Return (IRR) data pipeline whose reads, calculation and loads overlap, so that its
+    wall time approaches the longest of the three instead of their sum. Cashflows are streamed ordered by entity
+    name and date by a background thread, which fetches the next pages while the calculation goes on. Entities are
+    calculated in batches of about `batch_periods` cashflows, and each batch is staged by a concurrent load job, as
+    the shards of a sharded run are, while the next batch is calculated.
+
+    Staging replaces the data of a previous attempt, so failed loads are attempted again. Once every batch is
+    staged they are merged into the IRR data at once, so a failed run leaves the previous IRR data in place. An
+    error of the reads, of the calculation or of a load stops the run and is raised.
+
+    Args:
+        repository (AbstractRepository): The repository for data retrieval and storage, supporting streaming and
+                                         sharded runs.
+        engine (callable, optional): The calculation strategy, as for `irr_pipeline`.
+        run_id (str, optional): The identifier of the run, naming its staged batches.
+        batch_periods (int, optional): The number of cashflows calculated and loaded at a time.
+        page_size (int, optional): The number of cashflows of each page read ahead.
+        prefetch_pages (int, optional): The number of pages of cashflows read ahead of the calculation.
+        upload_workers (int, optional): The number of load jobs running at the same time.
+        max_pending_uploads (int, optional): The number of batches queued or being loaded, beyond which the
+                                             calculation waits for the loads.
+        attempts (int, optional): The number of attempts of each load.
+    Returns:
+        int: The number of batches loaded.
+    """
+    run_id = sharding.normalise_run_id(run_id)
+    batch_count = 0
+    with executor.Prefetcher(
+        repository.iter_cashflows(), page_size, prefetch_pages
+    ) as cashflows, executor.Uploader(
+        repository.load_shard_irrs, upload_workers, max_pending_uploads, attempts
+    ) as uploader:
+        entities, periods = {}, 0
+        for entity in model.iter_entities(cashflows):
+            entities[entity.entity_name] = entity
+            periods += entity.cashflow_count
+            if periods >= batch_periods:
+                uploader.submit(run_id, batch_count, engine(entities))
+                batch_count += 1
+                entities, periods = {}, 0
+        if entities or batch_count == 0:
+            uploader.submit(run_id, batch_count, engine(entities))
+            batch_count += 1
+        uploader.wait()
+
+    repository.merge_shards(run_id, batch_count)
+
+    return batch_count
+
+
+def sharded_irr_pipeline(
+    repository: AbstractRepository,
+    publish,
+    shard_count: int = DEFAULT_SHARD_COUNT,
+    strategy: str = "hash",
+    run_id: str = "run",
+) -> list[sharding.ShardSpec]:
+    """
+    Coordinate a sharded Internal Rate of Return (IRR) data pipeline. Entities are split into shards, using the
+    number of rows of each entity given by its fingerprint, and one message per shard is published. Each message is
+    handled by `shard_irr_pipeline()`, and the last shard to finish publishes the message merging the results.
+
+    Args:
+        repository (AbstractRepository): The repository for data retrieval and storage.
+        publish (callable): Publishes a message (dict) to the workers, e.g. `PubSubPublisher.publish`.
+        shard_count (int, optional): The number of shards.
+        strategy (str, optional): "hash" or "balanced", see `sharding.plan_shards()`.
+        run_id (str, optional): The identifier of the run, which names its staged results.
+    Returns:
+        list[sharding.ShardSpec]: The shards published.
+    """
+    row_counts = {
+        entity_name: fingerprint.row_count
+        for entity_name, fingerprint in repository.get_fingerprints().items()
+    }
+    specs = sharding.plan_shards(
+        row_counts, shard_count, strategy, sharding.normalise_run_id(run_id)
+    )
+    for spec in specs:
+        publish(spec.to_message())
 
-    repository.load_irrs(entities)
+    return specs
+
+
+def shard_irr_pipeline(
+    repository: AbstractRepository,
+    spec: sharding.ShardSpec,
+    publish,
+    engine=model.calculate_irrs,
+) -> model.IngestionReport:
+    """
+    Perform the Internal Rate of Return (IRR) data pipeline of one shard of a sharded run. Only the cashflows of
+    the shard's entities are retrieved, and their IRRs are staged apart from the other shards. When every shard of
+    the run is staged, the message merging them is published. Running a shard again replaces its staged results.
+
+    Args:
+        repository (AbstractRepository): The repository for data retrieval and storage.
+        spec (sharding.ShardSpec): The shard to calculate.
+        publish (callable): Publishes the merge message.
+        engine (callable, optional): The calculation strategy, as for `irr_pipeline`.
+    Returns:
+        model.IngestionReport: The data quality problems found in the cashflows of the shard.
+    """
+    cashflows = repository.get_cashflow_frame(list(spec.entity_names))
+    entities, report = model.ingest_cashflows(cashflows, spec.entity_names)
+    log_issues(report)
+
+    engine(entities)
+
+    repository.load_shard_irrs(spec.run_id, spec.shard, entities)
+    if len(repository.get_staged_shards(spec.run_id)) == spec.shard_count:
+        publish(sharding.merge_message(spec.run_id, spec.shard_count))
+
+    return report
+
+
+def merge_irr_shards(
+    repository: AbstractRepository, run_id: str, shard_count: int
+) -> bool:
+    """
+    Publish the combined results of a sharded run, once every shard is staged. A merge message delivered again
+    after the merge finds no staged shard and does nothing.
+
+    Args:
+        repository (AbstractRepository): The repository for data retrieval and storage.
+        run_id (str): The identifier of the run.
+        shard_count (int): The number of shards of the run.
+    Returns:
+        bool: Whether the results were merged.
+    """
+    if len(repository.get_staged_shards(run_id)) < shard_count:
+        return False
+    repository.merge_shards(run_id, shard_count)
+
+    return True
+
+
+def handle_shard_message(
+    repository: AbstractRepository, message: dict, publish, engine=model.calculate_irrs
+):
+    """
+    Dispatch a message of a sharded run to the worker or to the merge step.
+
+    Args:
+        repository (AbstractRepository): The repository for data retrieval and storage.
+        message (dict): The message, with a "shard" or "merge" action.
+        publish (callable): Publishes the messages sent by the worker.
+        engine (callable, optional): The calculation strategy of the worker.
+    """
+    if message["action"] == "shard":
+        shard_irr_pipeline(
+            repository, sharding.ShardSpec.from_message(message), publish, engine
+        )
+    else:
+        merge_irr_shards(repository, message["run_id"], message["shard_count"])
@@ -0,0 +1,234 @@
+import base64
+from collections import deque
+from dataclasses import dataclass
+import hashlib
+import json
+import re
+import parallel
+
+SHARD_STRATEGIES = ("hash", "balanced")
+# the "update" messages are the ones of event-driven updates, see events.EntityUpdate
+MESSAGE_ACTIONS = ("shard", "merge", "update")
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    """
+    A data class representing the work of one worker of a sharded run.
+
+    Attributes:
+        run_id (str): The identifier of the run, shared by all its shards.
+        shard (int): The position of the shard, from 0 to shard_count - 1.
+        shard_count (int): The number of shards of the run.
+        entity_names (tuple[str, ...]): The entities of the shard.
+    """
+
+    run_id: str
+    shard: int
+    shard_count: int
+    entity_names: tuple[str, ...]
+
+    def to_message(self) -> dict:
+        """
+        Convert the shard spec to the message sent to its worker.
+
+        Returns:
+            dict: The message, with a "shard" action.
+        """
+        return {
+            "action": "shard",
+            "run_id": self.run_id,
+            "shard": self.shard,
+            "shard_count": self.shard_count,
+            "entity_names": list(self.entity_names),
+        }
+
+    @classmethod
+    def from_message(cls, message: dict) -> "ShardSpec":
+        """
+        Read a shard spec from the message sent to a worker.
+
+        Args:
+            message (dict): The message, as created by `to_message()`.
+        Returns:
+            ShardSpec: The shard spec.
+        """
+        return cls(
+            message["run_id"],
+            int(message["shard"]),
+            int(message["shard_count"]),
+            tuple(message["entity_names"]),
+        )
+
+
+def merge_message(run_id: str, shard_count: int) -> dict:
+    """
+    Create the message asking for the staged results of every shard of a run to be merged.
+
+    Args:
+        run_id (str): The identifier of the run.
+        shard_count (int): The number of shards of the run.
+    Returns:
+        dict: The message, with a "merge" action.
+    """
+    return {"action": "merge", "run_id": run_id, "shard_count": shard_count}
+
+
+def normalise_run_id(run_id: str) -> str:
+    """
+    Make a run identifier usable in table names, keeping only letters, digits and underscores.
+
+    Args:
+        run_id (str): The run identifier, e.g. a Pub/Sub message id.
+    Returns:
+        str: The normalised run identifier.
+    """
+    return re.sub(r"\W", "_", str(run_id))
+
+
+def shard_of(entity_name: str, shard_count: int) -> int:
+    """
+    Assign an entity to a shard by hash of its name. Unlike `hash()`, the result is the same in every process.
+
+    Args:
+        entity_name (str): The name of the entity.
+        shard_count (int): The number of shards.
+    Returns:
+        int: The shard of the entity.
+    """
+    digest = hashlib.blake2b(entity_name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shard_count
+
+
+def plan_shards(
+    row_counts: dict[str:int], shard_count: int, strategy: str, run_id: str
+) -> list[ShardSpec]:
+    """
+    Split entities into a fixed number of shards, some of which may be empty.
+
+    Args:
+        row_counts (dict[str, int]): The number of cashflow rows of each entity, keyed by entity name.
+        shard_count (int): The number of shards.
+        strategy (str): "hash" assigns each entity by hash of its name, so an entity stays in the same shard from
+                        one run to the next. "balanced" gives every shard a similar number of rows, the longest
+                        entities first.
+        run_id (str): The identifier of the run.
+    Returns:
+        list[ShardSpec]: One spec per shard, with entity names in ascending order.
+    Raises:
+        ValueError: If the strategy is unknown.
+    """
+    entity_names = sorted(row_counts)
+    if strategy == "hash":
+        shards = [[] for _ in range(shard_count)]
+        for entity_name in entity_names:
+            shards[shard_of(entity_name, shard_count)].append(entity_name)
+    elif strategy == "balanced":
+        chunks = parallel.balance_chunks(
+            [row_counts[entity_name] for entity_name in entity_names], shard_count
+        )
+        shards = [[entity_names[position] for position in chunk] for chunk in chunks]
+        shards += [[] for _ in range(shard_count - len(shards))]
+    else:
+        raise ValueError(f"Unknown shard strategy {strategy}")
+
+    return [
+        ShardSpec(run_id, shard, shard_count, tuple(names))
+        for shard, names in enumerate(shards)
+    ]
+
+
+def encode_event(message: dict) -> dict:
+    """
+    Wrap a message into an event shaped as the ones Pub/Sub sends to the Cloud Function.
+
+    Args:
+        message (dict): The message.
+    Returns:
+        dict: The event, whose `data` field holds the message as base64 encoded JSON.
+    """
+    return {"data": base64.b64encode(json.dumps(message).encode()).decode()}
+
+
+def decode_event(event: dict) -> dict:
+    """
+    Read the message of a sharded run, or of an event-driven update, from a Pub/Sub event.
+
+    Args:
+        event (dict): The event received by the Cloud Function.
+    Returns:
+        dict: The message, or None when the event does not hold one, e.g. when sent by the scheduler.
+    """
+    try:
+        message = json.loads(base64.b64decode((event or {}).get("data") or ""))
+    except ValueError:
+        return None
+    if isinstance(message, dict) and message.get("action") in MESSAGE_ACTIONS:
+        return message
+    return None
+
+
+class InProcessQueue:
+    """
+    A queue standing in for Pub/Sub, so that a sharded run can be executed in a single process, e.g. in tests.
+
+    Attributes:
+        messages (collections.deque): The messages published and not delivered yet.
+        delivered (list[dict]): The messages delivered so far, in order.
+
+    Methods:
+        publish(message: dict): Add a message to the queue.
+        drain(handler: callable): Deliver messages until the queue is empty.
+    """
+
+    def __init__(self):
+        self.messages = deque()
+        self.delivered = []
+
+    def publish(self, message: dict):
+        """
+        Add a message to the queue, encoded as a Pub/Sub event.
+
+        Args:
+            message (dict): The message.
+        """
+        self.messages.append(encode_event(message))
+
+    def drain(self, handler):
+        """
+        Deliver messages one at a time, including the ones published while delivering, until the queue is empty.
+
+        Args:
+            handler (callable): Called with each event, as the Cloud Function entry point is.
+        """
+        while self.messages:
+            event = self.messages.popleft()
+            self.delivered.append(decode_event(event))
+            handler(event)
+
+
+class PubSubPublisher:
+    """
+    A publisher sending messages to a Pub/Sub topic, as JSON.
+
+    Args:
+        topic (str): The full name of the topic, "projects/{project}/topics/{topic}".
+
+    Methods:
+        publish(message: dict): Publish a message and wait until it is accepted.
+    """
+
+    def __init__(self, topic: str):
+        from google.cloud import pubsub_v1
+
+        self.client = pubsub_v1.PublisherClient()
+        self.topic = topic
+
+    def publish(self, message: dict):
+        """
+        Publish a message and wait until it is accepted by Pub/Sub.
+
+        Args:
+            message (dict): The message.
+        """
+        self.client.publish(self.topic, json.dumps(message).encode()).result()
@@ -0,0 +1,373 @@
+from dataclasses import dataclass
+import math
+import numpy as np
+
+DEFAULT_GUESS = 0.1
+DEFAULT_TOLERANCE = 1e-12
+DEFAULT_MAX_ITERATIONS = 50
+DEFAULT_BRACKET_MAX_ITERATIONS = 200
+
+
+@dataclass(frozen=True)
+class SolverResult:
+    """
+    A data class representing the outcome of a single IRR solve.
+
+    Attributes:
+        rate (float): The periodic rate found, or nan if the cashflows have no valid IRR.
+        iterations (int): The number of iterations spent by the root finder.
+        converged (bool): Whether the root finder met the tolerance within the iteration cap.
+        method (str): The method that produced the rate: "halley", "brent", "exact", "reference" or "none", or the
+                      closed form used by `model.solve_cashflows()`: "two_period", "power" or "annuity".
+    """
+
+    rate: float
+    iterations: int
+    converged: bool
+    method: str
+
+
+def sign_changes(values: np.ndarray) -> int:
+    """
+    Count the sign changes of a cashflow vector, ignoring zeros. By Descartes' rule of signs this is an upper bound
+    on the number of IRRs greater than -1, and a single sign change guarantees exactly one.
+
+    Args:
+        values (np.ndarray): The periodic cashflows.
+    Returns:
+        int: The number of sign changes.
+    """
+    signs = np.sign(values[values != 0])
+    return int(np.count_nonzero(signs[1:] != signs[:-1]))
+
+
+def root_bounds(values: np.ndarray) -> tuple[int, int]:
+    """
+    Bound the number of IRRs on each side of zero. Dividing the NPV polynomial by (1 - x), with x = 1 / (1 + rate),
+    turns its coefficients into running totals, so by Descartes' rule of signs the sign changes of the running total
+    bound the positive IRRs and those of the reversed running total bound the IRRs between -1 and 0 (Norstrom).
+
+    Args:
+        values (np.ndarray): The periodic cashflows.
+    Returns:
+        tuple[int, int]: The upper bounds on the number of positive and of negative IRRs.
+    """
+    return sign_changes(np.cumsum(values)), sign_changes(np.cumsum(values[::-1]))
+
+
+def npv_derivatives(
+    rate: float, values: np.ndarray, times: np.ndarray = None
+) -> tuple[float, float, float]:
+    """
+    Evaluate the NPV of a cashflow vector and its first and second derivatives with respect to the rate in O(n).
+
+    Args:
+        rate (float): The periodic discount rate, greater than -1.
+        values (np.ndarray): The periodic cashflows, where position t is discounted t periods.
+        times (np.ndarray, optional): The time of each cashflow, in periods of the rate, possibly fractional. By
+                                      default position t is at time t.
+    Returns:
+        tuple[float, float, float]: NPV, first derivative and second derivative at the given rate.
+    """
+    periods = np.arange(values.shape[0], dtype=float) if times is None else times
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        discounted = values * (1.0 + rate) ** -periods
+        npv = discounted.sum()
+        first = -(periods * discounted).sum() / (1.0 + rate)
+        second = (periods * (periods + 1.0) * discounted).sum() / (1.0 + rate) ** 2
+    return float(npv), float(first), float(second)
+
+
+def is_root(
+    rate: float, values: np.ndarray, tolerance: float, times: np.ndarray = None
+) -> bool:
+    """
+    Tell whether a rate is an IRR, e.g. where a root finder stopped because its step vanished, which also happens
+    where the slope of the NPV flattens out away from any root, or as the rate approaches -1. The NPV has to vanish
+    within the tolerance, relative to the size of the discounted cashflows.
+
+    Args:
+        rate (float or np.ndarray): The periodic rate, or one rate per row of cashflows.
+        values (np.ndarray): The periodic cashflows, or one row of them per rate.
+        tolerance (float): The relative tolerance of the NPV.
+        times (np.ndarray, optional): The time of each cashflow, by default its position.
+    Returns:
+        bool or np.ndarray: Whether the rate is an IRR, or whether each rate is.
+    """
+    periods = np.arange(values.shape[-1], dtype=float) if times is None else times
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        discounted = (
+            values * (1.0 + np.asarray(rate, dtype=float)[..., None]) ** -periods
+        )
+        npv, size = discounted.sum(axis=-1), np.abs(discounted).sum(axis=-1)
+    return np.abs(npv) <= tolerance * size
+
+
+def _npv(rate: float, values: np.ndarray, times: np.ndarray = None) -> float:
+    periods = np.arange(values.shape[0], dtype=float) if times is None else times
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        return float((values * (1.0 + rate) ** -periods).sum())
+
+
+class IrrSolver:
+    """
+    An IRR root finder that replaces the polynomial root search of `npf.irr` with an O(n) per iteration Halley
+    method, warm-started from a caller supplied guess and backed by a Brent bracketing fallback.
+
+    Like `npf.irr` the IRR returned is the one closest to zero. When `root_bounds` shows at most one IRR on each side
+    of zero, each side is solved on its own and the closest rate kept. Any other cashflows may have several IRRs on
+    one side, so they are delegated to `npf.irr` itself.
+
+    Args:
+        tolerance (float, optional): The absolute step size under which the rate is considered converged, provided
+                                     the NPV vanishes within it too (see `is_root()`).
+        max_iterations (int, optional): The iteration cap for the Halley method.
+        bracket_max_iterations (int, optional): The iteration cap for the Brent fallback.
+    Methods:
+        solve(values, guess): Calculate the IRR of a cashflow vector.
+        solve_side(values, side, guess, times): Calculate the single IRR of a cashflow vector on a given side of
+            zero.
+        solve_dated(values, times, guess): Calculate the IRR of cashflows at arbitrary times, as XIRR does.
+        solve_prefixes(flows, values): Calculate the IRR of every prefix of an entity's cashflows.
+    """
+
+    def __init__(
+        self,
+        tolerance: float = DEFAULT_TOLERANCE,
+        max_iterations: int = DEFAULT_MAX_ITERATIONS,
+        bracket_max_iterations: int = DEFAULT_BRACKET_MAX_ITERATIONS,
+    ):
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.bracket_max_iterations = bracket_max_iterations
+
+    def solve(self, values: np.ndarray, guess: float = None) -> SolverResult:
+        """
+        Calculate the IRR of a cashflow vector.
+
+        Args:
+            values (np.ndarray): The periodic cashflows.
+            guess (float, optional): The starting rate, usually the IRR of the previous prefix.
+        Returns:
+            SolverResult: The rate found and how it was found.
+        """
+        values = np.asarray(values, dtype=float)
+        if sign_changes(values) == 0:
+            return SolverResult(math.nan, 0, True, "none")
+        total = values.sum()
+        if total == 0:
+            return SolverResult(0.0, 0, True, "exact")
+        positive_bound, negative_bound = root_bounds(values)
+        if positive_bound > 1 or negative_bound > 1:
+            # imported here, the reference solver being seldom needed
+            import numpy_financial as npf
+
+            return SolverResult(float(npf.irr(values)), 0, True, "reference")
+
+        # NPV equals the total at a zero rate, tends to the sign of the first non zero flow as the rate grows and to
+        # the sign of the last one as the rate approaches -1: a side holds its (single) IRR when those signs differ.
+        non_zero = values[values != 0]
+        sides = [
+            side
+            for side, limit in ((1, non_zero[0]), (-1, non_zero[-1]))
+            if np.sign(limit) != np.sign(total)
+        ]
+        if not sides:
+            return SolverResult(math.nan, 0, True, "none")
+
+        if len(sides) == 1:
+            return self.solve_side(values, sides[0], guess)
+
+        results = [self._brent(values, side, 0) for side in sides]
+        iterations = sum(result.iterations for result in results)
+        result = min(results, key=lambda result: abs(result.rate))
+        return SolverResult(
+            result.rate, iterations, all(r.converged for r in results), "brent"
+        )
+
+    def solve_side(
+        self,
+        values: np.ndarray,
+        side: int,
+        guess: float = None,
+        times: np.ndarray = None,
+    ) -> SolverResult:
+        """
+        Calculate the IRR of a cashflow vector known to have a single IRR, on the given side of zero, e.g. because
+        it has a single sign change. The Halley method is tried first and Brent's method is the fallback.
+
+        Args:
+            values (np.ndarray): The periodic cashflows.
+            side (int): 1 when the IRR is positive, -1 when it is negative.
+            guess (float, optional): The starting rate, usually the IRR of the previous prefix.
+            times (np.ndarray, optional): The time of each cashflow, by default its position.
+        Returns:
+            SolverResult: The rate found and how it was found.
+        """
+        if guess is None or not math.isfinite(guess) or guess <= -1:
+            guess = DEFAULT_GUESS
+        result = self._halley(values, guess, times)
+        if result.converged and np.sign(result.rate) == side:
+            return result
+        return self._brent(values, side, result.iterations, times)
+
+    def solve_dated(
+        self, values: np.ndarray, times: np.ndarray, guess: float = None
+    ) -> SolverResult:
+        """
+        Calculate the IRR of cashflows happening at arbitrary times, e.g. year fractions, as a spreadsheet XIRR
+        does. The sides of zero holding an IRR are found as in `solve()`. Descartes' rule does not bound the IRRs of
+        such cashflows, so when no side is certain to hold one the Halley method is tried from the guess, and nan
+        returned unless it converges to a rate where the NPV vanishes (see `is_root()`).
+
+        Args:
+            values (np.ndarray): The cashflows.
+            times (np.ndarray): The time of each cashflow, in ascending order, in periods of the rate.
+            guess (float, optional): The starting rate, usually the IRR of the previous prefix.
+        Returns:
+            SolverResult: The rate found and how it was found.
+        """
+        values = np.asarray(values, dtype=float)
+        if sign_changes(values) == 0:
+            return SolverResult(math.nan, 0, True, "none")
+        total = values.sum()
+        if total == 0:
+            return SolverResult(0.0, 0, True, "exact")
+
+        non_zero = values[values != 0]
+        sides = [
+            side
+            for side, limit in ((1, non_zero[0]), (-1, non_zero[-1]))
+            if np.sign(limit) != np.sign(total)
+        ]
+        if len(sides) == 1:
+            return self.solve_side(values, sides[0], guess, times)
+        if sides:
+            results = [self._brent(values, side, 0, times) for side in sides]
+            iterations = sum(result.iterations for result in results)
+            result = min(results, key=lambda result: abs(result.rate))
+            return SolverResult(
+                result.rate, iterations, all(r.converged for r in results), "brent"
+            )
+
+        if guess is None or not math.isfinite(guess) or guess <= -1:
+            guess = DEFAULT_GUESS
+        result = self._halley(values, guess, times)
+        if result.converged:
+            return result
+        return SolverResult(math.nan, result.iterations, False, "none")
+
+    def solve_prefixes(
+        self, flows: np.ndarray, values: np.ndarray
+    ) -> list[SolverResult]:
+        """
+        Calculate the IRR of every prefix of an entity's cashflows. The prefix ending at period k is made of the net
+        flows up to k plus the value held at k, and its solve starts from the rate of the prefix ending at k - 1.
+
+        Args:
+            flows (np.ndarray): The net flow (outflow - inflow) of each period.
+            values (np.ndarray): The value held at each period.
+        Returns:
+            list[SolverResult]: One result per period from the second period onwards.
+        """
+        flows = np.asarray(flows, dtype=float)
+        values = np.asarray(values, dtype=float)
+        results = []
+        guess = None
+        for period in range(1, flows.shape[0]):
+            periodic_cashflow = flows[: period + 1].copy()
+            periodic_cashflow[period] += values[period]
+            result = self.solve(periodic_cashflow, guess)
+            if math.isfinite(result.rate):
+                guess = result.rate
+            results.append(result)
+
+        return results
+
+    def _halley(
+        self, values: np.ndarray, rate: float, times: np.ndarray = None
+    ) -> SolverResult:
+        for iteration in range(1, self.max_iterations + 1):
+            npv, first, second = npv_derivatives(rate, values, times)
+            denominator = 2 * first * first - npv * second
+            if denominator != 0 and math.isfinite(denominator):
+                step = 2 * npv * first / denominator
+            elif first != 0 and math.isfinite(first):
+                step = npv / first
+            else:
+                return SolverResult(math.nan, iteration, False, "halley")
+            if not math.isfinite(step):
+                return SolverResult(math.nan, iteration, False, "halley")
+
+            new_rate = rate - step
+            if new_rate <= -1:
+                new_rate = (rate - 1) / 2
+            if abs(new_rate - rate) < self.tolerance:
+                converged = bool(is_root(new_rate, values, self.tolerance, times))
+                return SolverResult(new_rate, iteration, converged, "halley")
+            rate = new_rate
+
+        return SolverResult(rate, self.max_iterations, False, "halley")
+
+    @staticmethod
+    def _bracket(
+        values: np.ndarray, side: int, times: np.ndarray = None
+    ) -> tuple[float, float]:
+        non_zero = values[values != 0]
+        if side > 0:
+            high = 1.0
+            while _npv(high, values, times) * non_zero[0] < 0 and high < 1e12:
+                high *= 10
+            return 0.0, high
+        step = 0.5
+        while _npv(-1 + step, values, times) * non_zero[-1] < 0 and -1 + step / 10 > -1:
+            step /= 10
+        return -1 + step, 0.0
+
+    def _brent(
+        self, values: np.ndarray, side: int, iterations: int, times: np.ndarray = None
+    ) -> SolverResult:
+        low, high = self._bracket(values, side, times)
+        f_low, f_high = _npv(low, values, times), _npv(high, values, times)
+        if not (math.isfinite(f_low) and math.isfinite(f_high)) or f_low * f_high > 0:
+            return SolverResult(math.nan, iterations, False, "brent")
+
+        a, b, fa, fb = low, high, f_low, f_high
+        c, fc = a, fa
+        d = e = b - a
+        for iteration in range(1, self.bracket_max_iterations + 1):
+            if fb * fc > 0:
+                c, fc = a, fa
+                d = e = b - a
+            if abs(fc) < abs(fb):
+                a, b, c = b, c, b
+                fa, fb, fc = fb, fc, fb
+            tolerance = 2 * np.finfo(float).eps * abs(b) + self.tolerance / 2
+            midpoint = (c - b) / 2
+            if abs(midpoint) <= tolerance or fb == 0:
+                return SolverResult(b, iterations + iteration, True, "brent")
+            if abs(e) >= tolerance and abs(fa) > abs(fb):
+                s = fb / fa
+                if a == c:
+                    p, q = 2 * midpoint * s, 1 - s
+                else:
+                    q, r = fa / fc, fb / fc
+                    p = s * (2 * midpoint * q * (q - r) - (b - a) * (r - 1))
+                    q = (q - 1) * (r - 1) * (s - 1)
+                if p > 0:
+                    q = -q
+                p = abs(p)
+                if 2 * p < min(3 * midpoint * q - abs(tolerance * q), abs(e * q)):
+                    e, d = d, p / q
+                else:
+                    d = e = midpoint
+            else:
+                d = e = midpoint
+            a, fa = b, fb
+            b += d if abs(d) > tolerance else math.copysign(tolerance, midpoint)
+            fb = _npv(b, values, times)
+
+        return SolverResult(b, iterations + self.bracket_max_iterations, False, "brent")
+
+
+DEFAULT_SOLVER = IrrSolver()
@@ -0,0 +1,135 @@
+import math
+import time
+import numpy as np
+import instrumentation
+import model
+import solver
+
+DAY_COUNT_CONVENTIONS = ("ACT/365F", "ACT/360", "30E/360")
+DEFAULT_DAY_COUNT = "ACT/365F"
+
+
+def year_fractions(dates: np.ndarray, day_count: str = DEFAULT_DAY_COUNT) -> np.ndarray:
+    """
+    Calculate the time elapsed from the first date to each date, in years of the day count convention.
+
+    Args:
+        dates (np.ndarray): The dates as datetime64[D], in ascending order.
+        day_count (str, optional): "ACT/365F" counts actual days over years of 365 days, as a spreadsheet XIRR
+                                   does, "ACT/360" actual days over years of 360 days, and "30E/360" counts every
+                                   month as 30 days.
+    Returns:
+        np.ndarray: The year fraction of each date.
+    Raises:
+        ValueError: If the day count convention is unknown.
+    """
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    if dates.shape[0] == 0:
+        return np.zeros(0)
+    if day_count in ("ACT/365F", "ACT/360"):
+        days = (dates - dates[0]).astype(float)
+        return days / (365.0 if day_count == "ACT/365F" else 360.0)
+    if day_count == "30E/360":
+        months = dates.astype("datetime64[M]")
+        days = np.minimum((dates - months).astype(int) + 1, 30)
+        months = months.astype(int)
+        return (30.0 * (months - months[0]) + (days - days[0])) / 360.0
+    raise ValueError(f"Unknown day count convention {day_count}")
+
+
+def solve_prefixes(
+    flows: np.ndarray,
+    values: np.ndarray,
+    times: np.ndarray,
+    irr_solver: solver.IrrSolver = None,
+) -> list[solver.SolverResult]:
+    """
+    Calculate the annual XIRR of every prefix of an entity's cashflows. Prefixes are made as in
+    `model.solve_prefixes()`, share the year fractions calculated once for the entity, and each solve starts from the
+    rate of the previous prefix.
+
+    Args:
+        flows (np.ndarray): The net flow (outflow - inflow) of each cashflow.
+        values (np.ndarray): The value held at each cashflow.
+        times (np.ndarray): The year fraction of each cashflow, as calculated by `year_fractions()`.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance and iteration caps.
+    Returns:
+        list[solver.SolverResult]: One result per cashflow from the second one onwards.
+    """
+    irr_solver = irr_solver or solver.DEFAULT_SOLVER
+    flows = np.asarray(flows, dtype=float)
+    values = np.asarray(values, dtype=float)
+    results = []
+    guess = None
+    for period in range(1, flows.shape[0]):
+        dated_cashflow = flows[: period + 1].copy()
+        dated_cashflow[period] += values[period]
+        result = irr_solver.solve_dated(dated_cashflow, times[: period + 1], guess)
+        if math.isfinite(result.rate):
+            guess = result.rate
+        results.append(result)
+
+    return results
+
+
+def calculate_irrs(
+    entities: dict[str : model.Entity],
+    day_count: str = DEFAULT_DAY_COUNT,
+    irr_solver: solver.IrrSolver = None,
+    instrumentation: instrumentation.Instrumentation = None,
+) -> dict[str : model.Entity]:
+    """
+    Calculate date-aware IRR data (XIRR) for every entity. This is a calculation strategy for the IRR pipeline that
+    discounts each cashflow by the year fraction from the entity's first cashflow, instead of counting one month
+    per row, and produces Xirr objects.
+
+    Args:
+        entities (dict[str, model.Entity]): A dictionary of entities where keys are entity names, and values are
+                                            Entity objects.
+        day_count (str, optional): The day count convention of the year fractions, one of DAY_COUNT_CONVENTIONS.
+        irr_solver (solver.IrrSolver, optional): The solver giving tolerance and iteration caps.
+        instrumentation (instrumentation.Instrumentation, optional): Where to report the solver results of each
+                                                                     entity.
+    Returns:
+        dict[str, model.Entity]: A dictionary of entities with updated IRR data.
+    Raises:
+        ValueError: If the day count convention is unknown.
+    """
+    if day_count not in DAY_COUNT_CONVENTIONS:
+        raise ValueError(f"Unknown day count convention {day_count}")
+    for entity in entities.values():
+        if instrumentation is not None:
+            start = time.perf_counter()
+        entity.irrs = []
+        results = []
+        if entity.cashflow_count < 2:
+            model.logger.info("Not enough values for %s", entity.entity_name)
+        else:
+            dates = entity.cashflow_dates()
+            if entity.frame is not None:
+                times = year_fractions(entity.frame.date, day_count)
+            else:
+                times = year_fractions(
+                    np.array(dates, dtype="datetime64[D]"), day_count
+                )
+            results = solve_prefixes(*entity.cashflow_arrays(), times, irr_solver)
+            for date, result in zip(dates[1:], results):
+                monthly = (1 + result.rate) ** (1 / 12) - 1
+                entity.irrs.append(
+                    model.Xirr(
+                        date,
+                        round(monthly, model.IRR_DIGITS),
+                        entity.entity_name,
+                        annual=round(result.rate, model.IRR_DIGITS),
+                        day_count=day_count,
+                    )
+                )
+        if instrumentation is not None:
+            instrumentation.entity_solved(
+                entity.entity_name,
+                entity.cashflow_count,
+                results,
+                time.perf_counter() - start,
+            )
+
+    return entities
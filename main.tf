@@ -20,6 +20,12 @@ resource "google_project_iam_member" "big_query_jobUser" {
   member  = "serviceAccount:${google_service_account.default.email}"
 }
 
+resource "google_project_iam_member" "pubsub_publisher" {
+  project = var.project_id
+  role    = "roles/pubsub.publisher"
+  member  = "serviceAccount:${google_service_account.default.email}"
+}
+
 resource "google_storage_bucket" "source_code" {
   name                        = "irr-calculator-source-code-location"
   storage_class               = "STANDARD"
@@ -64,10 +70,47 @@ resource "google_cloudfunctions_function" "irr_calculator" {
   source_archive_object = google_storage_bucket_object.zip.name
   entry_point           = var.function_entry_point
   service_account_email = google_service_account.default.email
-  max_instances         = 1
+  max_instances         = var.max_instances
+
+  environment_variables = {
+    IRR_PIPELINE_MODE                = var.pipeline_mode
+    IRR_PIPELINE_SHARDS              = var.shard_count
+    IRR_PIPELINE_TOPIC               = google_pubsub_topic.default.id
+    IRR_PIPELINE_DAY_COUNT           = var.day_count
+    IRR_PIPELINE_ANALYTICS           = join(",", var.analytics)
+    IRR_PIPELINE_HURDLE_RATE         = var.hurdle_rate
+    IRR_PIPELINE_WINDOWS             = join(",", var.windows)
+    IRR_PIPELINE_HIERARCHY           = var.hierarchy ? "true" : ""
+    IRR_PIPELINE_CHECKPOINT_ENTITIES = var.checkpoint_entities
+  }
 
   event_trigger {
     event_type = "google.pubsub.topic.publish"
     resource   = google_pubsub_topic.default.name
+
+    # checkpointed runs resume from their staged batches when the event is delivered again
+    dynamic "failure_policy" {
+      for_each = var.pipeline_mode == "checkpointed" ? [true] : []
+      content {
+        retry = true
+      }
+    }
   }
-}
\ No newline at end of file
+}
+
+resource "google_cloudfunctions_function" "irr_lookup" {
+  name                  = "${var.cloud_function_name}-lookup"
+
+  runtime               = "python310"
+  available_memory_mb   = var.lookup_memory_mb
+  timeout               = 60
+  source_archive_bucket = google_storage_bucket.source_code.name
+  source_archive_object = google_storage_bucket_object.zip.name
+  entry_point           = "lookup_entry_point"
+  service_account_email = google_service_account.default.email
+  trigger_http          = true
+
+  environment_variables = {
+    IRR_LOOKUP_CHECK_SECONDS = var.lookup_check_seconds
+  }
+}
@@ -1,5 +1,7 @@
 import pytest
-from cloud_function.repository import BiqQueryRepository
+from cloud_function.repository import BiqQueryRepository, InMemoryRepository
+from cloud_function import model
+import datetime as dt
 import os
 from tests.data.cashflows import CASHFLOWS
 from google.cloud import bigquery
@@ -15,7 +17,8 @@ def bq_repository():
     """
     bq_repository = BiqQueryRepository(project=os.environ["PROJECT"])
     bq_repository.cashflow_source = (
-        f"SELECT * FROM {os.environ['DATASET']}.{os.environ['SOURCE_TABLE']}"
+        "SELECT date, inflow, outflow, value, entity_name "
+        f"FROM {os.environ['DATASET']}.{os.environ['SOURCE_TABLE']}"
     )
     bq_repository.irr_destination = (
         os.environ["DATASET"] + "." + os.environ["DESTINATION_TABLE"]
@@ -53,3 +56,25 @@ def repository_with_cashflows(bq_repository):
     bq_repository.client.delete_table(
         os.environ["DATASET"] + "." + os.environ["DESTINATION_TABLE"]
     )
+
+
+@pytest.fixture(scope="function")
+def memory_repository():
+    """
+    Fixture that returns instance of InMemoryRepository() holding the test cashflows
+
+    Returns:
+        instance of InMemoryRepository()
+    """
+    return InMemoryRepository(
+        [
+            model.Cashflow(
+                dt.date.fromisoformat(cashflow["date"]),
+                cashflow["inflow"],
+                cashflow["outflow"],
+                cashflow["value"],
+                cashflow["entity_name"],
+            )
+            for cashflow in CASHFLOWS
+        ]
+    )
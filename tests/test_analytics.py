@@ -0,0 +1,123 @@
+from cloud_function import (
+    analytics,
+    batch,
+    instrumentation,
+    model,
+    repository,
+    services,
+)
+import datetime as dt
+import math
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+CASHFLOWS = [
+    model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "test account"),
+    model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, "test account"),
+    model.Cashflow(dt.date(2022, 3, 1), 500, 0, 1600, "test account"),
+    model.Cashflow(dt.date(2022, 4, 1), 0, 300, 1400, "test account"),
+]
+
+
+def test_prefix_analytics():
+    """
+    GIVEN an entity's inflows, outflows and values
+    WHEN the analytics of every prefix are calculated (analytics.prefix_analytics())
+    THEN npv at the hurdle rate, tvpi, dpi and moic have to be calculated from the second period onwards
+    """
+    inflow = np.array([1000.0, 0, 500, 0])
+    outflow = np.array([0.0, 100, 0, 300])
+    value = np.array([0.0, 1000, 1600, 1400])
+    discount = analytics.discount_factors(4, 0.08)
+
+    columns = analytics.prefix_analytics(inflow, outflow, value, discount)
+
+    assert list(columns) == ["npv", "tvpi", "dpi", "moic"]
+    assert columns["npv"][0] == round(1100 * 1.08 ** (-1 / 12) - 1000, 4)
+    assert columns["tvpi"].tolist() == [1.1, round(1700 / 1500, 4), 1.2]
+    assert columns["dpi"].tolist() == [0.1, round(100 / 1500, 4), round(400 / 1500, 4)]
+    assert columns["moic"].tolist() == [
+        1.1,
+        round(1700 / 1400, 4),
+        round(1800 / 1400, 4),
+    ]
+
+
+def test_prefix_analytics_undefined_ratios():
+    """
+    GIVEN cashflows without any capital paid in
+    WHEN their ratios are calculated (analytics.prefix_analytics())
+    THEN they have to be nan instead of infinite
+    """
+    columns = analytics.prefix_analytics(
+        np.zeros(2), np.array([0.0, 100]), np.array([0.0, 50]), np.ones(2), ("tvpi",)
+    )
+
+    assert math.isnan(columns["tvpi"][0])
+
+
+def test_add_analytics_rejects_unknown_analytic():
+    """
+    GIVEN an unknown analytic
+    WHEN analytics are added to entities (analytics.add_analytics())
+    THEN a ValueError has to be raised
+    """
+    with pytest.raises(ValueError):
+        analytics.add_analytics({}, ("rvpi",))
+
+
+@pytest.mark.parametrize("engine", [model.calculate_irrs, batch.calculate_irrs])
+def test_irr_pipeline_writes_analytics(tmp_path, engine):
+    """
+    GIVEN a repository with cashflows and an engine extended with some analytics (analytics.with_analytics())
+    WHEN irr_pipeline() is run with metrics instrumentation
+    THEN the irrs have to hold the analytics as extra columns next to irr_monthly and irr_annual, written to Parquet,
+         and the solver telemetry of the engine has to be collected still
+    """
+    destination = tmp_path / "irrs.parquet"
+    in_memory = repository.InMemoryRepository(CASHFLOWS)
+    metrics = instrumentation.MetricsInstrumentation(log=False)
+
+    services.irr_pipeline(
+        in_memory,
+        analytics.with_analytics(engine, ("tvpi", "dpi")),
+        metrics,
+    )
+    repository.FileRepository("", str(destination)).load_irrs_batches([in_memory.irrs])
+
+    assert [irr.metrics for irr in in_memory.irrs] == [
+        {"tvpi": 1.1, "dpi": 0.1},
+        {"tvpi": 1.1333, "dpi": 0.0667},
+        {"tvpi": 1.2, "dpi": 0.2667},
+    ]
+    table = pq.read_table(destination)
+    assert table.column_names == [
+        "date",
+        "irr_monthly",
+        "irr_annual",
+        "tvpi",
+        "dpi",
+        "entity_name",
+    ]
+    assert table.column("dpi").to_pylist() == [0.1, 0.0667, 0.2667]
+    if engine is model.calculate_irrs:
+        assert metrics.metrics.solved_entities == 1
+
+
+def test_irr_schema_places_metric_columns():
+    """
+    GIVEN metric columns and Xirr data
+    WHEN the BigQuery schema of IRR data is built (repository.irr_schema())
+    THEN the metric columns have to follow irr_annual and the day count convention come last
+    """
+    schema = repository.irr_schema(["npv"], day_count=True)
+
+    assert [field.name for field in schema] == [
+        "date",
+        "irr_monthly",
+        "irr_annual",
+        "npv",
+        "entity_name",
+        "day_count",
+    ]
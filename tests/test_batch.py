@@ -0,0 +1,110 @@
+from cloud_function import batch, model, services
+from cloud_function.repository import InMemoryRepository
+import datetime as dt
+import math
+import numpy as np
+import pytest
+
+
+def random_entities(seed: int, size: int) -> dict:
+    rng = np.random.default_rng(seed)
+    entities = {}
+    for number in range(size):
+        entity_name = f"entity {number}"
+        entity = model.Entity(entity_name)
+        periods = int(rng.integers(1, 40))
+        values = 1000 * np.cumprod(rng.uniform(0.97, 1.04, size=periods))
+        flows = rng.choice([0.0, -50.0, 100.0, -300.0], size=periods)
+        for period in range(periods):
+            entity.add_cashflow(
+                model.Cashflow(
+                    dt.datetime(2000, 1, 1) + dt.timedelta(days=31 * period),
+                    1000 if period == 0 else max(-flows[period], 0),
+                    0 if period == 0 else max(flows[period], 0),
+                    values[period],
+                    entity_name,
+                )
+            )
+        entities[entity_name] = entity
+
+    return entities
+
+
+def irr_rows(entities: dict) -> list[tuple]:
+    return [
+        (irr.date, None if math.isnan(irr.value) else irr.value, irr.entity_name)
+        for entity in entities.values()
+        for irr in entity.irrs
+    ]
+
+
+def test_pack_cashflows():
+    """
+    GIVEN entities with different number of cashflows
+    WHEN they are packed (batch.pack_cashflows())
+    THEN flows and values have to be laid out one row per entity, padded with zeros, along with their lengths
+    """
+    entity1, entity2 = model.Entity("entity 1"), model.Entity("entity 2")
+    entity1.add_cashflow(
+        model.Cashflow(dt.datetime(2022, 1, 1), 1000, 0, 0, "entity 1")
+    )
+    entity1.add_cashflow(
+        model.Cashflow(dt.datetime(2022, 2, 1), 0, 100, 1000, "entity 1")
+    )
+    entity2.add_cashflow(model.Cashflow(dt.datetime(2022, 1, 1), 500, 0, 0, "entity 2"))
+
+    flows, values, lengths = batch.pack_cashflows([entity1, entity2])
+
+    assert flows.tolist() == [[-1000, 100], [-500, 0]]
+    assert values.tolist() == [[0, 1000], [0, 0]]
+    assert lengths.tolist() == [2, 1]
+
+
+def test_solve_rows_rejects_stalled_rows():
+    """
+    GIVEN a row warm-started so close to -1 that its Newton steps vanish, away from its IRR
+    WHEN the rows are solved together (batch.solve_rows())
+    THEN the vanishing Newton step must not be taken for convergence, and the row solved by the scalar fallback
+    """
+    matrix = np.array([[-1000, 900], [-1000, 1100]], dtype=float)
+
+    rates = batch.solve_rows(matrix, np.array([-1 + 1e-14, 0.1]))
+
+    assert rates == pytest.approx([-0.1, 0.1])
+
+
+def test_calculate_irrs_matches_scalar_engine():
+    """
+    GIVEN a collection of random entities
+    WHEN their irrs are calculated all at once (batch.calculate_irrs())
+    THEN the results have to be the same as the ones calculated one entity at a time (model.calculate_irrs())
+    """
+    expected_entities = model.calculate_irrs(random_entities(1, 200))
+
+    entities = batch.calculate_irrs(random_entities(1, 200))
+
+    assert irr_rows(entities) == irr_rows(expected_entities)
+
+
+def test_irr_pipeline_with_batch_engine():
+    """
+    GIVEN a repository with cashflows
+    WHEN they are processed by irr_pipeline() with the batch engine
+    THEN the expected irrs have to be loaded into the repository
+    """
+    entity_name = "test account"
+    repository = InMemoryRepository(
+        [
+            model.Cashflow(dt.datetime(2022, 1, 1), 1000, 0, 0, entity_name),
+            model.Cashflow(dt.datetime(2022, 2, 1), 0, 100, 1000, entity_name),
+            model.Cashflow(dt.datetime(2022, 3, 1), 0, 100, 1000, entity_name),
+            model.Cashflow(dt.datetime(2022, 3, 1), 1000, 0, 0, "other account"),
+        ]
+    )
+
+    services.irr_pipeline(repository, engine=batch.calculate_irrs)
+
+    assert [(irr.date, irr.value, irr.entity_name) for irr in repository.irrs] == [
+        (dt.date(2022, 2, 1), 0.1, entity_name),
+        (dt.date(2022, 3, 1), 0.1, entity_name),
+    ]
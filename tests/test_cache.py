@@ -0,0 +1,106 @@
+from cloud_function import cache, model, solver
+import datetime as dt
+import math
+import numpy as np
+
+
+def create_entities() -> dict:
+    cashflows = [
+        model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "test account"),
+        model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, "test account"),
+        model.Cashflow(dt.date(2022, 3, 1), 500, 0, 1600, "test account"),
+        model.Cashflow(dt.date(2022, 4, 1), 0, 100, 1600, "test account"),
+        model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "nan account"),
+        model.Cashflow(dt.date(2022, 2, 1), 1000, 0, 0, "nan account"),
+    ]
+    return model.ingest_cashflows(model.CashflowFrame.from_cashflows(cashflows))[0]
+
+
+def irr_values(entities: dict) -> dict:
+    return {
+        entity_name: [irr.value for irr in entity.irrs]
+        for entity_name, entity in entities.items()
+    }
+
+
+def test_prefix_keys():
+    """
+    GIVEN the cashflows of an entity and the same cashflows with an extra period
+    WHEN the keys of their prefixes are calculated (prefix_keys())
+    THEN the shared prefixes have to get the same keys and every prefix a different key
+    """
+    flows = np.array([-1000.0, 100, 100])
+    values = np.array([0.0, 1000, 1000])
+
+    keys = cache.prefix_keys(flows, values)
+    extended = cache.prefix_keys(np.append(flows, 100), np.append(values, 1000))
+
+    assert len(keys) == 2
+    assert extended[:2] == keys
+    assert len(set(extended)) == 3
+
+
+def test_second_run_hits_cache(tmp_path):
+    """
+    GIVEN a cache file filled by a first run
+    WHEN the IRRs of the same entities are calculated again through the reopened cache (calculate_irrs())
+    THEN every period has to be found in the cache and the IRRs have to equal the ones solved without cache
+    """
+    path = str(tmp_path / "irrs.sqlite")
+    expected = irr_values(model.calculate_irrs(create_entities()))
+
+    with cache.IrrCache(path) as irr_cache:
+        first = irr_values(model.calculate_irrs(create_entities(), cache=irr_cache))
+    assert (irr_cache.hits, irr_cache.misses) == (0, 4)
+
+    with cache.IrrCache(path) as irr_cache:
+        second = irr_values(model.calculate_irrs(create_entities(), cache=irr_cache))
+    assert (irr_cache.hits, irr_cache.misses) == (4, 0)
+
+    for values in (first, second):
+        assert values["test account"] == expected["test account"]
+        assert math.isnan(values["nan account"][0])
+
+
+def test_cache_invalidated_on_settings_change(tmp_path):
+    """
+    GIVEN a cache file filled with a solver's IRRs
+    WHEN it is reopened with other solver settings, with other rounding, or invalidated
+    THEN it has to be empty
+    """
+    path = str(tmp_path / "irrs.sqlite")
+    flows, values = np.array([-1000.0, 100, 100]), np.array([0.0, 1000, 1000])
+
+    for settings in (
+        {},
+        {"irr_solver": solver.IrrSolver(tolerance=1e-10)},
+        {"digits": 6},
+    ):
+        with cache.IrrCache(path, **settings) as irr_cache:
+            irr_cache.solve_prefixes(flows, values)
+        assert irr_cache.misses == 2
+
+    with cache.IrrCache(path, digits=6) as irr_cache:
+        irr_cache.invalidate()
+        irr_cache.solve_prefixes(flows, values)
+    assert irr_cache.misses == 2
+
+
+def test_cache_evicts_least_recently_used():
+    """
+    GIVEN a cache bounded to two entries
+    WHEN three cashflow vectors are solved, the first one being used again after the second
+    THEN only the two most recently used vectors have to be kept
+    """
+    irr_cache = cache.IrrCache(":memory:", max_entries=2)
+    first = (np.array([-1000.0, 0]), np.array([0.0, 1100]))
+    second = (np.array([-1000.0, 0]), np.array([0.0, 1200]))
+    third = (np.array([-1000.0, 0]), np.array([0.0, 1300]))
+
+    for flows, values in (first, second, first, third):
+        irr_cache.solve_prefixes(flows, values)
+        irr_cache.flush()
+
+    keys = [cache.prefix_keys(*vectors)[0] for vectors in (first, second, third)]
+    assert set(irr_cache.lookup(keys)) == {keys[0], keys[2]}
+    assert (irr_cache.hits, irr_cache.misses) == (1, 3)
@@ -0,0 +1,128 @@
+from cloud_function import model, services
+from cloud_function.repository import InMemoryRepository
+import datetime as dt
+import pytest
+
+CASHFLOWS = [
+    cashflow
+    for entity in range(10)
+    for cashflow in (
+        model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, f"account {entity:03}"),
+        model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, f"account {entity:03}"),
+        model.Cashflow(dt.date(2022, 3, 1), 0, 100, 1000, f"account {entity:03}"),
+    )
+]
+
+
+class FailingRepository(InMemoryRepository):
+    """
+    An in-memory repository failing, as BigQuery does on transient errors, on the given attempts to stage a batch
+    and to merge the staged batches.
+    """
+
+    def __init__(self, cashflows, failing_loads=(), failing_merges=()):
+        super().__init__(cashflows)
+        self.failing_loads = set(failing_loads)
+        self.failing_merges = set(failing_merges)
+        self.loads = 0
+        self.merges = 0
+
+    def load_shard_irrs(self, run_id, shard, entities):
+        self.loads += 1
+        if self.loads in self.failing_loads:
+            raise ConnectionError("load job failed")
+        super().load_shard_irrs(run_id, shard, entities)
+
+    def merge_shards(self, run_id, shard_count):
+        self.merges += 1
+        if self.merges in self.failing_merges:
+            raise ConnectionError("merge job failed")
+        super().merge_shards(run_id, shard_count)
+
+
+def counting_engine(calculated: list):
+    def engine(entities):
+        calculated.extend(entities)
+        return model.calculate_irrs(entities)
+
+    return engine
+
+
+def test_checkpointed_irr_pipeline_matches_irr_pipeline():
+    """
+    GIVEN a repository with cashflows
+    WHEN checkpointed_irr_pipeline() is run in batches without failure
+    THEN the irrs have to be the ones of irr_pipeline(), and no batch has to be left staged
+    """
+    expected = InMemoryRepository(CASHFLOWS)
+    services.irr_pipeline(expected)
+    checkpointed = InMemoryRepository(CASHFLOWS)
+
+    services.checkpointed_irr_pipeline(checkpointed, "run", batch_entities=3)
+
+    assert checkpointed.irrs == expected.irrs
+    assert checkpointed.staging == {}
+
+
+def test_checkpointed_irr_pipeline_resumes_failed_run():
+    """
+    GIVEN a repository failing to stage the third batch of entities
+    WHEN checkpointed_irr_pipeline() fails, and is run again with the same run id
+    THEN the previous irrs have to be kept after the failure, the second attempt has to calculate only the batches
+         not staged by the first one, and the irrs have to be replaced once every batch is staged
+    """
+    repository = FailingRepository(CASHFLOWS, failing_loads=[3])
+    repository.irrs = ["previous"]
+    first, second = [], []
+
+    with pytest.raises(ConnectionError):
+        services.checkpointed_irr_pipeline(
+            repository, "run", counting_engine(first), batch_entities=3
+        )
+    assert repository.irrs == ["previous"]
+    services.checkpointed_irr_pipeline(
+        repository, "run", counting_engine(second), batch_entities=3
+    )
+
+    assert first == [f"account {entity:03}" for entity in range(9)]
+    assert second == [f"account {entity:03}" for entity in range(6, 10)]
+    assert len(repository.irrs) == 20
+    assert repository.staging == {}
+
+
+def test_checkpointed_irr_pipeline_resumes_failed_merge():
+    """
+    GIVEN a repository failing to merge the staged batches
+    WHEN checkpointed_irr_pipeline() fails, and is run again with the same run id
+    THEN the second attempt has to merge the batches staged by the first one without calculating any
+    """
+    repository = FailingRepository(CASHFLOWS, failing_merges=[1])
+    calculated = []
+
+    with pytest.raises(ConnectionError):
+        services.checkpointed_irr_pipeline(repository, "run", batch_entities=4)
+    services.checkpointed_irr_pipeline(
+        repository, "run", counting_engine(calculated), batch_entities=4
+    )
+
+    assert calculated == []
+    assert len(repository.irrs) == 20
+
+
+def test_checkpointed_irr_pipeline_starts_over_on_new_plan():
+    """
+    GIVEN batches staged by a failed attempt
+    WHEN checkpointed_irr_pipeline() is run again with the same run id but another batch size
+    THEN every entity has to be calculated again instead of mixing batches of both plans
+    """
+    repository = FailingRepository(CASHFLOWS, failing_loads=[2])
+    calculated = []
+
+    with pytest.raises(ConnectionError):
+        services.checkpointed_irr_pipeline(repository, "run", batch_entities=3)
+    services.checkpointed_irr_pipeline(
+        repository, "run", counting_engine(calculated), batch_entities=5
+    )
+
+    assert len(calculated) == 10
+    assert len(repository.irrs) == 20
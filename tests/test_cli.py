@@ -0,0 +1,60 @@
+from cloud_function import cli
+import datetime as dt
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+
+@pytest.mark.parametrize("engine", ["scalar", "batch", "parallel", "rolling"])
+def test_main_writes_irrs(tmp_path, engine):
+    """
+    GIVEN a Parquet file with cashflows
+    WHEN the command line entry point is run on it with any engine (cli.main())
+    THEN the expected irrs have to be written to the output file
+    """
+    source, output = tmp_path / "cashflows.parquet", tmp_path / "irrs.parquet"
+    pq.write_table(
+        pa.table(
+            {
+                "date": pa.array(
+                    [dt.date(2022, 1, 1), dt.date(2022, 2, 1), dt.date(2022, 3, 1)],
+                    type=pa.date32(),
+                ),
+                "inflow": [1000.0, 0.0, 0.0],
+                "outflow": [0.0, 100.0, 100.0],
+                "value": [0.0, 1000.0, 1000.0],
+                "entity_name": ["test account"] * 3,
+            }
+        ),
+        source,
+    )
+
+    report = cli.main(
+        [str(source), "--output", str(output), "--engine", engine, "--workers", "1"]
+    )
+
+    assert report.issues == []
+    assert pq.read_table(output).column("irr_monthly").to_pylist() == [0.1, 0.1]
+
+
+def test_main_writes_group_irrs(tmp_path):
+    """
+    GIVEN a CSV file with cashflows and a CSV file with a hierarchy
+    WHEN the command line entry point is run with the hierarchy (cli.main())
+    THEN the irrs of the entity and of its group have to be written with their level
+    """
+    source, output = tmp_path / "cashflows.csv", tmp_path / "irrs.parquet"
+    hierarchy = tmp_path / "hierarchy.csv"
+    source.write_text(
+        "date,inflow,outflow,value,entity_name\n"
+        "2022-01-01,1000,0,0,test account\n"
+        "2022-02-01,0,100,1000,test account\n"
+    )
+    hierarchy.write_text("entity_name,parent_name\ntest account,test fund\n")
+
+    cli.main([str(source), "--output", str(output), "--hierarchy", str(hierarchy)])
+
+    table = pq.read_table(output)
+    assert table.column("entity_name").to_pylist() == ["test account", "test fund"]
+    assert table.column("level").to_pylist() == [0, 1]
+    assert table.column("irr_monthly").to_pylist() == [0.1, 0.1]
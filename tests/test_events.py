@@ -0,0 +1,114 @@
+from cloud_function import events, model, services, sharding
+from cloud_function.repository import InMemoryRepository
+import datetime as dt
+import pytest
+
+
+def monthly_cashflows(entity_name: str, months: int, growth: float) -> list:
+    return [
+        model.Cashflow(
+            dt.date(2022 + month // 12, month % 12 + 1, 1),
+            1000.0 if month == 0 else 0.0,
+            0.0,
+            1000 * (1 + growth) ** month,
+            entity_name,
+        )
+        for month in range(months)
+    ]
+
+
+def test_entity_update_message_round_trip():
+    """
+    GIVEN an update with cashflows and entity names
+    WHEN it is published as a Pub/Sub event and decoded (sharding.decode_event(), EntityUpdate.from_message())
+    THEN the same update has to be read, with the earliest cashflow date of each entity not listed by name
+    """
+    update = events.EntityUpdate(
+        ("entity b",),
+        (
+            model.Cashflow(dt.date(2022, 3, 1), 0.0, 10.0, 900.0, "entity a"),
+            model.Cashflow(dt.date(2022, 2, 1), 5.0, 0.0, 950.0, "entity a"),
+            model.Cashflow(dt.date(2022, 1, 1), 0.0, 0.0, 10.0, "entity b"),
+        ),
+    )
+
+    message = sharding.decode_event(sharding.encode_event(update.to_message()))
+
+    assert events.EntityUpdate.from_message(message).to_message() == update.to_message()
+    assert update.affected_entities == ("entity a", "entity b")
+    assert update.since() == {"entity a": dt.date(2022, 2, 1)}
+
+
+def test_entity_update_rejects_cashflow_without_date():
+    """
+    GIVEN an update message holding a cashflow without date
+    WHEN it is read (EntityUpdate.from_message())
+    THEN a ValueError has to be raised
+    """
+    with pytest.raises(ValueError):
+        events.EntityUpdate.from_message(
+            {"action": "update", "cashflows": [{"entity_name": "entity a"}]}
+        )
+
+
+def test_upsert_cashflow():
+    """
+    GIVEN an entity with sorted cashflows
+    WHEN a cashflow of a new date and a correction of an existing date are merged (Entity.upsert_cashflow())
+    THEN the new one has to be inserted in order and the corrected one replaced
+    """
+    entity = model.Entity("entity a")
+    entity.sorted_cashflows = monthly_cashflows("entity a", 3, 0.01)
+    new = model.Cashflow(dt.date(2021, 12, 1), 0.0, 0.0, 0.0, "entity a")
+    correction = model.Cashflow(dt.date(2022, 2, 1), 0.0, 5.0, 990.0, "entity a")
+
+    entity.upsert_cashflow(correction)
+    entity.upsert_cashflow(new)
+
+    assert [cashflow.date for cashflow in entity.sorted_cashflows] == [
+        dt.date(2021, 12, 1),
+        dt.date(2022, 1, 1),
+        dt.date(2022, 2, 1),
+        dt.date(2022, 3, 1),
+    ]
+    assert entity.sorted_cashflows[2] == correction
+
+
+def test_event_irr_pipeline_matches_full_run():
+    """
+    GIVEN a repository holding the IRRs of a full run, and an update booking a new month and correcting a past one
+    WHEN the update is handled (services.event_irr_pipeline())
+    THEN the IRRs held have to be the ones of a full run over the updated cashflows, only the affected entity
+         being retrieved and only its IRRs from the corrected date onwards being replaced
+    """
+    cashflows = monthly_cashflows("entity a", 6, 0.01) + monthly_cashflows(
+        "entity b", 6, 0.02
+    )
+    repository = InMemoryRepository(cashflows)
+    services.irr_pipeline(repository)
+    untouched = [irr for irr in repository.irrs if irr.date < dt.date(2022, 4, 1)]
+    correction = model.Cashflow(dt.date(2022, 4, 1), 0.0, 100.0, 950.0, "entity a")
+    new = model.Cashflow(dt.date(2022, 7, 1), 0.0, 0.0, 1100.0, "entity a")
+    requested = []
+    get_cashflows = repository.get_cashflows
+    repository.get_cashflows = lambda names=None: requested.append(names) or (
+        get_cashflows(names)
+    )
+
+    services.event_irr_pipeline(repository, events.EntityUpdate((), (new, correction)))
+
+    expected = InMemoryRepository(
+        [cashflow for cashflow in cashflows if cashflow.date != correction.date]
+        + [
+            cashflow
+            for cashflow in cashflows
+            if cashflow.date == correction.date and cashflow.entity_name == "entity b"
+        ]
+        + [correction, new]
+    )
+    services.irr_pipeline(expected)
+    assert requested == [["entity a"]]
+    assert all(irr in repository.irrs for irr in untouched)
+    key = lambda irr: (irr.entity_name, irr.date)
+    assert sorted(map(key, repository.irrs)) == sorted(map(key, expected.irrs))
+    assert sorted(repository.irrs, key=key) == sorted(expected.irrs, key=key)
@@ -0,0 +1,210 @@
+from cloud_function import executor, model, services
+from cloud_function.repository import InMemoryRepository
+import datetime as dt
+import threading
+import time
+import pytest
+
+
+def create_cashflows(entities: int) -> list[model.Cashflow]:
+    return [
+        cashflow
+        for entity in range(entities)
+        for cashflow in (
+            model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, f"account {entity:03}"),
+            model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, f"account {entity:03}"),
+            model.Cashflow(dt.date(2022, 3, 1), 0, 100, 1000, f"account {entity:03}"),
+        )
+    ]
+
+
+class FlakyRepository(InMemoryRepository):
+    """
+    An in-memory repository whose first loads of staged batches fail, as a remote one may on the network.
+    """
+
+    def __init__(self, cashflows, failures=0):
+        super().__init__(cashflows)
+        self.failures = failures
+        self.attempts = 0
+        self.lock = threading.Lock()
+
+    def load_shard_irrs(self, run_id, shard, entities):
+        with self.lock:
+            self.attempts += 1
+            attempt = self.attempts
+        if attempt <= self.failures:
+            raise ConnectionError("load job failed")
+        super().load_shard_irrs(run_id, shard, entities)
+
+
+class GatedRepository(InMemoryRepository):
+    """
+    An in-memory repository recording the order of its reads and loads, whose first load is held until every
+    cashflow is read, which only happens when reads go on while a load is pending.
+    """
+
+    def __init__(self, cashflows):
+        super().__init__(cashflows)
+        self.events = []
+        self.lock = threading.Lock()
+        self.read = threading.Event()
+        self.released = None
+
+    def record(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def iter_cashflows(self):
+        for cashflow in super().iter_cashflows():
+            yield cashflow
+        self.record("read")
+        self.read.set()
+
+    def load_shard_irrs(self, run_id, shard, entities):
+        self.record(("load", shard))
+        if shard == 0:
+            # a timeout instead of a hang when reads wait for the load
+            self.released = self.read.wait(timeout=5)
+        super().load_shard_irrs(run_id, shard, entities)
+        self.record(("loaded", shard))
+
+
+def test_prefetcher_yields_source_in_order():
+    """
+    GIVEN a source of items
+    WHEN it is read in pages by a background thread (Prefetcher)
+    THEN every item has to be yielded in order
+    """
+    with executor.Prefetcher(range(10), page_size=3, prefetch_pages=1) as items:
+        assert list(items) == list(range(10))
+
+
+def test_prefetcher_raises_source_error():
+    """
+    GIVEN a source failing after some items
+    WHEN it is read by a background thread (Prefetcher)
+    THEN the items read before the failure have to be yielded and the error raised to the consumer
+    """
+
+    def source():
+        yield from range(4)
+        raise ConnectionError("page fetch failed")
+
+    items = []
+    with pytest.raises(ConnectionError):
+        with executor.Prefetcher(source(), page_size=2) as prefetcher:
+            for item in prefetcher:
+                items.append(item)
+
+    assert items == [0, 1, 2, 3]
+
+
+def test_uploader_retries_and_bounds_pending_jobs():
+    """
+    GIVEN an upload job failing on its first attempts
+    WHEN jobs are submitted to an Uploader bounded to two pending jobs
+    THEN every job has to be loaded once, retrying the failures, with at most two jobs running at a time
+    """
+    lock = threading.Lock()
+    calls, loaded, running = [], [], [0, 0]
+
+    def upload(item):
+        with lock:
+            calls.append(item)
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        if calls.count(item) == 1 and item % 2 == 0:
+            raise ConnectionError("load job failed")
+        loaded.append(item)
+
+    with executor.Uploader(upload, workers=4, max_pending=2, retry_delay=0) as uploader:
+        for item in range(6):
+            uploader.submit(item)
+        uploader.wait()
+
+    assert sorted(loaded) == list(range(6))
+    assert len(calls) == 9
+    assert running[1] <= 2
+
+
+def test_uploader_raises_after_last_attempt():
+    """
+    GIVEN an upload job that always fails
+    WHEN it is submitted to an Uploader
+    THEN the error has to be raised by wait() after every attempt
+    """
+    calls = []
+
+    def upload(item):
+        calls.append(item)
+        raise ConnectionError("load job failed")
+
+    with pytest.raises(ConnectionError):
+        with executor.Uploader(upload, attempts=3, retry_delay=0) as uploader:
+            uploader.submit(1)
+            uploader.wait()
+
+    assert calls == [1, 1, 1]
+
+
+def test_pipelined_irr_pipeline_matches_irr_pipeline():
+    """
+    GIVEN a repository with cashflows and a load failing once
+    WHEN pipelined_irr_pipeline() is run in several batches
+    THEN the failed load has to be retried and the IRRs have to equal the ones of irr_pipeline()
+    """
+    repository = FlakyRepository(create_cashflows(10), failures=1)
+    expected = InMemoryRepository(create_cashflows(10))
+    services.irr_pipeline(expected)
+
+    batch_count = services.pipelined_irr_pipeline(
+        repository, batch_periods=9, upload_workers=2, attempts=2
+    )
+
+    assert batch_count == 4
+    assert repository.attempts == 5
+    assert repository.staging == {}
+    assert [irr.to_dict() for irr in repository.irrs] == [
+        irr.to_dict() for irr in expected.irrs
+    ]
+
+
+def test_pipelined_irr_pipeline_keeps_irrs_on_failure():
+    """
+    GIVEN a repository holding IRRs whose loads always fail
+    WHEN pipelined_irr_pipeline() is run
+    THEN the load error has to be raised and the IRRs held by the repository left unchanged
+    """
+    repository = FlakyRepository(create_cashflows(4), failures=100)
+    repository.irrs = ["previous irrs"]
+
+    with pytest.raises(ConnectionError):
+        services.pipelined_irr_pipeline(repository, batch_periods=3, attempts=1)
+
+    assert repository.irrs == ["previous irrs"]
+
+
+def test_pipelined_irr_pipeline_overlaps_io():
+    """
+    GIVEN a repository holding its first load until every cashflow is read
+    WHEN pipelined_irr_pipeline() is run with small pages and several load workers
+    THEN reads, calculation and the other loads have to go on while the first load is pending
+    """
+    repository = GatedRepository(create_cashflows(40))
+
+    batch_count = services.pipelined_irr_pipeline(
+        repository, batch_periods=15, page_size=3, prefetch_pages=1, upload_workers=4
+    )
+
+    assert batch_count == 8
+    assert repository.released
+    events = repository.events
+    assert events.index(("load", 0)) < events.index("read")
+    assert events.index(("loaded", 1)) < events.index(("loaded", 0))
+    assert sorted(event for event in events if event[0] == "loaded") == [
+        ("loaded", shard) for shard in range(8)
+    ]
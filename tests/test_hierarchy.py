@@ -0,0 +1,123 @@
+from cloud_function import batch, hierarchy, model, repository, services
+import datetime as dt
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+CASHFLOWS = [
+    model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "entity a"),
+    model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, "entity a"),
+    model.Cashflow(dt.date(2022, 3, 1), 0, 100, 1000, "entity a"),
+    model.Cashflow(dt.date(2022, 2, 1), 500, 0, 500, "entity b"),
+    model.Cashflow(dt.date(2022, 4, 1), 0, 50, 520, "entity b"),
+    model.Cashflow(dt.date(2022, 1, 1), 300, 0, 300, "entity c"),
+    model.Cashflow(dt.date(2022, 3, 1), 0, 0, 330, "entity c"),
+]
+PARENTS = {
+    "entity a": "fund 1",
+    "entity b": "fund 1",
+    "entity c": "fund 2",
+    "fund 1": "book",
+    "fund 2": "book",
+}
+
+
+def test_group_levels():
+    """
+    GIVEN a hierarchy of entities, funds and a book
+    WHEN the levels of its groups are found (hierarchy.group_levels())
+    THEN funds have to be at level 1 and the book at level 2, in ascending order of level
+    """
+    assert hierarchy.group_levels(PARENTS) == {"fund 1": 1, "fund 2": 1, "book": 2}
+
+
+def test_group_levels_rejects_cycles():
+    """
+    GIVEN a hierarchy in which two groups are parents of each other
+    WHEN the levels of its groups are found (hierarchy.group_levels())
+    THEN a ValueError has to be raised
+    """
+    with pytest.raises(ValueError):
+        hierarchy.group_levels(
+            {"entity a": "fund 1", "fund 1": "book", "book": "fund 1"}
+        )
+
+
+def test_aggregate_entities():
+    """
+    GIVEN entities with cashflows on different dates and a hierarchy
+    WHEN the groups are built (hierarchy.aggregate_entities())
+    THEN flows have to be summed on the union of the dates of the children, values carried forward, and the book has
+         to be the sum of its funds
+    """
+    entities, _ = model.ingest_cashflows(model.CashflowFrame.from_cashflows(CASHFLOWS))
+
+    groups = hierarchy.aggregate_entities(entities, PARENTS)
+
+    assert list(groups) == ["fund 1", "fund 2", "book"]
+    fund = groups["fund 1"]
+    assert fund.cashflow_dates() == [
+        dt.date(2022, 1, 1),
+        dt.date(2022, 2, 1),
+        dt.date(2022, 3, 1),
+        dt.date(2022, 4, 1),
+    ]
+    assert [column.tolist() for column in fund.cashflow_columns()] == [
+        [1000, 500, 0, 0],
+        [0, 100, 100, 50],
+        [0, 1500, 1500, 1520],
+    ]
+    assert [column.tolist() for column in groups["book"].cashflow_columns()] == [
+        [1300, 500, 0, 0],
+        [0, 100, 100, 50],
+        [300, 1800, 1830, 1850],
+    ]
+
+
+def test_aggregate_entities_rejects_groups_with_cashflows():
+    """
+    GIVEN a hierarchy whose group is also an entity with cashflows
+    WHEN the groups are built (hierarchy.aggregate_entities())
+    THEN a ValueError has to be raised
+    """
+    entities, _ = model.ingest_cashflows(model.CashflowFrame.from_cashflows(CASHFLOWS))
+
+    with pytest.raises(ValueError):
+        hierarchy.aggregate_entities(entities, {"entity a": "entity b"})
+
+
+@pytest.mark.parametrize("engine", [model.calculate_irrs, batch.calculate_irrs])
+def test_irr_pipeline_writes_group_irrs(tmp_path, engine):
+    """
+    GIVEN an in-memory repository with cashflows and a hierarchy
+    WHEN irr_pipeline() is run with an engine extended with the hierarchy (hierarchy.with_hierarchy())
+    THEN the IRRs of every entity and group have to be written with their level, the IRR of a group being the one of
+         its aggregated cashflows
+    """
+    destination = tmp_path / "irrs.parquet"
+    in_memory = repository.InMemoryRepository(CASHFLOWS, PARENTS)
+
+    services.irr_pipeline(
+        in_memory, hierarchy.with_hierarchy(engine, in_memory.get_hierarchy())
+    )
+    repository.FileRepository("", str(destination)).load_irrs_batches([in_memory.irrs])
+
+    levels = {irr.entity_name: irr.level for irr in in_memory.irrs}
+    assert levels == {
+        "entity a": 0,
+        "entity b": 0,
+        "entity c": 0,
+        "fund 1": 1,
+        "fund 2": 1,
+        "book": 2,
+    }
+    flows = np.array([-1000.0, -400, 100, 50])
+    expected = [
+        round(model.solve_cashflows(np.append(flows[:k], flows[k] + value)).rate, 4)
+        for k, value in ((1, 1500), (2, 1500))
+    ]
+    fund_irrs = [irr.value for irr in in_memory.irrs if irr.entity_name == "fund 1"]
+    assert fund_irrs[:2] == expected
+    table = pq.read_table(destination)
+    assert table.column_names[-1] == "level"
+    assert table.column("level").to_pylist()[-1] == 2
@@ -0,0 +1,118 @@
+from cloud_function import batch, instrumentation, model, services
+from cloud_function.repository import InMemoryRepository
+import datetime as dt
+import json
+import logging
+
+
+def repository_with_cashflows() -> InMemoryRepository:
+    return InMemoryRepository(
+        [
+            model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "test account"),
+            model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, "test account"),
+            model.Cashflow(dt.date(2022, 3, 1), 0, 100, 1000, "test account"),
+            model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "nan account"),
+            model.Cashflow(dt.date(2022, 2, 1), 1000, 0, 0, "nan account"),
+            model.Cashflow(dt.date(2022, 3, 1), 1000, 0, 0, "other account"),
+        ]
+    )
+
+
+def test_no_instrumentation_keeps_engine():
+    """
+    GIVEN the default instrumentation
+    WHEN it adapts a calculation strategy (Instrumentation.engine())
+    THEN the strategy has to be returned unchanged
+    """
+    assert (
+        instrumentation.NO_INSTRUMENTATION.engine(model.calculate_irrs)
+        is model.calculate_irrs
+    )
+
+
+def test_irr_pipeline_metrics(caplog):
+    """
+    GIVEN a repository with cashflows, including an entity without valid irr
+    WHEN irr_pipeline() is run with metrics instrumentation profiling the slowest entity
+    THEN stages, rows, solver telemetry, paths taken and nan results have to be collected and logged as JSON lines
+    """
+    metrics = instrumentation.MetricsInstrumentation(
+        trace_memory=True, slowest_entities=1
+    )
+
+    with caplog.at_level(logging.INFO):
+        services.irr_pipeline(repository_with_cashflows(), instrumentation=metrics)
+
+    result = metrics.metrics
+    assert list(result.stages) == [
+        "fetch",
+        "allocation",
+        "entity creation",
+        "calculation",
+        "load",
+    ]
+    assert all(stage.peak_bytes is not None for stage in result.stages.values())
+    assert (result.rows_read, result.rows_written, result.entities) == (6, 3, 3)
+    assert result.solved_entities == 3
+    assert result.solver_iterations > 0
+    assert result.non_converged == 0
+    assert result.nan_results == 1
+    assert result.solver_methods == {"two_period": 1, "annuity": 1, "none": 1}
+    assert [entity["entity_name"] for entity in result.slowest_entities] in (
+        ["test account"],
+        ["nan account"],
+        ["other account"],
+    )
+    lines = [
+        json.loads(record.message)
+        for record in caplog.records
+        if record.name.endswith("instrumentation")
+    ]
+    assert [line["message"] for line in lines][-1] == "IRR pipeline finished"
+    assert lines[-1]["nan_results"] == 1
+    assert "Not enough values for other account" in caplog.messages
+
+
+def test_irr_pipeline_metrics_with_batch_engine():
+    """
+    GIVEN an engine that does not report solver telemetry (batch.calculate_irrs())
+    WHEN irr_pipeline() is run with metrics instrumentation
+    THEN nan results and rows have still to be counted
+    """
+    metrics = instrumentation.MetricsInstrumentation(log=False)
+
+    services.irr_pipeline(
+        repository_with_cashflows(),
+        engine=batch.calculate_irrs,
+        instrumentation=metrics,
+    )
+
+    assert metrics.metrics.solved_entities == 0
+    assert metrics.metrics.rows_written == 3
+    assert metrics.metrics.nan_results == 1
+
+
+class DurationInstrumentation(instrumentation.Instrumentation):
+    def __init__(self):
+        self.seconds = []
+
+    def entity_solved(self, entity_name, periods, results, seconds):
+        self.seconds.append(seconds)
+
+
+def test_entity_solved_duration():
+    """
+    GIVEN an entity with cashflows
+    WHEN its irrs are calculated, in full and since a date (Entity.calculate_irr())
+    THEN the time reported to the instrumentation has to be the time spent, not a clock reading
+    """
+    entity = model.Entity("test account")
+    for cashflow in repository_with_cashflows().get_cashflows()[:3]:
+        entity.add_cashflow(cashflow)
+    durations = DurationInstrumentation()
+
+    entity.calculate_irr(instrumentation=durations)
+    entity.calculate_irr(instrumentation=durations, since=dt.date(2022, 3, 1))
+
+    assert len(durations.seconds) == 2
+    assert all(0 <= seconds < 1 for seconds in durations.seconds)
@@ -0,0 +1,143 @@
+from cloud_function import lookup, model, repository
+import datetime as dt
+import math
+import pytest
+
+IRRS = [
+    model.Irr(dt.date(2022, 2, 1), 0.01, "entity a"),
+    model.Irr(dt.date(2022, 3, 1), 0.02, "entity a"),
+    model.Irr(dt.date(2022, 5, 1), 0.03, "entity a"),
+    model.Irr(dt.date(2022, 3, 1), float("nan"), "entity b"),
+]
+
+
+def test_lookup_as_of_date():
+    """
+    GIVEN an index of IRR data
+    WHEN the IRR of an entity is looked up as of dates (lookup.IrrIndex.lookup())
+    THEN the latest IRR dated on or before each date has to be found, None before its first IRR or for an unknown
+         entity, and nan has to be None
+    """
+    index = lookup.IrrIndex(model.IrrFrame.from_irrs(IRRS))
+
+    assert index.lookup("entity a", dt.date(2022, 4, 30)) == {
+        "date": "2022-03-01",
+        "irr_monthly": 0.02,
+        "irr_annual": 0.2682,
+        "entity_name": "entity a",
+    }
+    assert index.lookup("entity a", dt.date(2022, 5, 1))["irr_monthly"] == 0.03
+    assert index.lookup("entity a", dt.date(2022, 1, 31)) is None
+    assert index.lookup("entity b", dt.date(2023, 1, 1))["irr_monthly"] is None
+    assert index.lookup("entity c", dt.date(2023, 1, 1)) is None
+
+
+def test_lookup_many_matches_lookup():
+    """
+    GIVEN an index of IRR data in no particular order
+    WHEN many (entity, date) pairs are looked up at once (lookup.IrrIndex.lookup_many())
+    THEN each answer has to be the one of a single lookup
+    """
+    index = lookup.IrrIndex(model.IrrFrame.from_irrs(IRRS[::-1]))
+    entity_names = ["entity b", "entity a", "entity c", "entity a", "entity a"]
+    dates = [dt.date(2022, month, 15) for month in (1, 2, 3, 4, 12)]
+
+    assert index.lookup_many(entity_names, dates) == [
+        index.lookup(entity_name, date)
+        for entity_name, date in zip(entity_names, dates)
+    ]
+
+
+def test_index_leaves_out_window_irrs():
+    """
+    GIVEN since-inception and trailing window IRR data
+    WHEN an index is built (lookup.IrrIndex())
+    THEN lookups have to answer with the since-inception IRRs
+    """
+    irrs = [
+        model.WindowIrr(dt.date(2022, 2, 1), 0.01, "entity a"),
+        model.WindowIrr(dt.date(2022, 2, 1), 0.05, "entity a", window=1),
+    ]
+
+    index = lookup.IrrIndex(model.IrrFrame.from_irrs(irrs))
+
+    assert len(index) == 1
+    assert index.lookup("entity a", dt.date(2022, 2, 1))["irr_monthly"] == 0.01
+
+
+def test_warm_index_refreshes_on_new_run():
+    """
+    GIVEN a warm index on an in-memory repository
+    WHEN IRR data is loaded by a new run, before and after the check interval (lookup.WarmIndex.get())
+    THEN the index has to be reused within the interval, and built again after it
+    """
+    in_memory = repository.InMemoryRepository()
+    in_memory.load_irrs_batches([IRRS[:1]])
+    now = [0.0]
+    warm = lookup.WarmIndex(in_memory, check_seconds=10, clock=lambda: now[0])
+    index = warm.get()
+
+    in_memory.load_irrs_batches([IRRS])
+    now[0] = 5.0
+    reused = warm.get()
+    now[0] = 15.0
+    refreshed = warm.get()
+    now[0] = 30.0
+
+    assert reused is index
+    assert len(refreshed) == len(IRRS)
+    assert warm.get() is refreshed
+
+
+def test_file_repository_reads_irrs_back(tmp_path):
+    """
+    GIVEN IRR data written to a Parquet file
+    WHEN it is read back for an index (repository.FileRepository.get_irr_frame())
+    THEN the columns written have to be read, and the version has to change with the file
+    """
+    files = repository.FileRepository("", str(tmp_path / "irrs.parquet"))
+    assert files.get_irrs_version() is None
+    files.load_irrs_batches([IRRS])
+
+    irrs = files.get_irr_frame()
+
+    assert irrs.to_dicts()[:3] == model.IrrFrame.from_irrs(IRRS[:3]).to_dicts()
+    assert math.isnan(irrs.irr_annual[3])
+    assert files.get_irrs_version() is not None
+
+
+@pytest.mark.parametrize(
+    "request_body", [{"entity_name": "entity a"}, {"lookups": [{"date": "2022-01-01"}]}]
+)
+def test_handle_request_rejects_incomplete_lookups(request_body):
+    """
+    GIVEN a lookup request without an entity or a date
+    WHEN it is answered (lookup.handle_request())
+    THEN a ValueError has to be raised
+    """
+    with pytest.raises(ValueError):
+        lookup.handle_request(
+            lookup.IrrIndex(model.IrrFrame.from_irrs(IRRS)), request_body
+        )
+
+
+@pytest.mark.parametrize(
+    "request_body",
+    [
+        {"entity_name": "entity a", "date": 20220101},
+        {"entity_name": "entity a", "date": None},
+        {"entity_name": ["entity a"], "date": "2022-01-01"},
+        {"lookups": [{"entity_name": "entity a", "date": 20220101}]},
+        {"lookups": "entity a"},
+    ],
+)
+def test_handle_request_rejects_invalid_types(request_body):
+    """
+    GIVEN a lookup request whose entity or date is not a string, e.g. a JSON number or null
+    WHEN it is answered (lookup.handle_request())
+    THEN a ValueError has to be raised, answered with a 400 status, rather than a TypeError
+    """
+    with pytest.raises(ValueError):
+        lookup.handle_request(
+            lookup.IrrIndex(model.IrrFrame.from_irrs(IRRS)), request_body
+        )
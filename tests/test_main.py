@@ -0,0 +1,189 @@
+from cloud_function import main
+import datetime as dt
+import os
+import pytest
+import subprocess
+import sys
+
+
+def test_function_entry_point_reuses_repository(monkeypatch):
+    """
+    GIVEN a Cloud Function instance invoked twice by the scheduler
+    WHEN the full pipeline is run by each invocation (main.function_entry_point())
+    THEN the repository, and with it the BigQuery client, has to be created by the first invocation only
+    """
+    created, runs = [], []
+
+    class Repository:
+        def __init__(self):
+            created.append(self)
+
+    monkeypatch.delenv("IRR_PIPELINE_MODE", raising=False)
+    monkeypatch.setattr(main.repository, "BiqQueryRepository", Repository)
+    monkeypatch.setattr(
+        main.services, "irr_pipeline", lambda *args: runs.append(args[0])
+    )
+    main.get_repository.cache_clear()
+    try:
+        main.function_entry_point({}, None)
+        main.function_entry_point({}, None)
+    finally:
+        main.get_repository.cache_clear()
+
+    assert len(created) == 1
+    assert runs == created * 2
+
+
+def test_import_defers_cloud_libraries():
+    """
+    GIVEN a new Python process
+    WHEN the entry point module is imported, as on a cold start
+    THEN neither the BigQuery, the Pub/Sub, the pyarrow nor the numpy_financial libraries have to be imported yet,
+    nor the modules of the engines selected by some invocations only
+    """
+    imported = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, main; print(sorted(name for name in sys.modules if name in "
+            "('google.cloud.bigquery', 'google.cloud.pubsub_v1', 'numpy_financial', "
+            "'pyarrow', 'analytics', 'hierarchy', 'lookup', 'xirr')))",
+        ],
+        cwd=os.path.join(os.path.dirname(os.path.dirname(__file__)), "cloud_function"),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert imported.stdout.strip() == "[]"
+
+
+def test_function_entry_point_handles_update_event(monkeypatch):
+    """
+    GIVEN an event whose message has the "update" action
+    WHEN the Cloud Function is invoked with it (main.function_entry_point())
+    THEN the event-driven pipeline has to be run with the update, whatever the mode
+    """
+    updates = []
+    monkeypatch.setenv("IRR_PIPELINE_MODE", "sharded")
+    monkeypatch.setattr(main, "get_repository", lambda: "repository")
+    monkeypatch.setattr(
+        main.services,
+        "event_irr_pipeline",
+        lambda repository, update: updates.append((repository, update.entity_names)),
+    )
+
+    main.function_entry_point(
+        main.sharding.encode_event({"action": "update", "entity_names": ["a"]}), None
+    )
+
+    assert updates == [("repository", ("a",))]
+
+
+def test_lookup_entry_point_keeps_index_warm(monkeypatch):
+    """
+    GIVEN a repository holding IRR data
+    WHEN the lookup entry point is invoked twice (main.lookup_entry_point())
+    THEN the IRR data has to be read by the first invocation only, and the IRRs as of the dates answered
+    """
+    in_memory = main.repository.InMemoryRepository()
+    in_memory.load_irrs_batches(
+        [[main.model.Irr(dt.date(2022, 2, 1), 0.1, "test account")]]
+    )
+    reads = []
+    get_irr_frame = in_memory.get_irr_frame
+    monkeypatch.setattr(
+        in_memory, "get_irr_frame", lambda: reads.append(1) or get_irr_frame()
+    )
+
+    class Request:
+        def __init__(self, payload):
+            self.payload = payload
+
+        def get_json(self, silent=False):
+            return self.payload
+
+    monkeypatch.setattr(main, "get_repository", lambda: in_memory)
+    main.get_irr_index.cache_clear()
+    try:
+        single, status = main.lookup_entry_point(
+            Request({"entity_name": "test account", "date": "2022-03-01"})
+        )
+        bulk, _ = main.lookup_entry_point(
+            Request(
+                {
+                    "lookups": [
+                        {"entity_name": "test account", "date": "2022-01-01"},
+                        {"entity_name": "test account", "date": "2022-02-01"},
+                    ]
+                }
+            )
+        )
+        _, invalid = main.lookup_entry_point(Request({"date": "2022-03-01"}))
+    finally:
+        main.get_irr_index.cache_clear()
+
+    assert status == 200
+    assert single["irr"]["irr_monthly"] == 0.1
+    assert [irr and irr["date"] for irr in bulk["irrs"]] == [None, "2022-02-01"]
+    assert invalid == 400
+    assert reads == [1]
+
+
+def test_function_entry_point_resumes_checkpointed_run(monkeypatch):
+    """
+    GIVEN a Cloud Function in checkpointed mode
+    WHEN an event is delivered again after a failed invocation (main.function_entry_point())
+    THEN both invocations have to run the checkpointed pipeline with the id of the event as run id
+    """
+    runs = []
+
+    class Context:
+        event_id = "1234"
+
+    monkeypatch.setenv("IRR_PIPELINE_MODE", "checkpointed")
+    monkeypatch.setattr(main, "get_repository", lambda: "repository")
+    monkeypatch.setattr(
+        main.services,
+        "checkpointed_irr_pipeline",
+        lambda repository, run_id, **kwargs: runs.append((run_id, kwargs)),
+    )
+
+    main.function_entry_point({}, Context())
+    main.function_entry_point({}, Context())
+
+    assert runs == [("1234", {"batch_entities": 10_000})] * 2
+
+
+@pytest.mark.parametrize(
+    "environment",
+    [
+        {"IRR_PIPELINE_WINDOWS": "12,36", "IRR_PIPELINE_DAY_COUNT": "ACT/365F"},
+        {"IRR_PIPELINE_HIERARCHY": "1", "IRR_PIPELINE_WINDOWS": "12"},
+        {"IRR_PIPELINE_HIERARCHY": "1", "IRR_PIPELINE_DAY_COUNT": "ACT/360"},
+        {"IRR_PIPELINE_ANALYTICS": "npv,tvpi", "IRR_PIPELINE_WINDOWS": "12"},
+        {"IRR_PIPELINE_ANALYTICS": "npv,irr"},
+        {"IRR_PIPELINE_DAY_COUNT": "ACT/ACT"},
+        {"IRR_PIPELINE_WINDOWS": "12,three"},
+    ],
+)
+def test_function_entry_point_rejects_invalid_environment(monkeypatch, environment):
+    """
+    GIVEN a Cloud Function whose environment selects an invalid or incompatible calculation strategy
+    WHEN it is invoked (main.function_entry_point())
+    THEN a ValueError has to be raised before the repository is created and anything read
+    """
+    for variable in (
+        "IRR_PIPELINE_MODE",
+        "IRR_PIPELINE_DAY_COUNT",
+        "IRR_PIPELINE_WINDOWS",
+        "IRR_PIPELINE_HIERARCHY",
+        "IRR_PIPELINE_ANALYTICS",
+    ):
+        monkeypatch.delenv(variable, raising=False)
+    for variable, value in environment.items():
+        monkeypatch.setenv(variable, value)
+    monkeypatch.setattr(main, "get_repository", lambda: pytest.fail("read"))
+
+    with pytest.raises(ValueError):
+        main.function_entry_point({}, None)
@@ -1,5 +1,7 @@
-from cloud_function import model
+from cloud_function import model, solver
 import datetime as dt
+import math
+import numpy as np
 import pytest
 
 
@@ -44,9 +46,9 @@ def test_allocate():
     cashflow1 = model.Cashflow(dt.datetime(2022, 1, 1), 100, 100, 100, entity_name)
     cashflow2 = model.Cashflow(dt.datetime(2023, 1, 2), 1000, 1000, 1000, entity_name)
     entity = model.Entity(entity_name)
-    entities = {entity_name: entity}
 
-    model.allocate_cashflows_to_entities([cashflow2, cashflow1], entities)
+    for cashflow in [cashflow2, cashflow1]:
+        entity.add_cashflow(cashflow)
 
     assert entity.sorted_cashflows == [cashflow1, cashflow2]
 
@@ -60,15 +62,12 @@ def test_calculate_irrs():
     entity_name = "test account"
     entity = model.Entity(entity_name)
     entities = {entity_name: entity}
-
-    model.allocate_cashflows_to_entities(
-        [
-            model.Cashflow(dt.datetime(2022, 1, 1), 1000, 0, 0, entity_name),
-            model.Cashflow(dt.datetime(2022, 2, 1), 0, 100, 1000, entity_name),
-            model.Cashflow(dt.datetime(2022, 3, 1), 0, 100, 1000, entity_name),
-        ],
-        entities,
-    )
+    for cashflow in [
+        model.Cashflow(dt.datetime(2022, 1, 1), 1000, 0, 0, entity_name),
+        model.Cashflow(dt.datetime(2022, 2, 1), 0, 100, 1000, entity_name),
+        model.Cashflow(dt.datetime(2022, 3, 1), 0, 100, 1000, entity_name),
+    ]:
+        entity.add_cashflow(cashflow)
 
     entities[entity_name].calculate_irr()
 
@@ -132,3 +131,376 @@ def test_entity_inequality():
 
     assert not entity1 == entity2
     assert not entity1 == 1
+
+
+def test_cashflow_frame_round_trip():
+    """
+    GIVEN a list of cashflows
+    WHEN they are stored in a CashflowFrame and materialised back (CashflowFrame.to_cashflows())
+    THEN the same cashflows have to be returned and entity names have to be dictionary encoded
+    """
+    cashflows = [
+        model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "entity 1"),
+        model.Cashflow(dt.date(2022, 1, 1), 500, 0, 0, "entity 2"),
+        model.Cashflow(None, 0, 100, 1000, "entity 1"),
+    ]
+
+    frame = model.CashflowFrame.from_cashflows(cashflows)
+
+    assert len(frame) == 3
+    assert frame.entity_names == ("entity 1", "entity 2")
+    assert frame.entity_code.tolist() == [0, 1, 0]
+    assert frame.to_cashflows() == cashflows
+
+
+def test_cashflow_frame_sort_and_groups():
+    """
+    GIVEN a CashflowFrame with unsorted cashflows of several entities
+    WHEN it is sorted (CashflowFrame.sort()) and grouped (CashflowFrame.groups())
+    THEN each entity has to get a view on its cashflows sorted by date, with missing dates first
+    """
+    frame = model.CashflowFrame.from_columns(
+        ["2022-03-01", "2022-01-01", "2022-02-01", None, "2022-01-01"],
+        [0, 1000, 0, 0, 500],
+        [100, 0, 100, 0, 0],
+        [1000, 0, 1000, 0, 0],
+        ["entity 1", "entity 1", "entity 1", "entity 2", "entity 2"],
+    )
+
+    sorted_frame = frame.sort()
+    groups = dict(sorted_frame.groups())
+
+    assert list(groups) == ["entity 1", "entity 2"]
+    assert groups["entity 1"].dates() == [
+        dt.date(2022, 1, 1),
+        dt.date(2022, 2, 1),
+        dt.date(2022, 3, 1),
+    ]
+    assert groups["entity 2"].dates() == [None, dt.date(2022, 1, 1)]
+    assert np.shares_memory(groups["entity 2"].value, sorted_frame.value)
+
+
+def test_entity_from_frame():
+    """
+    GIVEN an entity created from a sorted CashflowFrame (Entity.from_frame())
+    WHEN its irrs are calculated and its cashflows accessed
+    THEN results have to be the same as for an entity holding Cashflow objects
+    """
+    entity_name = "test account"
+    cashflows = [
+        model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, entity_name),
+        model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, entity_name),
+        model.Cashflow(dt.date(2022, 3, 1), 0, 100, 1000, entity_name),
+    ]
+    entity = model.Entity.from_frame(
+        entity_name, model.CashflowFrame.from_cashflows(cashflows)
+    )
+
+    entity.calculate_irr()
+
+    assert entity.cashflow_count == 3
+    assert entity.sorted_cashflows == cashflows
+    assert entity.irrs == [
+        model.Irr(dt.date(2022, 2, 1), 0.1, entity_name),
+        model.Irr(dt.date(2022, 3, 1), 0.1, entity_name),
+    ]
+
+
+def test_ingest_cashflows():
+    """
+    GIVEN a CashflowFrame with unsorted cashflows of several entities
+    WHEN it is ingested (model.ingest_cashflows())
+    THEN one entity per name has to be created holding its cashflows sorted by date and no issue reported
+    """
+    cashflows = [
+        model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, "entity 1"),
+        model.Cashflow(dt.date(2022, 3, 1), 1000, 0, 0, "entity 2"),
+        model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "entity 1"),
+    ]
+
+    entities, report = model.ingest_cashflows(
+        model.CashflowFrame.from_cashflows(cashflows)
+    )
+
+    assert list(entities) == ["entity 1", "entity 2"]
+    assert entities["entity 1"].sorted_cashflows == [cashflows[2], cashflows[0]]
+    assert entities["entity 2"].sorted_cashflows == [cashflows[1]]
+    assert report.issues == []
+
+
+def test_ingest_cashflows_reports_issues():
+    """
+    GIVEN cashflows with a null date, a repeated date and an entity that is not expected
+    WHEN they are ingested (model.ingest_cashflows())
+    THEN the problems have to be reported, null dates and unknown entities left out and repeated dates kept
+    """
+    frame = model.CashflowFrame.from_columns(
+        [None, "2022-01-01", "2022-02-01", "2022-02-01", "2022-01-01"],
+        [0, 1000, 0, 0, 500],
+        [0, 0, 100, 50, 0],
+        [0, 0, 1000, 1000, 0],
+        ["entity 1", "entity 1", "entity 1", "entity 1", "unknown"],
+    )
+
+    entities, report = model.ingest_cashflows(frame, entity_names=["entity 1"])
+
+    assert list(entities) == ["entity 1"]
+    assert entities["entity 1"].cashflow_count == 3
+    assert report.null_dates == [model.IngestionIssue("null_date", "entity 1", None, 1)]
+    assert report.unknown_entities == [
+        model.IngestionIssue("unknown_entity", "unknown", None, 1)
+    ]
+    assert report.duplicate_dates == [
+        model.IngestionIssue("duplicate_date", "entity 1", dt.date(2022, 2, 1), 2)
+    ]
+
+
+def test_fingerprint_cashflows():
+    """
+    GIVEN the cashflows of two entities
+    WHEN their fingerprints are calculated (model.fingerprint_cashflows()) before and after changing one of them
+    THEN only the fingerprint of the changed entity has to change, whatever the order of the rows
+    """
+    cashflows = [
+        model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "entity 1"),
+        model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, "entity 1"),
+        model.Cashflow(dt.date(2022, 1, 1), 500, 0, 0, "entity 2"),
+    ]
+    changed = cashflows[::-1] + [
+        model.Cashflow(dt.date(2022, 3, 1), 0, 0, 600, "entity 2")
+    ]
+
+    before = model.fingerprint_cashflows(model.CashflowFrame.from_cashflows(cashflows))
+    after = model.fingerprint_cashflows(model.CashflowFrame.from_cashflows(changed))
+
+    assert before["entity 1"] == after["entity 1"]
+    assert before["entity 1"].row_count == 2
+    assert before["entity 1"].max_date == dt.date(2022, 2, 1)
+    assert before["entity 2"] != after["entity 2"]
+    assert after["entity 2"].row_count == 2
+    assert after["entity 2"].max_date == dt.date(2022, 3, 1)
+
+
+def test_iter_entities():
+    """
+    GIVEN a stream of cashflows ordered by entity name and date
+    WHEN entities are created from it (model.iter_entities())
+    THEN one entity has to be yielded per name, holding its cashflows
+    """
+    cashflows = [
+        model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "entity 1"),
+        model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, "entity 1"),
+        model.Cashflow(dt.date(2022, 1, 1), 500, 0, 0, "entity 2"),
+    ]
+
+    entities = list(model.iter_entities(iter(cashflows)))
+
+    assert [entity.entity_name for entity in entities] == ["entity 1", "entity 2"]
+    assert entities[0].sorted_cashflows == cashflows[:2]
+    assert entities[1].sorted_cashflows == cashflows[2:]
+
+
+def test_iter_entities_unordered():
+    """
+    GIVEN a stream of cashflows not ordered by entity name
+    WHEN entities are created from it (model.iter_entities())
+    THEN a ValueError has to be raised
+    """
+    cashflows = [
+        model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "entity 2"),
+        model.Cashflow(dt.date(2022, 1, 1), 500, 0, 0, "entity 1"),
+    ]
+
+    with pytest.raises(ValueError):
+        list(model.iter_entities(cashflows))
+
+
+def test_irr_frame():
+    """
+    GIVEN entities with calculated irrs
+    WHEN their irrs are collected into columns (IrrFrame.from_entities())
+    THEN annualised values and dictionaries have to be the same as the ones of each Irr
+    """
+    irrs = [
+        model.Irr(dt.date(2022, 2, 1), 0.01, "entity 1"),
+        model.Irr(dt.date(2022, 3, 1), 1, "entity 1"),
+        model.Irr(dt.datetime(2022, 3, 1), -0.0123, "entity 2"),
+    ]
+    entity1, entity2 = model.Entity("entity 1"), model.Entity("entity 2")
+    entity1.irrs, entity2.irrs = irrs[:2], irrs[2:]
+
+    irr_frame = model.IrrFrame.from_entities({"entity 1": entity1, "entity 2": entity2})
+
+    assert len(irr_frame) == 3
+    assert irr_frame.entity_names == ("entity 1", "entity 2")
+    assert irr_frame.irr_annual.tolist() == [irr.value_annual for irr in irrs]
+    assert irr_frame.to_dicts() == [irr.to_dict() for irr in irrs]
+    assert irr_frame.to_arrow().column_names == [
+        "date",
+        "irr_monthly",
+        "irr_annual",
+        "entity_name",
+    ]
+
+
+@pytest.mark.parametrize(
+    "values, expected_result",
+    [
+        ([-1000, -100], "none"),
+        ([-1000, 500, 500], "exact"),
+        ([-1000, 1100], "two_period"),
+        ([0, -1000, 0, 0, 1200], "power"),
+        ([-1000, 20, 20, 20, 1020], "annuity"),
+        ([-1000, 0, 20, 0, 1020], "unique"),
+        ([-1000, 2050, -1000, 10], "general"),
+    ],
+)
+def test_classify_cashflows(values, expected_result):
+    """
+    GIVEN a cashflow vector
+    WHEN it is classified (model.classify_cashflows())
+    THEN the cheapest path to its IRR has to be returned
+    """
+    assert model.classify_cashflows(np.array(values, dtype=float)) == expected_result
+
+
+@pytest.mark.parametrize(
+    "values, expected_result",
+    [
+        ([-1000, 1100], 0.1),
+        ([0, -1000, 0, 1210], 0.1),
+        ([-1000, 0, 0, 0, 5000], 5**0.25 - 1),
+    ],
+)
+def test_solve_cashflows_closed_forms(values, expected_result):
+    """
+    GIVEN a cashflow vector made of a single outflow and a single inflow
+    WHEN its IRR is calculated (model.solve_cashflows())
+    THEN it has to be found in closed form, without iterations
+    """
+    result = model.solve_cashflows(np.array(values, dtype=float))
+
+    assert result.rate == pytest.approx(expected_result)
+    assert result.iterations == 0
+
+
+@pytest.mark.filterwarnings("error")
+@pytest.mark.parametrize("guess", [-0.999, 0.05])
+def test_solve_cashflows_annuity(guess):
+    """
+    GIVEN a long cashflow vector of level payments and a guess, possibly close to -1
+    WHEN its IRR is calculated (model.solve_cashflows())
+    THEN the rate has to be found as a float, without overflowing
+    """
+    values = np.full(600, 100.0)
+    values[0], values[-1] = -1000, 600
+
+    result = model.solve_cashflows(values, np.float64(guess))
+
+    assert type(result.rate) is float
+    assert result.rate == pytest.approx(0.1)
+    assert result.converged
+
+
+def rounded_rates(results: list) -> list:
+    return [
+        None if math.isnan(result.rate) else round(result.rate, 4) for result in results
+    ]
+
+
+def test_solve_prefixes_matches_general_solver():
+    """
+    GIVEN random cashflows, including level payments, single investments and several sign changes
+    WHEN every prefix is solved through the fast paths (model.solve_prefixes())
+    THEN the rates rounded to 4 decimals have to be the ones of the general solver (IrrSolver.solve_prefixes())
+    """
+    rng = np.random.default_rng(7)
+    irr_solver = solver.IrrSolver()
+    methods = set()
+    for shape in ("level", "single", "random") * 30:
+        periods = int(rng.integers(2, 40))
+        if shape == "level":
+            flows = np.full(periods, rng.uniform(5, 50))
+        elif shape == "single":
+            flows = np.zeros(periods)
+        else:
+            flows = rng.choice([0.0, 100.0, -100.0, 250.0], size=periods)
+        flows[0] = -1000
+        values = rng.uniform(0, 2000, size=periods)
+
+        results = model.solve_prefixes(flows, values, irr_solver)
+
+        methods.update(result.method for result in results)
+        expected_results = irr_solver.solve_prefixes(flows, values)
+        assert rounded_rates(results) == rounded_rates(expected_results)
+    assert {"two_period", "power", "annuity", "halley"} <= methods
+
+
+def test_solve_windows_matches_general_solver():
+    """
+    GIVEN random cashflows and values
+    WHEN every trailing window of 12 periods is solved (model.solve_windows())
+    THEN each rate has to be the one of the window built from scratch, opening with the value held at its start,
+         solved by the general solver
+    """
+    rng = np.random.default_rng(11)
+    irr_solver = solver.IrrSolver()
+    flows = rng.choice([0.0, 100.0, -100.0, 250.0], size=40)
+    flows[0] = -1000
+    values = rng.uniform(500, 2000, size=40)
+
+    results = model.solve_windows(flows, values, 12, irr_solver)
+
+    expected_results = []
+    for end in range(12, 40):
+        window = np.concatenate(([-values[end - 12]], flows[end - 11 : end + 1]))
+        window[-1] += values[end]
+        expected_results.append(irr_solver.solve(window))
+    assert rounded_rates(results) == rounded_rates(expected_results)
+
+
+def test_solve_windows_longer_than_cashflows():
+    """
+    GIVEN fewer periods than the window
+    WHEN the trailing windows are solved (model.solve_windows())
+    THEN there has to be no result, and a window that is not positive has to raise a ValueError
+    """
+    assert model.solve_windows(np.array([-1000.0, 100]), np.array([0.0, 1000]), 2) == []
+    with pytest.raises(ValueError):
+        model.solve_windows(np.zeros(3), np.zeros(3), 0)
+
+
+def test_calculate_window_irrs():
+    """
+    GIVEN an entity with monthly cashflows whose value grows by 1% a month
+    WHEN its since-inception and trailing IRRs are calculated (model.calculate_window_irrs())
+    THEN trailing rows have to follow the since-inception ones, with their window and a monthly IRR of 1%
+    """
+    entity = model.Entity("test account")
+    entity.sorted_cashflows = [
+        model.Cashflow(
+            dt.date(2022 + month // 12, month % 12 + 1, 1),
+            inflow,
+            0,
+            value,
+            "test account",
+        )
+        for month, inflow, value in [
+            (month, 1000 if month == 0 else 0, 1000 * 1.01**month) for month in range(6)
+        ]
+    ]
+
+    model.calculate_window_irrs({"test account": entity}, windows=(3,))
+
+    assert [irr.window for irr in entity.irrs] == [None] * 5 + [3] * 3
+    assert [irr.date for irr in entity.irrs[5:]] == [
+        dt.date(2022, 4, 1),
+        dt.date(2022, 5, 1),
+        dt.date(2022, 6, 1),
+    ]
+    assert {irr.value for irr in entity.irrs} == {0.01}
+    assert entity.irrs[5].to_dict()["window"] == 3
+
+    irr_frame = model.IrrFrame.from_entities({"test account": entity})
+    assert irr_frame.to_dicts() == [irr.to_dict() for irr in entity.irrs]
+    assert irr_frame.to_arrow().column("window").to_pylist() == [None] * 5 + [3] * 3
@@ -0,0 +1,43 @@
+from cloud_function import batch, parallel
+from tests.test_batch import irr_rows, random_entities
+import functools
+
+
+def test_balance_chunks():
+    """
+    GIVEN the number of periods of some entities
+    WHEN they are split into chunks (parallel.balance_chunks())
+    THEN every entity has to be assigned once and chunks have to hold similar numbers of periods
+    """
+    period_counts = [10, 1, 7, 3, 5, 5, 2]
+
+    chunks = parallel.balance_chunks(period_counts, 3)
+
+    assert sorted(position for chunk in chunks for position in chunk) == list(range(7))
+    loads = [sum(period_counts[position] for position in chunk) for chunk in chunks]
+    assert max(loads) - min(loads) <= 2
+
+
+def test_balance_chunks_with_more_chunks_than_entities():
+    """
+    GIVEN fewer entities than chunks requested
+    WHEN they are split into chunks (parallel.balance_chunks())
+    THEN empty chunks have to be left out
+    """
+    assert parallel.balance_chunks([4, 2], 3) == [[0], [1]]
+
+
+def test_calculate_irrs_is_deterministic():
+    """
+    GIVEN a collection of random entities
+    WHEN their irrs are calculated in parallel (parallel.calculate_irrs()) with different numbers of workers
+    THEN the results have to be the same as the ones of the batch engine
+    """
+    expected_result = irr_rows(batch.calculate_irrs(random_entities(2, 100)))
+
+    for workers, chunk_periods in [(1, 1_000_000), (2, 1_000_000), (3, 50)]:
+        engine = functools.partial(
+            parallel.calculate_irrs, workers=workers, chunk_periods=chunk_periods
+        )
+
+        assert irr_rows(engine(random_entities(2, 100))) == expected_result
@@ -0,0 +1,436 @@
+from cloud_function import analytics, model, repository
+from cloud_function.repository import BiqQueryRepository
+from google.cloud.bigquery.table import Row
+import datetime as dt
+import math
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.parquet as pq
+import pytest
+import sys
+
+FIELDS = {"date": 0, "inflow": 1, "outflow": 2, "value": 3, "entity_name": 4}
+ROWS = [
+    (dt.date(2022, 2, 1), 0.0, 100.0, 1000.0, "Test Account 1"),
+    (dt.date(2022, 1, 1), 1000.0, 0.0, 0.0, "Test Account 1"),
+    (None, 1000.0, 0.0, None, "Test Account 2"),
+]
+
+
+class StubRowIterator:
+    def __init__(self, rows):
+        self.rows = rows
+        self.to_arrow_calls = []
+
+    def __iter__(self):
+        return iter(Row(row, FIELDS) for row in self.rows)
+
+    def to_arrow(self, create_bqstorage_client=True):
+        self.to_arrow_calls.append(create_bqstorage_client)
+        columns = list(zip(*self.rows))
+        return pa.table(
+            {
+                "date": pa.array(columns[0], type=pa.date32()),
+                "inflow": pa.array(columns[1], type=pa.float64()),
+                "outflow": pa.array(columns[2], type=pa.float64()),
+                "value": pa.array(columns[3], type=pa.float64()),
+                "entity_name": pa.array(columns[4], type=pa.string()),
+            }
+        )
+
+
+class StubJob:
+    def __init__(self, result=None):
+        self.rows = result
+
+    def result(self, **kwargs):
+        return self.rows
+
+
+class StubClient:
+    """
+    A stand in for bigquery.Client which records the queries run and answers them with recorded rows.
+    """
+
+    def __init__(self, rows):
+        self.rows = StubRowIterator(rows)
+        self.queries = []
+        self.loads = []
+        self.deleted = []
+
+    def query(self, query, job_config=None):
+        self.queries.append(query)
+        return StubJob(self.rows)
+
+    def load_table_from_file(self, file, destination, job_config=None):
+        self.loads.append((pq.read_table(file), destination, job_config))
+        return StubJob()
+
+    def load_table_from_json(self, data, destination, job_config=None):
+        self.loads.append((data, destination, job_config))
+        return StubJob()
+
+    def delete_table(self, table, not_found_ok=False):
+        self.deleted.append(table)
+
+
+@pytest.fixture
+def stub_repository():
+    """
+    Fixture that returns instance of BiqQueryRepository() using a stub client
+
+    Returns:
+        instance of BiqQueryRepository()
+    """
+    return BiqQueryRepository(client=StubClient(ROWS))
+
+
+def frame_rows(frame):
+    return [
+        (
+            cashflow.date,
+            cashflow.inflow,
+            cashflow.outflow,
+            cashflow.value,
+            cashflow.entity_name,
+        )
+        for cashflow in frame.to_cashflows()
+    ]
+
+
+def test_cashflow_source_selects_used_columns(stub_repository):
+    """
+    GIVEN a BiqQueryRepository
+    WHEN cashflows are retrieved
+    THEN only the five columns used have to be selected
+    """
+    stub_repository.get_cashflow_frame()
+
+    assert stub_repository.client.queries == [
+        "SELECT date, inflow, outflow, value, entity_name FROM dm_accounting.cashflows"
+    ]
+
+
+def test_get_cashflow_frame_from_arrow(stub_repository):
+    """
+    GIVEN a BiqQueryRepository whose query result is an Arrow table
+    WHEN cashflows are retrieved as a frame (BiqQueryRepository.get_cashflow_frame())
+    THEN the frame has to be built from the Arrow table with missing values kept as missing
+    """
+    frame = stub_repository.get_cashflow_frame()
+
+    assert stub_repository.client.rows.to_arrow_calls == [True]
+    assert frame.entity_names == ("Test Account 1", "Test Account 2")
+    assert frame_rows(frame)[:2] == ROWS[:2]
+    assert frame.dates()[2] is None
+    assert math.isnan(frame.value[2])
+
+
+def test_get_cashflow_frame_falls_back_to_rows(stub_repository, monkeypatch):
+    """
+    GIVEN a BiqQueryRepository in an environment without pyarrow
+    WHEN cashflows are retrieved as a frame (BiqQueryRepository.get_cashflow_frame())
+    THEN the frame has to be built from the rows, with the same result as from Arrow
+    """
+    expected_result = frame_rows(stub_repository.get_cashflow_frame())
+    monkeypatch.setattr(repository, "pyarrow", None)
+
+    frame = stub_repository.get_cashflow_frame()
+
+    assert stub_repository.client.rows.to_arrow_calls == [True]
+    assert frame_rows(frame)[:2] == expected_result[:2]
+    assert frame.dates()[2] is None
+
+
+def entities_with_irrs():
+    entity = model.Entity("Test Account 1")
+    entity.irrs = [
+        model.Irr(dt.date(2022, 2, 1), 0.1, "Test Account 1"),
+        model.Irr(dt.date(2022, 3, 1), 0.01, "Test Account 1"),
+    ]
+    return {entity.entity_name: entity}
+
+
+def test_load_irrs_as_parquet(stub_repository):
+    """
+    GIVEN a BiqQueryRepository and entities with calculated irrs
+    WHEN irrs are loaded (BiqQueryRepository.load_irrs())
+    THEN a Parquet file with the irr columns has to be loaded into the destination, truncating it
+    """
+    stub_repository.load_irrs(entities_with_irrs())
+
+    [(table, destination, job_config)] = stub_repository.client.loads
+    assert destination == "publishing.entity_irrs"
+    assert job_config.source_format == "PARQUET"
+    assert job_config.write_disposition == "WRITE_TRUNCATE"
+    assert table.to_pylist() == [
+        {
+            "date": dt.date(2022, 2, 1),
+            "irr_monthly": 0.1,
+            "irr_annual": 2.1384,
+            "entity_name": "Test Account 1",
+        },
+        {
+            "date": dt.date(2022, 3, 1),
+            "irr_monthly": 0.01,
+            "irr_annual": 0.1268,
+            "entity_name": "Test Account 1",
+        },
+    ]
+
+
+def test_load_irrs_falls_back_to_json(stub_repository, monkeypatch):
+    """
+    GIVEN a BiqQueryRepository in an environment without pyarrow
+    WHEN irrs are loaded (BiqQueryRepository.load_irrs())
+    THEN the irrs have to be loaded as newline delimited JSON, as Irr.to_dict() serialises them
+    """
+    monkeypatch.setattr(repository, "pyarrow", None)
+    entities = entities_with_irrs()
+
+    stub_repository.load_irrs(entities)
+
+    [(data, destination, job_config)] = stub_repository.client.loads
+    assert job_config.source_format == "NEWLINE_DELIMITED_JSON"
+    assert data == [irr.to_dict() for irr in entities["Test Account 1"].irrs]
+
+
+def test_upsert_irrs_stages_into_tables_of_their_own(stub_repository):
+    """
+    GIVEN a BiqQueryRepository and entities with calculated irrs
+    WHEN their irrs are upserted twice, as concurrent event-driven runs would (BiqQueryRepository.upsert_irrs())
+    THEN each upsert has to stage into a table of its own, merged into the destination and deleted afterwards
+    """
+    entities = entities_with_irrs()
+
+    stub_repository.upsert_irrs(entities, ["Test Account 1"])
+    stub_repository.upsert_irrs(entities, ["Test Account 1"])
+
+    stagings = [destination for _, destination, _ in stub_repository.client.loads]
+    assert len(set(stagings)) == 2
+    assert all(
+        staging.startswith("publishing.entity_irrs_staging_") for staging in stagings
+    )
+    merges = [query for query in stub_repository.client.queries if "MERGE" in query]
+    assert [staging in merge for staging, merge in zip(stagings, merges)] == [
+        True,
+        True,
+    ]
+    assert stub_repository.client.deleted == stagings
+
+
+@pytest.mark.parametrize("since", [None, {"Test Account 1": dt.date(2022, 3, 1)}])
+def test_upsert_irrs_into_wider_destination(stub_repository, since):
+    """
+    GIVEN a BiqQueryRepository whose destination was widened by a full run with analytics, and entities with
+    calculated irrs but no analytics
+    WHEN their irrs are upserted, from a date onwards or not (BiqQueryRepository.upsert_irrs())
+    THEN the staged columns have to be inserted by name, not by position, into the destination
+    """
+    entity = model.Entity("Test Account 1")
+    for row in ROWS[:2]:
+        entity.add_cashflow(model.Cashflow(*row))
+    engine = analytics.with_analytics(model.calculate_irrs, ("npv", "tvpi"))
+    stub_repository.load_irrs(engine({entity.entity_name: entity}))
+
+    stub_repository.upsert_irrs(entities_with_irrs(), ["Test Account 1"], since)
+
+    names = "`date`, `irr_monthly`, `irr_annual`, `entity_name`"
+    create, alter, upsert = stub_repository.client.queries
+    assert create.startswith("CREATE TABLE IF NOT EXISTS publishing.entity_irrs (")
+    assert alter.startswith("ALTER TABLE publishing.entity_irrs ")
+    assert "SELECT *" not in upsert and "INSERT ROW" not in upsert
+    if since:
+        assert f"INSERT INTO publishing.entity_irrs ({names}) SELECT {names} " in upsert
+    else:
+        values = "S.`date`, S.`irr_monthly`, S.`irr_annual`, S.`entity_name`"
+        assert f"WHEN NOT MATCHED THEN INSERT ({names}) VALUES ({values})" in upsert
+
+
+def test_save_state_without_latest_date(stub_repository):
+    """
+    GIVEN a BiqQueryRepository and the fingerprint of an entity whose cashflows have no date
+    WHEN the state of a delta run is saved (BiqQueryRepository.save_state())
+    THEN its latest date has to be staged as null
+    """
+    stub_repository.save_state(
+        {
+            "Test Account 1": model.Fingerprint(2, dt.date(2022, 2, 1), "1a"),
+            "Test Account 2": model.Fingerprint(1, None, "2b"),
+        },
+        [],
+    )
+
+    [(data, destination, _)] = stub_repository.client.loads
+    assert destination.startswith("publishing.entity_irrs_state_staging_")
+    assert [row["max_date"] for row in data] == ["2022-02-01", None]
+
+
+def test_fingerprints_keep_duplicate_rows():
+    """
+    GIVEN the cashflows of an entity, the same with a pair of duplicate rows added, and the same in another order
+    WHEN their fingerprints are calculated (InMemoryRepository.get_fingerprints())
+    THEN the content hash has to change with the duplicate rows, which must not cancel out, and not with the order
+    """
+    cashflows = [
+        model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "entity 1"),
+        model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, "entity 1"),
+    ]
+    duplicated = cashflows + [cashflows[1]] * 2
+
+    fingerprints = [
+        repository.InMemoryRepository(rows).get_fingerprints()["entity 1"]
+        for rows in (cashflows, duplicated, duplicated[::-1])
+    ]
+
+    assert fingerprints[0].content_hash != fingerprints[1].content_hash
+    assert fingerprints[1] == fingerprints[2]
+
+
+class SchemaStubClient(StubClient):
+    """
+    A stub client which also answers queries of the INFORMATION_SCHEMA columns from the schemas of the tables loaded.
+    """
+
+    def query(self, query, job_config=None):
+        if "INFORMATION_SCHEMA.COLUMNS" not in query:
+            return super().query(query, job_config)
+        self.queries.append(query)
+        tables = job_config.query_parameters[0].values
+        fields = {"table_name": 0, "column_name": 1, "data_type": 2}
+        return StubJob(
+            [
+                Row(
+                    (destination.rsplit(".", 1)[1], field.name, field.field_type),
+                    fields,
+                )
+                for _, destination, config in self.loads
+                if destination.rsplit(".", 1)[1] in tables
+                for field in config.schema
+            ]
+        )
+
+
+def test_merge_shards_keeps_engine_columns():
+    """
+    GIVEN a BiqQueryRepository and shards staged by an engine adding analytics, one of them without irrs
+    WHEN the shards are merged (BiqQueryRepository.merge_shards())
+    THEN every column of the engine has to be inserted into the destination, NULL for the shard without them
+    """
+    stub_repository = BiqQueryRepository(client=SchemaStubClient(ROWS))
+    entity = model.Entity("Test Account 1")
+    for row in ROWS[:2]:
+        entity.add_cashflow(model.Cashflow(*row))
+    engine = analytics.with_analytics(model.calculate_irrs, ("npv", "tvpi"))
+    stub_repository.load_shard_irrs("run", 0, engine({entity.entity_name: entity}))
+    stub_repository.load_shard_irrs("run", 1, {})
+
+    stub_repository.merge_shards("run", 2)
+
+    names = "`date`, `irr_monthly`, `irr_annual`, `npv`, `tvpi`, `entity_name`"
+    create, alter, insert = stub_repository.client.queries[1:]
+    assert "CREATE TABLE IF NOT EXISTS publishing.entity_irrs (`date` DATE" in create
+    assert "ADD COLUMN IF NOT EXISTS `npv` FLOAT64" in alter
+    assert f"INSERT INTO publishing.entity_irrs ({names}) SELECT {names} " in insert
+    assert "CAST(NULL AS FLOAT64) AS `npv`" in insert
+    assert stub_repository.client.deleted == [
+        "publishing.entity_irrs_shard_run_0",
+        "publishing.entity_irrs_shard_run_1",
+    ]
+
+
+@pytest.mark.parametrize("source_format", ["parquet", "csv", "npy"])
+def test_file_repository_reads_cashflows(tmp_path, source_format):
+    """
+    GIVEN cashflows saved as Parquet, as CSV or as NumPy column files
+    WHEN they are read (FileRepository.get_cashflow_frame())
+    THEN the same cashflows have to be returned whatever the format, and only the selected entities when filtered
+    """
+    frame = model.CashflowFrame.from_columns(
+        *zip(*ROWS[:2], (dt.date(2022, 1, 1), 500.0, 0.0, 0.0, "Test Account 2"))
+    )
+    source = tmp_path / f"cashflows.{source_format}"
+    if source_format == "npy":
+        repository.save_cashflow_columns(frame, source)
+    else:
+        table = pa.table(
+            {
+                "date": pa.array(frame.dates(), type=pa.date32()),
+                "inflow": frame.inflow,
+                "outflow": frame.outflow,
+                "value": frame.value,
+                "entity_name": [frame.entity_names[code] for code in frame.entity_code],
+            }
+        )
+        if source_format == "csv":
+            pa.csv.write_csv(table, source)
+        else:
+            pq.write_table(table, source)
+    file_repository = repository.FileRepository(str(source), str(tmp_path / "irrs"))
+
+    assert frame_rows(file_repository.get_cashflow_frame()) == frame_rows(frame)
+    assert frame_rows(file_repository.get_cashflow_frame(["Test Account 2"])) == [
+        (dt.date(2022, 1, 1), 500.0, 0.0, 0.0, "Test Account 2")
+    ]
+    assert [cashflow.entity_name for cashflow in file_repository.iter_cashflows()] == [
+        "Test Account 1",
+        "Test Account 1",
+        "Test Account 2",
+    ]
+
+
+def test_file_repository_memory_maps_columns(tmp_path):
+    """
+    GIVEN cashflows saved as NumPy column files (save_cashflow_columns())
+    WHEN they are read (FileRepository.get_cashflow_frame())
+    THEN the columns have to be memory mapped instead of read into memory
+    """
+    repository.save_cashflow_columns(
+        model.CashflowFrame.from_columns(*zip(*ROWS[:2])), tmp_path
+    )
+
+    frame = repository.FileRepository(str(tmp_path), "").get_cashflow_frame()
+
+    assert isinstance(frame.value, np.memmap)
+    assert frame.entity_names == ("Test Account 1",)
+
+
+def test_file_repository_writes_irrs_as_parquet(tmp_path):
+    """
+    GIVEN a FileRepository and entities with calculated irrs
+    WHEN irrs are loaded (FileRepository.load_irrs())
+    THEN they have to be written to the destination Parquet file
+    """
+    destination = tmp_path / "irrs.parquet"
+
+    repository.FileRepository("", str(destination)).load_irrs(entities_with_irrs())
+
+    assert pq.read_table(destination).to_pylist() == [
+        {
+            "date": dt.date(2022, 2, 1),
+            "irr_monthly": 0.1,
+            "irr_annual": 2.1384,
+            "entity_name": "Test Account 1",
+        },
+        {
+            "date": dt.date(2022, 3, 1),
+            "irr_monthly": 0.01,
+            "irr_annual": 0.1268,
+            "entity_name": "Test Account 1",
+        },
+    ]
+
+
+def test_lazy_module_imports_on_first_use():
+    """
+    GIVEN a module not imported yet
+    WHEN it is wrapped in a LazyModule and one of its attributes is read
+    THEN it has to be imported on that first access only
+    """
+    sys.modules.pop("colorsys", None)
+    colorsys = repository.LazyModule("colorsys")
+
+    assert "colorsys" not in sys.modules
+    assert colorsys.rgb_to_hsv(1, 0, 0) == (0, 1, 1)
+    assert "colorsys" in sys.modules
@@ -0,0 +1,148 @@
+from cloud_function import model, repository, scenarios, services
+import datetime as dt
+import math
+import numpy as np
+import pytest
+
+CASHFLOWS = [
+    model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "test account"),
+    model.Cashflow(dt.date(2022, 2, 1), 0, 100, 1000, "test account"),
+    model.Cashflow(dt.date(2022, 3, 1), 500, 0, 1600, "test account"),
+    model.Cashflow(dt.date(2022, 4, 1), 0, 300, 1400, "test account"),
+    model.Cashflow(dt.date(2022, 1, 1), 2000, 0, 0, "other account"),
+    model.Cashflow(dt.date(2022, 2, 1), 0, 0, 2100, "other account"),
+]
+SPEC = scenarios.ScenarioSpec(
+    scenarios=200,
+    distribution_scale=(0.5, 1.5),
+    max_exit_delay=12,
+    terminal_haircut=(0.0, 0.3),
+    seed=7,
+)
+
+
+def create_entity() -> model.Entity:
+    entity = model.Entity("test account")
+    for cashflow in CASHFLOWS[:4]:
+        entity.add_cashflow(cashflow)
+    return entity
+
+
+def test_shock_cashflows():
+    """
+    GIVEN an entity's cashflows and the shocks of two scenarios
+    WHEN the shocked cashflows are built (scenarios.shock_cashflows())
+    THEN distributions have to be scaled, and the terminal value net of its haircut delayed by the exit delay
+    """
+    matrix = scenarios.shock_cashflows(
+        np.array([1000.0, 0, 500, 0]),
+        np.array([0.0, 100, 0, 300]),
+        np.array([0.0, 1000, 1600, 1400]),
+        np.array([1.0, 2.0]),
+        np.array([0, 2]),
+        np.array([0.0, 0.5]),
+    )
+
+    assert matrix.tolist() == [
+        [-1000, 100, -500, 1700, 0, 0],
+        [-1000, 200, -500, 600, 0, 700],
+    ]
+
+
+def test_evaluate_entity_matches_scalar_solver():
+    """
+    GIVEN an entity and a spec of stressed scenarios
+    WHEN the scenarios are solved together (scenarios.evaluate_entity())
+    THEN the summary has to match the IRR of each scenario solved one at a time (model.solve_cashflows())
+    """
+    entity = create_entity()
+    inflow, outflow, value = entity.cashflow_columns()
+    matrix = scenarios.shock_cashflows(
+        inflow, outflow, value, *SPEC.draw(entity.entity_name)
+    )
+    rates = np.array([model.solve_cashflows(row).rate for row in matrix])
+
+    summary = scenarios.evaluate_entity(entity, SPEC)
+
+    expected = scenarios.ScenarioSummary.from_rates(
+        entity.entity_name, rates, SPEC.percentiles
+    )
+    assert summary.solved == SPEC.scenarios
+    assert summary.to_dict() == pytest.approx(expected.to_dict(), abs=1e-4)
+    assert summary.percentiles[5] < summary.percentiles[50] < summary.percentiles[95]
+
+
+def test_evaluate_entity_does_not_depend_on_chunk_size():
+    """
+    GIVEN an entity and a spec of stressed scenarios
+    WHEN the scenarios are solved in chunks of one scenario or all at once (scenarios.evaluate_entity())
+    THEN the summaries have to be the same
+    """
+    entity = create_entity()
+
+    chunked = scenarios.evaluate_entity(entity, SPEC, chunk_cells=1)
+    whole = scenarios.evaluate_entity(entity, SPEC)
+
+    assert chunked.to_dict() == whole.to_dict()
+
+
+def test_evaluate_entity_without_scenario_irr():
+    """
+    GIVEN an entity with a single cashflow
+    WHEN its scenarios are evaluated (scenarios.evaluate_entity())
+    THEN no scenario has to be solved, and the statistics have to be nan
+    """
+    entity = model.Entity("test account")
+    entity.add_cashflow(CASHFLOWS[0])
+
+    summary = scenarios.evaluate_entity(entity, SPEC)
+
+    assert summary.solved == 0
+    assert math.isnan(summary.mean)
+    assert math.isnan(summary.percentiles[50])
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [{"scenarios": 0}, {"max_exit_delay": -1}, {"terminal_haircut": (0.5, 1.5)}],
+)
+def test_scenario_spec_rejects_invalid_bounds(arguments):
+    """
+    GIVEN invalid scenario bounds
+    WHEN a spec is created (scenarios.ScenarioSpec())
+    THEN a ValueError has to be raised
+    """
+    with pytest.raises(ValueError):
+        scenarios.ScenarioSpec(**arguments)
+
+
+def test_scenario_pipeline():
+    """
+    GIVEN an in-memory repository with cashflows
+    WHEN the scenario pipeline is run without shocks (services.scenario_pipeline())
+    THEN every entity has to be summarised, in order of entity names, with the IRR of its unshocked cashflows
+    """
+    in_memory = repository.InMemoryRepository(CASHFLOWS)
+    rate = model.solve_cashflows(np.array([-1000.0, 100, -500, 1700])).rate
+    expected = round((1 + rate) ** 12 - 1, 4)
+
+    summaries = services.scenario_pipeline(
+        in_memory, scenarios.ScenarioSpec(scenarios=10, percentiles=(50,))
+    )
+
+    assert [summary.to_dict() for summary in summaries] == [
+        {
+            "entity_name": "other account",
+            "scenarios": 10,
+            "solved": 10,
+            "mean": round(1.05**12 - 1, 4),
+            "p50": round(1.05**12 - 1, 4),
+        },
+        {
+            "entity_name": "test account",
+            "scenarios": 10,
+            "solved": 10,
+            "mean": expected,
+            "p50": expected,
+        },
+    ]
@@ -1,7 +1,10 @@
 import os
-from cloud_function import services
+from cloud_function import model, services
+from cloud_function.repository import InMemoryRepository
 from google.cloud.bigquery.table import Row
 import datetime as dt
+import logging
+import tracemalloc
 
 
 def test_irr_pipeline(repository_with_cashflows):
@@ -40,3 +43,175 @@ def test_irr_pipeline(repository_with_cashflows):
 
     for result, expected_result in zip(results, expected_results):
         assert result == expected_result
+
+
+def irr_rows(irrs):
+    return sorted((irr.entity_name, irr.date, irr.value) for irr in irrs)
+
+
+def test_irr_pipeline_in_memory(memory_repository):
+    """
+    GIVEN some cashflows on an in memory repository
+    WHEN they are processed by irr_pipeline() service
+    THEN the expected irrs have to be loaded into the repository
+    """
+    services.irr_pipeline(memory_repository)
+
+    assert irr_rows(memory_repository.irrs) == [
+        ("Test Account 1", dt.date(2022, 2, 1), 0.1),
+        ("Test Account 1", dt.date(2022, 3, 1), 0.1),
+        ("Test Account 1", dt.date(2022, 4, 1), 0.1),
+        ("Test Account 1", dt.date(2022, 5, 1), 0.1),
+        ("Test Account 2", dt.date(2022, 4, 1), 0.1),
+    ]
+
+
+def test_irr_pipeline_logs_ingestion_issues(caplog):
+    """
+    GIVEN an in memory repository with a cashflow without date
+    WHEN it is processed by irr_pipeline() service
+    THEN the ingestion issue has to be logged as a warning by the services logger
+    """
+    repository = InMemoryRepository(
+        [
+            model.Cashflow(dt.date(2022, 1, 1), 1000, 0, 0, "test account"),
+            model.Cashflow(None, 0, 100, 1000, "test account"),
+        ]
+    )
+
+    with caplog.at_level(logging.WARNING):
+        services.irr_pipeline(repository)
+
+    [record] = [record for record in caplog.records if record.name.endswith("services")]
+    assert record.levelno == logging.WARNING
+    assert record.getMessage().startswith("Ingestion issue ")
+
+
+def test_delta_irr_pipeline(memory_repository):
+    """
+    GIVEN an in memory repository processed by delta_irr_pipeline() service
+    WHEN cashflows of one entity change, another entity is removed and delta_irr_pipeline() runs again
+    THEN only the changed entities have to be retrieved and their irrs replaced, and the state updated
+    """
+    services.delta_irr_pipeline(memory_repository)
+    first_state = memory_repository.get_state()
+    untouched = [
+        irr for irr in memory_repository.irrs if irr.entity_name == "Test Account 1"
+    ]
+    memory_repository.cashflows = [
+        cashflow
+        for cashflow in memory_repository.cashflows
+        if cashflow.entity_name == "Test Account 1"
+    ] + [
+        model.Cashflow(dt.date(2022, 3, 1), 1000, 0, 1000, "Test Account 3"),
+        model.Cashflow(dt.date(2022, 4, 1), 0, 0, 1210, "Test Account 3"),
+    ]
+    requested = []
+    get_cashflows = memory_repository.get_cashflows
+    memory_repository.get_cashflows = lambda entity_names=None: (
+        requested.append(entity_names) or get_cashflows(entity_names)
+    )
+
+    services.delta_irr_pipeline(memory_repository)
+
+    assert requested == [None, ["Test Account 3"]]
+    assert [
+        irr for irr in memory_repository.irrs if irr.entity_name == "Test Account 1"
+    ] == untouched
+    assert irr_rows(memory_repository.irrs)[-1] == (
+        "Test Account 3",
+        dt.date(2022, 4, 1),
+        0.21,
+    )
+    assert "Test Account 2" not in [irr.entity_name for irr in memory_repository.irrs]
+    assert set(memory_repository.get_state()) == {"Test Account 1", "Test Account 3"}
+    assert (
+        memory_repository.get_state()["Test Account 1"] == first_state["Test Account 1"]
+    )
+
+
+def test_delta_irr_pipeline_without_changes(memory_repository):
+    """
+    GIVEN an in memory repository processed by delta_irr_pipeline() service
+    WHEN delta_irr_pipeline() runs again without changes in the cashflows
+    THEN only the fingerprints have to be calculated and irrs have to stay the same
+    """
+    services.delta_irr_pipeline(memory_repository)
+    irrs = list(memory_repository.irrs)
+    requested = []
+    get_cashflows = memory_repository.get_cashflows
+    memory_repository.get_cashflows = lambda entity_names=None: (
+        requested.append(entity_names) or get_cashflows(entity_names)
+    )
+
+    services.delta_irr_pipeline(memory_repository)
+
+    assert requested == [None]
+    assert memory_repository.irrs == irrs
+
+
+class GeneratedRepository(InMemoryRepository):
+    """
+    An in memory repository which generates ordered cashflows on the fly and only counts the irrs loaded, so that
+    it holds nothing in memory itself.
+    """
+
+    def __init__(self, entities: int, periods: int):
+        super().__init__()
+        self.entities = entities
+        self.periods = periods
+        self.irr_count = 0
+        self.batch_sizes = set()
+
+    def iter_cashflows(self):
+        for entity in range(self.entities):
+            entity_name = f"entity {entity:08d}"
+            yield model.Cashflow(dt.date(2000, 1, 1), 1000, 0, 0, entity_name)
+            for period in range(1, self.periods):
+                yield model.Cashflow(
+                    dt.date(2000 + period, 1, 1), 0, 10, 1000 + period, entity_name
+                )
+
+    def load_irrs_batches(self, batches):
+        for irrs in batches:
+            self.irr_count += len(irrs)
+            self.batch_sizes.add(len(irrs))
+
+
+def test_streaming_irr_pipeline(memory_repository):
+    """
+    GIVEN some cashflows on an in memory repository
+    WHEN they are processed by streaming_irr_pipeline() service with small batches
+    THEN the irrs loaded have to be the same as the ones of irr_pipeline()
+    """
+    services.irr_pipeline(memory_repository)
+    expected_result = irr_rows(memory_repository.irrs)
+    memory_repository.irrs = []
+
+    services.streaming_irr_pipeline(memory_repository, batch_size=2)
+
+    assert irr_rows(memory_repository.irrs) == expected_result
+
+
+def peak_memory(entities: int, periods: int) -> int:
+    repository = GeneratedRepository(entities, periods)
+    tracemalloc.start()
+    services.streaming_irr_pipeline(repository, batch_size=100)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert repository.irr_count == entities * (periods - 1)
+    assert max(repository.batch_sizes) == 100
+
+    return peak
+
+
+def test_streaming_irr_pipeline_memory_is_flat():
+    """
+    GIVEN a repository generating cashflows for a growing number of entities
+    WHEN they are processed by streaming_irr_pipeline() service
+    THEN the peak memory used has to stay flat as the number of cashflows grows tenfold
+    """
+    small = peak_memory(100, 6)
+    large = peak_memory(1000, 6)
+
+    assert large < 1.5 * small
@@ -0,0 +1,126 @@
+from cloud_function import services, sharding
+from cloud_function.repository import InMemoryRepository
+from tests.test_batch import random_entities
+import math
+import pytest
+
+
+def random_repository() -> InMemoryRepository:
+    return InMemoryRepository(
+        [
+            cashflow
+            for entity in random_entities(3, 40).values()
+            for cashflow in entity.sorted_cashflows
+        ]
+    )
+
+
+def irr_rows(irrs: list) -> list[tuple]:
+    return sorted(
+        (irr.entity_name, irr.date, None if math.isnan(irr.value) else irr.value)
+        for irr in irrs
+    )
+
+
+@pytest.mark.parametrize("strategy", ["hash", "balanced"])
+def test_plan_shards(strategy):
+    """
+    GIVEN the number of rows of some entities
+    WHEN they are split into shards (sharding.plan_shards())
+    THEN there has to be one spec per shard and every entity has to be assigned to exactly one shard
+    """
+    row_counts = {f"entity {number}": number % 7 + 1 for number in range(30)}
+
+    specs = sharding.plan_shards(row_counts, 4, strategy, "run")
+
+    assert [spec.shard for spec in specs] == [0, 1, 2, 3]
+    assert sorted(name for spec in specs for name in spec.entity_names) == sorted(
+        row_counts
+    )
+    if strategy == "balanced":
+        loads = [sum(row_counts[name] for name in spec.entity_names) for spec in specs]
+        assert max(loads) - min(loads) <= 7
+
+
+def test_hash_shards_are_stable():
+    """
+    GIVEN an entity name
+    WHEN its shard is calculated by hash (sharding.shard_of())
+    THEN the same shard has to be returned every time, whatever other entities exist
+    """
+    specs = sharding.plan_shards({"a": 1, "b": 1, "c": 1}, 5, "hash", "run")
+
+    assert "b" in specs[sharding.shard_of("b", 5)].entity_names
+
+
+def test_decode_event():
+    """
+    GIVEN a shard message wrapped as a Pub/Sub event, and the event sent by the scheduler
+    WHEN they are decoded (sharding.decode_event())
+    THEN the shard spec has to be read back from the first one and no message from the second one
+    """
+    spec = sharding.ShardSpec("run", 1, 3, ("a", "b"))
+
+    message = sharding.decode_event(sharding.encode_event(spec.to_message()))
+
+    assert sharding.ShardSpec.from_message(message) == spec
+    assert sharding.decode_event({"data": "VHJpZ2dlciBDbG91ZCBGdW5jdGlvbg=="}) is None
+    assert sharding.decode_event({}) is None
+
+
+@pytest.mark.parametrize("strategy", ["hash", "balanced"])
+def test_sharded_irr_pipeline(strategy):
+    """
+    GIVEN a repository with random cashflows and an in-process queue standing in for Pub/Sub
+    WHEN a sharded run is coordinated and its messages delivered (services.sharded_irr_pipeline())
+    THEN each shard has to fetch only its entities, a single merge has to be published, and the irrs have to be the
+        same as the ones of a single invocation
+    """
+    expected_repository = random_repository()
+    services.irr_pipeline(expected_repository)
+    repository = random_repository()
+    queue = sharding.InProcessQueue()
+
+    specs = services.sharded_irr_pipeline(
+        repository, queue.publish, 3, strategy, "scheduled/1"
+    )
+    fetched = []
+    get_cashflow_frame = repository.get_cashflow_frame
+    repository.get_cashflow_frame = lambda entity_names=None: (
+        fetched.append(entity_names) or get_cashflow_frame(entity_names)
+    )
+    queue.drain(
+        lambda event: services.handle_shard_message(
+            repository, sharding.decode_event(event), queue.publish
+        )
+    )
+
+    assert [message["action"] for message in queue.delivered] == [
+        "shard",
+        "shard",
+        "shard",
+        "merge",
+    ]
+    assert fetched == [list(spec.entity_names) for spec in specs]
+    assert irr_rows(repository.irrs) == irr_rows(expected_repository.irrs)
+    assert repository.staging == {}
+
+
+def test_merge_irr_shards_delivered_again():
+    """
+    GIVEN a sharded run already merged
+    WHEN its merge message is delivered again (services.merge_irr_shards())
+    THEN nothing has to be merged
+    """
+    repository = random_repository()
+    queue = sharding.InProcessQueue()
+    services.sharded_irr_pipeline(repository, queue.publish, 2, "hash", "run")
+    queue.drain(
+        lambda event: services.handle_shard_message(
+            repository, sharding.decode_event(event), queue.publish
+        )
+    )
+    irrs = list(repository.irrs)
+
+    assert not services.merge_irr_shards(repository, "run", 2)
+    assert repository.irrs == irrs
@@ -0,0 +1,163 @@
+from cloud_function import solver
+import numpy as np
+import numpy_financial as npf
+import math
+import pytest
+
+
+@pytest.mark.parametrize(
+    "values, expected_result", [([1, 2, 3], 0), ([-1, 2, -3, 4], 3), ([0, -1, 0, 1], 1)]
+)
+def test_sign_changes(values, expected_result):
+    """
+    GIVEN a cashflow vector
+    WHEN its sign changes are counted (solver.sign_changes())
+    THEN zeros have to be ignored and every change of sign counted
+    """
+    assert solver.sign_changes(np.array(values, dtype=float)) == expected_result
+
+
+def test_root_bounds():
+    """
+    GIVEN a cashflow vector with several sign changes
+    WHEN its IRRs are bounded on each side of zero (solver.root_bounds())
+    THEN the sign changes of the running totals in both directions have to be returned
+    """
+    assert solver.root_bounds(np.array([-1000, 2050, -1000], dtype=float)) == (1, 1)
+
+
+def test_solve_keeps_closest_to_zero_root():
+    """
+    GIVEN a cashflow vector with an IRR on each side of zero
+    WHEN its IRR is solved (IrrSolver.solve())
+    THEN the IRR closest to zero has to be returned as npf.irr does
+    """
+    values = np.array([-1000, 2050, -1000], dtype=float)
+
+    result = solver.IrrSolver().solve(values)
+
+    assert result.rate == pytest.approx(-0.2)
+    assert result.rate == pytest.approx(npf.irr(values))
+    assert result.method == "brent"
+
+
+def test_npv_derivatives():
+    """
+    GIVEN a cashflow vector and a rate
+    WHEN the NPV and its derivatives are evaluated (solver.npv_derivatives())
+    THEN they have to match npf.npv and its finite differences
+    """
+    values = np.array([-1000, 100, 100, 1100], dtype=float)
+    rate, h = 0.05, 1e-6
+
+    npv, first, second = solver.npv_derivatives(rate, values)
+
+    assert npv == pytest.approx(npf.npv(rate, values))
+    assert first == pytest.approx(
+        (npf.npv(rate + h, values) - npf.npv(rate - h, values)) / (2 * h), rel=1e-6
+    )
+    assert second == pytest.approx(
+        (
+            solver.npv_derivatives(rate + h, values)[1]
+            - solver.npv_derivatives(rate - h, values)[1]
+        )
+        / (2 * h),
+        rel=1e-6,
+    )
+
+
+def test_solve_single_sign_change():
+    """
+    GIVEN a cashflow vector with a single sign change
+    WHEN its IRR is solved (IrrSolver.solve())
+    THEN the unique rate has to be found by the Halley method
+    """
+    result = solver.IrrSolver().solve(np.array([-1000, 1100], dtype=float))
+
+    assert result.rate == pytest.approx(0.1)
+    assert result.converged
+    assert result.method == "halley"
+
+
+def test_solve_without_sign_change():
+    """
+    GIVEN a cashflow vector without sign changes
+    WHEN its IRR is solved (IrrSolver.solve())
+    THEN nan has to be returned as npf.irr does
+    """
+    result = solver.IrrSolver().solve(np.array([-1000, -100], dtype=float))
+
+    assert math.isnan(result.rate)
+    assert result.method == "none"
+
+
+def test_solve_falls_back_to_brent():
+    """
+    GIVEN a solver whose Halley method is not allowed to iterate enough
+    WHEN an IRR is solved (IrrSolver.solve())
+    THEN the Brent bracketing fallback has to find the rate
+    """
+    result = solver.IrrSolver(max_iterations=1).solve(
+        np.array([-1000, 0, 0, 0, 5000], dtype=float), guess=-0.9
+    )
+
+    assert result.method == "brent"
+    assert result.converged
+    assert result.rate == pytest.approx(5**0.25 - 1)
+
+
+def test_solve_rejects_flat_slope_warm_start():
+    """
+    GIVEN a warm start far out where the slope of the NPV vanishes, away from the IRR
+    WHEN an IRR is solved (IrrSolver.solve())
+    THEN the vanishing Halley step must not be taken for convergence, and the IRR found by the fallback
+    """
+    values = np.array([-100, -100, 700], dtype=float)
+
+    result = solver.IrrSolver().solve(values, guess=13.0)
+
+    assert result.converged
+    assert result.rate == pytest.approx(npf.irr(values))
+    assert solver.npv_derivatives(result.rate, values)[0] == pytest.approx(0, abs=1e-9)
+
+
+def test_solve_dated_without_irr():
+    """
+    GIVEN dated cashflows without any IRR, and a guess at the extremum of their NPV
+    WHEN their IRR is solved (IrrSolver.solve_dated())
+    THEN the vanishing Halley step must not be taken for convergence, and nan has to be returned
+    """
+    values = np.array([-100, 250, -160], dtype=float)
+
+    result = solver.IrrSolver().solve_dated(values, np.array([0, 1, 2.0]), guess=0.28)
+
+    assert math.isnan(result.rate)
+    assert not result.converged
+
+
+def test_solve_prefixes_matches_npf_irr():
+    """
+    GIVEN random entity cashflows, including some with several sign changes
+    WHEN every prefix is solved (IrrSolver.solve_prefixes())
+    THEN the rates rounded to 4 decimals have to match npf.irr on the same prefixes
+    """
+    rng = np.random.default_rng(42)
+    irr_solver = solver.IrrSolver()
+    for _ in range(50):
+        periods = int(rng.integers(2, 40))
+        flows = rng.choice(
+            [0.0, 100.0, -100.0, 250.0], size=periods, p=[0.5, 0.3, 0.1, 0.1]
+        )
+        flows[0] = -1000
+        values = 1000 * rng.uniform(0.8, 1.5, size=periods)
+
+        results = irr_solver.solve_prefixes(flows, values)
+
+        for period, result in enumerate(results, start=1):
+            periodic_cashflow = flows[: period + 1].copy()
+            periodic_cashflow[period] += values[period]
+            expected_result = round(npf.irr(periodic_cashflow), 4)
+            if math.isnan(expected_result):
+                assert math.isnan(result.rate)
+            else:
+                assert round(result.rate, 4) == expected_result
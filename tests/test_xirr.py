@@ -0,0 +1,116 @@
+from cloud_function import model, repository, xirr
+import datetime as dt
+import math
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+
+DATES = np.array(
+    ["2008-01-01", "2008-03-01", "2008-10-30", "2009-02-15", "2009-04-01"],
+    dtype="datetime64[D]",
+)
+
+
+@pytest.mark.parametrize(
+    "day_count, expected_result",
+    [
+        ("ACT/365F", [0, 60 / 365, 303 / 365, 411 / 365, 456 / 365]),
+        ("ACT/360", [0, 60 / 360, 303 / 360, 411 / 360, 456 / 360]),
+        ("30E/360", [0, 60 / 360, 299 / 360, 404 / 360, 450 / 360]),
+    ],
+)
+def test_year_fractions(day_count, expected_result):
+    """
+    GIVEN irregular dates
+    WHEN their year fractions are calculated with a day count convention (xirr.year_fractions())
+    THEN the time elapsed since the first date has to be counted as the convention does
+    """
+    assert np.allclose(xirr.year_fractions(DATES, day_count), expected_result)
+
+
+def test_year_fractions_unknown_convention():
+    """
+    GIVEN an unknown day count convention
+    WHEN year fractions are calculated with it (xirr.year_fractions())
+    THEN a ValueError has to be raised
+    """
+    with pytest.raises(ValueError):
+        xirr.year_fractions(DATES, "ACT/ACT")
+
+
+def test_solve_prefixes_matches_spreadsheet_xirr():
+    """
+    GIVEN an entity's irregular cashflows, whose last value is distributed in full
+    WHEN the XIRR of every prefix is solved (xirr.solve_prefixes())
+    THEN the last prefix has to give the spreadsheet XIRR of the same cashflows and every prefix a root of its NPV
+    """
+    flows = np.array([-10000.0, 2750, 4250, 3250, 0])
+    values = np.array([0.0, 9000, 6000, 3000, 2750])
+    times = xirr.year_fractions(DATES)
+
+    results = xirr.solve_prefixes(flows, values, times)
+
+    assert len(results) == 4
+    assert results[-1].rate == pytest.approx(0.373362535, abs=1e-8)
+    for period, result in enumerate(results, start=1):
+        dated_cashflow = flows[: period + 1].copy()
+        dated_cashflow[period] += values[period]
+        npv = (dated_cashflow * (1 + result.rate) ** -times[: period + 1]).sum()
+        assert npv == pytest.approx(0, abs=1e-6)
+
+
+def test_calculate_irrs_writes_day_count(tmp_path):
+    """
+    GIVEN an entity with cashflows a year apart and an entity with a single cashflow
+    WHEN their XIRRs are calculated (xirr.calculate_irrs()) and written to a Parquet file
+    THEN the annual rate has to be the one solved, the monthly rate its equivalent, and a day_count column added
+    """
+    cashflows = [
+        model.Cashflow(dt.date(2021, 1, 1), 1000, 0, 0, "test account"),
+        model.Cashflow(dt.date(2022, 1, 1), 0, 0, 1100, "test account"),
+        model.Cashflow(dt.date(2021, 1, 1), 1000, 0, 0, "single account"),
+    ]
+    entities = model.ingest_cashflows(model.CashflowFrame.from_cashflows(cashflows))[0]
+    destination = tmp_path / "irrs.parquet"
+
+    xirr.calculate_irrs(entities)
+    repository.FileRepository("", str(destination)).load_irrs(entities)
+
+    assert entities["single account"].irrs == []
+    [irr] = entities["test account"].irrs
+    assert irr.to_dict() == {
+        "date": "2022-01-01",
+        "irr_monthly": round(1.1 ** (1 / 12) - 1, 4),
+        "irr_annual": 0.1,
+        "entity_name": "test account",
+        "day_count": "ACT/365F",
+    }
+    assert pq.read_table(destination).to_pylist() == [
+        {**irr.to_dict(), "date": dt.date(2022, 1, 1)}
+    ]
+
+
+def test_calculate_irrs_monthly_dates_match_periodic_irr():
+    """
+    GIVEN cashflows at evenly spaced months, counted with the 30E/360 convention
+    WHEN their XIRRs are calculated (xirr.calculate_irrs())
+    THEN the monthly rates have to equal the periodic IRRs of model.calculate_irrs()
+    """
+    cashflows = [
+        model.Cashflow(dt.date(2022, month, 1), inflow, outflow, value, "account")
+        for month, inflow, outflow, value in [
+            (1, 1000, 0, 0),
+            (2, 0, 100, 1000),
+            (3, 500, 0, 1600),
+            (4, 0, 100, 1600),
+        ]
+    ]
+    frame = model.CashflowFrame.from_cashflows(cashflows)
+
+    dated = xirr.calculate_irrs(model.ingest_cashflows(frame)[0], "30E/360")
+    periodic = model.calculate_irrs(model.ingest_cashflows(frame)[0])
+
+    assert [irr.value for irr in dated["account"].irrs] == [
+        irr.value for irr in periodic["account"].irrs
+    ]
+    assert not any(math.isnan(irr.value) for irr in dated["account"].irrs)
@@ -24,4 +24,70 @@ variable "function_entry_point" {
 variable "service_account_name" {
   type        = string
   description = "Name of the Service Account"
-}
\ No newline at end of file
+}
+
+variable "pipeline_mode" {
+  type        = string
+  default     = "full"
+  description = "IRR pipeline mode: 'full' recomputes every entity, 'delta' only the entities whose cashflows changed, 'sharded' fans entities out to several invocations, 'checkpointed' stages batches of entities and resumes failed runs on retry"
+}
+
+variable "shard_count" {
+  type        = number
+  default     = 8
+  description = "Number of shards of a sharded run"
+}
+
+variable "max_instances" {
+  type        = number
+  default     = 1
+  description = "Maximum number of concurrent Cloud Function instances, raise it to run the shards of a sharded run in parallel"
+}
+
+variable "day_count" {
+  type        = string
+  default     = ""
+  description = "Day count convention of date-aware IRRs (XIRR) in full runs, e.g. 'ACT/365F', empty for monthly periods"
+}
+
+variable "analytics" {
+  type        = list(string)
+  default     = []
+  description = "Analytics written next to the IRRs in full runs, among 'npv', 'tvpi', 'dpi' and 'moic'"
+}
+
+variable "hurdle_rate" {
+  type        = number
+  default     = 0.08
+  description = "Annual hurdle rate at which the npv analytic is discounted"
+}
+
+variable "windows" {
+  type        = list(number)
+  default     = []
+  description = "Months of the trailing window IRRs written along with the since-inception ones in full runs, e.g. [12, 36, 60]"
+}
+
+variable "hierarchy" {
+  type        = bool
+  default     = false
+  description = "Whether full runs also write the IRRs of the groups of the dm_accounting.entity_hierarchy table, with a level column"
+}
+
+variable "lookup_memory_mb" {
+  type        = number
+  default     = 1024
+  description = "Memory of the lookup function, which holds the IRR index of the destination table"
+}
+
+variable "lookup_check_seconds" {
+  type        = number
+  default     = 60
+  description = "Seconds during which the lookup function answers from its IRR index before checking for a newer run"
+}
+
+variable "checkpoint_entities" {
+  type        = number
+  default     = 10000
+  description = "Number of entities of each batch staged by checkpointed runs"
+}